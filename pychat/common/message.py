@@ -2,21 +2,140 @@
 Message format and serialization for PyChat
 """
 import json
+import os
+import struct
+import sys
+import threading
+import time
 import uuid
 import datetime
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, Iterable, List, Optional, Tuple, Union, TYPE_CHECKING
+
+from pychat.common.utils import from_epoch_micros, intern_string, to_epoch_micros
+
+if TYPE_CHECKING:
+    from pychat.core.user import User
+
+
+# State of the UUIDv7 generator: (unix_ms, counter) of the last ID issued
+_uuid7_lock = threading.Lock()
+_uuid7_last = (0, 0)
+
+
+def uuid7() -> uuid.UUID:
+    """
+    Generate a time-ordered UUID (version 7, RFC 9562)
+    
+    The first 48 bits are the Unix time in milliseconds, followed by a
+    12-bit counter that keeps IDs generated in the same millisecond
+    increasing, so IDs from this process sort in creation order both as
+    strings and as bytes.
+    
+    Returns:
+        A new UUID
+    """
+    global _uuid7_last
+    with _uuid7_lock:
+        now_ms = time.time_ns() // 1_000_000
+        last_ms, counter = _uuid7_last
+        if now_ms > last_ms:
+            # Random start leaves room to count up within the millisecond
+            counter = int.from_bytes(os.urandom(2), 'big') & 0x7FF
+        else:
+            now_ms = last_ms
+            counter += 1
+            if counter > 0xFFF:
+                now_ms += 1
+                counter = 0
+        _uuid7_last = (now_ms, counter)
+    
+    random_bits = int.from_bytes(os.urandom(8), 'big') & ((1 << 62) - 1)
+    value = (now_ms << 80) | (0x7 << 76) | (counter << 64) | (0b10 << 62) | random_bits
+    return uuid.UUID(int=value)
+
+
+# Message ID generators, selectable by name
+MESSAGE_ID_SCHEMES: Dict[str, Callable[[], uuid.UUID]] = {
+    'uuid7': uuid7,
+    'uuid4': uuid.uuid4,
+}
+
+DEFAULT_MESSAGE_ID_SCHEME = 'uuid7'
+
+
+def new_message_id(scheme: Optional[str] = None) -> str:
+    """
+    Generate a message ID
+    
+    Args:
+        scheme: Name of the ID scheme, or None to use the
+            PYCHAT_MESSAGE_ID_SCHEME environment variable (default: uuid7)
+    
+    Returns:
+        The new ID as a canonical UUID string
+    
+    Raises:
+        ValueError: If the scheme name is unknown
+    """
+    name = scheme or os.environ.get('PYCHAT_MESSAGE_ID_SCHEME') or DEFAULT_MESSAGE_ID_SCHEME
+    if name not in MESSAGE_ID_SCHEMES:
+        raise ValueError(f"Unknown message ID scheme '{name}'")
+    return str(MESSAGE_ID_SCHEMES[name]())
+
+
+def encode_message_id(msg_id: str) -> Union[bytes, str]:
+    """
+    Encode a message ID for storage
+    
+    Canonical (lowercase, hyphenated) UUID strings are packed into their
+    16 bytes. Other IDs are returned unchanged so they round-trip exactly.
+    
+    Args:
+        msg_id: The message ID
+    
+    Returns:
+        16 bytes for a canonical UUID, otherwise the ID itself
+    """
+    if (len(msg_id) != 36 or msg_id[8] != '-' or msg_id[13] != '-'
+            or msg_id[18] != '-' or msg_id[23] != '-' or msg_id != msg_id.lower()):
+        return msg_id
+    try:
+        packed = bytes.fromhex(msg_id.replace('-', ''))
+    except ValueError:
+        return msg_id
+    return packed if len(packed) == 16 else msg_id
+
+
+def decode_message_id(value: Union[bytes, str]) -> str:
+    """
+    Decode a stored message ID (see encode_message_id)
+    
+    Args:
+        value: The stored value
+    
+    Returns:
+        The message ID string
+    """
+    if not isinstance(value, bytes):
+        return value
+    h = value.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
 
 
 class Message:
     """
     Represents a chat message in the PyChat application.
     """
+    # Slots keep large in-memory histories compact
+    __slots__ = ('content', 'sender', 'recipient', 'msg_id', '_timestamp', '_timestamp_us')
+    
     def __init__(self, 
                  content: str, 
                  sender: str, 
                  recipient: Optional[str] = None, 
                  msg_id: Optional[str] = None,
-                 timestamp: Optional[datetime.datetime] = None):
+                 timestamp: Optional[datetime.datetime] = None,
+                 timestamp_us: Optional[int] = None):
         """
         Initialize a new message.
         
@@ -24,14 +143,69 @@ class Message:
             content: The text content of the message
             sender: The username of the sender
             recipient: The username of the recipient (None for broadcast)
-            msg_id: A unique identifier for the message (auto-generated if None)
+            msg_id: A unique identifier for the message (time-ordered, generated
+                by new_message_id if None)
             timestamp: The time the message was sent (auto-generated if None)
+            timestamp_us: The send time as stored, in microseconds since the
+                epoch; the datetime is only built when timestamp is read
         """
         self.content = content
-        self.sender = sender
-        self.recipient = recipient  # None means broadcast to all
-        self.msg_id = msg_id if msg_id else str(uuid.uuid4())
-        self.timestamp = timestamp if timestamp else datetime.datetime.now()
+        self.sender = intern_string(sender)
+        self.recipient = intern_string(recipient) if recipient else None  # None means broadcast to all
+        self.msg_id = msg_id if msg_id else new_message_id()
+        self._timestamp_us = timestamp_us
+        if timestamp is None and timestamp_us is None:
+            timestamp = datetime.datetime.now()
+        self._timestamp = timestamp
+    
+    @property
+    def timestamp(self) -> datetime.datetime:
+        """The time the message was sent"""
+        if self._timestamp is None:
+            self._timestamp = from_epoch_micros(self._timestamp_us)
+        return self._timestamp
+    
+    @timestamp.setter
+    def timestamp(self, value: datetime.datetime) -> None:
+        self._timestamp = value
+        self._timestamp_us = None
+    
+    @property
+    def timestamp_us(self) -> int:
+        """The time the message was sent, in microseconds since the epoch"""
+        if self._timestamp_us is None:
+            self._timestamp_us = to_epoch_micros(self._timestamp)
+        return self._timestamp_us
+    
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[Any, str, str, Optional[str], int]]) -> List['Message']:
+        """
+        Build messages from stored rows in bulk
+        
+        Skips __init__ and keeps timestamps in their stored form, so a long
+        history page costs little more than the rows themselves.
+        
+        Args:
+            rows: (msg_id, content, sender, recipient, timestamp_us) tuples,
+                with msg_id as encoded by encode_message_id
+        
+        Returns:
+            List of Message objects in row order
+        """
+        new = cls.__new__
+        intern = sys.intern
+        messages = []
+        append = messages.append
+        for msg_id, content, sender, recipient, timestamp_us in rows:
+            message = new(cls)
+            message.msg_id = decode_message_id(msg_id)
+            message.content = content
+            message.sender = intern(sender)
+            message.recipient = intern(recipient) if recipient else None
+            message._timestamp = None
+            message._timestamp_us = timestamp_us
+            append(message)
+        return messages
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert message to dictionary for serialization"""
@@ -70,3 +244,212 @@ class Message:
         if self.recipient:
             return f"[{time_str}] {self.sender} -> {self.recipient}: {self.content}"
         return f"[{time_str}] {self.sender}: {self.content}"
+
+
+# Binary record of a message: timestamp_us, msg_id kind (1 for a packed UUID),
+# then the byte lengths of msg_id, sender and recipient (0xFFFF for a
+# broadcast). The UTF-8 content fills the rest of the record.
+_RECORD_HEADER = struct.Struct('<qBHHH')
+_NO_RECIPIENT = 0xFFFF
+
+
+def encode_message_record(message: Message) -> bytes:
+    """
+    Encode a message as a compact binary record
+    
+    Args:
+        message: The message to encode
+    
+    Returns:
+        The record bytes
+    """
+    msg_id = encode_message_id(message.msg_id)
+    packed = isinstance(msg_id, bytes)
+    id_bytes = msg_id if packed else msg_id.encode('utf-8')
+    sender = message.sender.encode('utf-8')
+    recipient = message.recipient.encode('utf-8') if message.recipient else b''
+    header = _RECORD_HEADER.pack(
+        message.timestamp_us, 1 if packed else 0, len(id_bytes), len(sender),
+        len(recipient) if message.recipient else _NO_RECIPIENT
+    )
+    return b''.join((header, id_bytes, sender, recipient, message.content.encode('utf-8')))
+
+
+def decode_record_key(buffer: memoryview, offset: int) -> Tuple[int, int, Union[bytes, str]]:
+    """
+    Read the sort key of a binary record without decoding the message
+    
+    Args:
+        buffer: Buffer holding the record
+        offset: Offset of the record in the buffer
+    
+    Returns:
+        (timestamp_us, 1 for a packed UUID else 0, encoded msg_id), the
+        layout of storage_backend.message_key
+    """
+    timestamp_us, packed, id_len, _, _ = _RECORD_HEADER.unpack_from(buffer, offset)
+    start = offset + _RECORD_HEADER.size
+    raw = buffer[start:start + id_len]
+    return (timestamp_us, packed, bytes(raw) if packed else str(raw, 'utf-8'))
+
+
+def decode_message_record(buffer: memoryview, offset: int, length: int) -> Message:
+    """
+    Decode a binary record (see encode_message_record)
+    
+    Strings are decoded straight from the buffer, so records can be read
+    from a memory-mapped file without copying them first.
+    
+    Args:
+        buffer: Buffer holding the record
+        offset: Offset of the record in the buffer
+        length: Length of the record in bytes
+    
+    Returns:
+        The decoded message
+    """
+    timestamp_us, packed, id_len, sender_len, recipient_len = \
+        _RECORD_HEADER.unpack_from(buffer, offset)
+    position = offset + _RECORD_HEADER.size
+    raw_id = buffer[position:position + id_len]
+    position += id_len
+    sender = str(buffer[position:position + sender_len], 'utf-8')
+    position += sender_len
+    recipient = None
+    if recipient_len != _NO_RECIPIENT:
+        recipient = str(buffer[position:position + recipient_len], 'utf-8')
+        position += recipient_len
+    
+    message = Message.__new__(Message)
+    message.msg_id = decode_message_id(bytes(raw_id)) if packed else str(raw_id, 'utf-8')
+    message.content = str(buffer[position:offset + length], 'utf-8')
+    message.sender = sys.intern(sender)
+    message.recipient = sys.intern(recipient) if recipient else None
+    message._timestamp = None
+    message._timestamp_us = timestamp_us
+    return message
+
+
+class MessageCursor:
+    """
+    Position in the message history, given by the (timestamp, msg_id)
+    key of a message. Used for keyset pagination.
+    """
+    def __init__(self, timestamp: datetime.datetime, msg_id: str):
+        """
+        Initialize a cursor
+        
+        Args:
+            timestamp: Timestamp of the message at the cursor position
+            msg_id: ID of the message at the cursor position (tie-breaker)
+        """
+        self.timestamp = timestamp
+        self.msg_id = msg_id
+    
+    @classmethod
+    def from_message(cls, message: Message) -> 'MessageCursor':
+        """Create a cursor positioned at a message"""
+        return cls(message.timestamp, message.msg_id)
+    
+    def to_token(self) -> str:
+        """Convert the cursor to an opaque string token"""
+        return f"{self.timestamp.isoformat()}|{self.msg_id}"
+    
+    @classmethod
+    def from_token(cls, token: str) -> 'MessageCursor':
+        """
+        Create a cursor from a string token
+        
+        Raises:
+            ValueError: If the token is malformed
+        """
+        timestamp, sep, msg_id = token.partition('|')
+        if not sep or not msg_id:
+            raise ValueError(f"Invalid history cursor '{token}'")
+        return cls(datetime.datetime.fromisoformat(timestamp), msg_id)
+    
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, MessageCursor):
+            return NotImplemented
+        return (self.timestamp, self.msg_id) == (other.timestamp, other.msg_id)
+    
+    def __repr__(self) -> str:
+        return f"MessageCursor({self.to_token()!r})"
+
+
+class MessagePage:
+    """
+    A page of message history in chronological order
+    """
+    def __init__(self, messages: List[Message], older: Optional[MessageCursor] = None,
+                 newer: Optional[MessageCursor] = None):
+        """
+        Initialize a page
+        
+        Args:
+            messages: Messages on the page, oldest first
+            older: Cursor to pass as 'before' to fetch the messages preceding
+                this page (None if the page reaches the start of the history)
+            newer: Cursor to pass as 'after' to fetch the messages following
+                this page, including ones sent later (None for an empty history)
+        """
+        self.messages = messages
+        self.older = older
+        self.newer = newer
+    
+    def __len__(self) -> int:
+        return len(self.messages)
+    
+    def __iter__(self):
+        return iter(self.messages)
+
+
+class SearchPage:
+    """
+    A page of search results, best match first
+    """
+    def __init__(self, messages: List[Message], next_cursor: Optional[int] = None):
+        """
+        Initialize a page of search results
+        
+        Args:
+            messages: Matching messages in rank order
+            next_cursor: Cursor to pass to get the next page (None if this
+                is the last page)
+        """
+        self.messages = messages
+        self.next_cursor = next_cursor
+    
+    def __len__(self) -> int:
+        return len(self.messages)
+    
+    def __iter__(self):
+        return iter(self.messages)
+
+
+class ConversationSummary:
+    """
+    Summary of a private conversation as seen by one of its participants
+    """
+    def __init__(self, user: 'User', last_message_time: datetime.datetime,
+                 last_sender: str, last_message_preview: str, message_count: int):
+        """
+        Initialize a conversation summary
+        
+        Args:
+            user: The other participant
+            last_message_time: Timestamp of the latest message
+            last_sender: Username of the sender of the latest message
+            last_message_preview: Beginning of the latest message
+            message_count: Number of messages exchanged
+        """
+        self.user = user
+        self.last_message_time = last_message_time
+        self.last_sender = last_sender
+        self.last_message_preview = last_message_preview
+        self.message_count = message_count
+    
+    def __repr__(self) -> str:
+        return (f"ConversationSummary(user='{self.user.username}', "
+                f"last_message_time={self.last_message_time.isoformat()}, "
+                f"message_count={self.message_count})")
@@ -5,9 +5,11 @@ import os
 import json
 import datetime
 import hashlib
+import math
 import uuid
 import re
-from typing import Any, Dict, List, Optional, TYPE_CHECKING
+import sys
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from pychat.common.message import Message
@@ -56,6 +58,129 @@ def serialize_datetime(obj: Any) -> Any:
     raise TypeError(f"Type {type(obj)} not serializable")
 
 
+# Timestamps are stored as integer microseconds since this instant
+_EPOCH = datetime.datetime(1970, 1, 1)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def to_epoch_micros(timestamp: datetime.datetime) -> int:
+    """
+    Encode a datetime as integer microseconds since 1970-01-01
+    
+    Naive datetimes (the local wall-clock times used throughout PyChat) are
+    encoded as-is, so the conversion is exact and round-trips through
+    from_epoch_micros. Aware datetimes are converted to UTC first.
+    
+    Args:
+        timestamp: The datetime to encode
+    
+    Returns:
+        Microseconds since the epoch
+    """
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return (timestamp - _EPOCH) // _MICROSECOND
+
+
+def from_epoch_micros(micros: int) -> datetime.datetime:
+    """
+    Decode microseconds since 1970-01-01 into a naive datetime
+    
+    Args:
+        micros: Value produced by to_epoch_micros
+    
+    Returns:
+        The decoded datetime
+    """
+    return _EPOCH + datetime.timedelta(microseconds=micros)
+
+
+def intern_string(value: Any) -> Any:
+    """
+    Intern a string that repeats across many objects, such as a username
+    or status, so every object shares a single copy
+    
+    Args:
+        value: The value to intern (non-strings are returned unchanged)
+    
+    Returns:
+        The interned string or the original value
+    """
+    return sys.intern(value) if type(value) is str else value
+
+
+def iter_batches(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """
+    Split an iterable into lists of at most size items, consuming it lazily
+    
+    Args:
+        items: The items to split
+        size: Maximum number of items per batch
+    
+    Yields:
+        Lists of consecutive items
+    """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class BloomFilter:
+    """
+    Compact set of strings that can answer "definitely not present"
+    
+    Membership tests never give false negatives. False positives occur at
+    about the given error rate while no more than capacity keys have been
+    added, and become more frequent beyond that.
+    """
+    __slots__ = ('capacity', 'num_bits', 'num_hashes', 'count', '_bits')
+    
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        """
+        Initialize an empty filter
+        
+        Args:
+            capacity: Number of keys the filter is sized for
+            error_rate: Target false positive rate at capacity
+        """
+        self.capacity = max(1, capacity)
+        self.num_bits = max(8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.num_bits + 7) // 8)
+    
+    def _positions(self, key: str) -> Iterator[int]:
+        """Get the bit positions of a key (double hashing of one digest)"""
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        step = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.num_hashes):
+            yield (first + i * step) % self.num_bits
+    
+    def add(self, key: str) -> None:
+        """
+        Add a key to the filter
+        
+        Args:
+            key: The key to add
+        """
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+    
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(key))
+    
+    def __len__(self) -> int:
+        return self.count
+
+
 def save_json(data: Dict[str, Any], filepath: str) -> None:
     """
     Save data to a JSON file
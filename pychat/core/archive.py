@@ -0,0 +1,193 @@
+"""
+Per-month archive databases for old messages
+"""
+import os
+import sqlite3
+import threading
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pychat.common.utils import ensure_directory, from_epoch_micros
+from pychat.core.migrations import MESSAGE_HISTORY_INDEXES
+
+
+ARCHIVE_PREFIX = "messages-"
+ARCHIVE_SUFFIX = ".db"
+
+# Archived content is compressed unless that does not make it smaller
+ARCHIVE_COMPRESSION_LEVEL = 9
+
+ARCHIVE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS messages (
+        msg_id TEXT PRIMARY KEY,
+        content BLOB NOT NULL,
+        sender TEXT NOT NULL,
+        recipient TEXT,
+        timestamp INTEGER NOT NULL
+    )
+    """,
+    *MESSAGE_HISTORY_INDEXES.values(),
+]
+
+
+def archive_month(timestamp_us: int) -> str:
+    """
+    Get the archive partition of a timestamp
+    
+    Args:
+        timestamp_us: Time in microseconds since the epoch
+    
+    Returns:
+        The month as 'YYYY-MM'
+    """
+    return from_epoch_micros(timestamp_us).strftime('%Y-%m')
+
+
+def compress_content(content: str) -> Any:
+    """
+    Compress message content for the archive
+    
+    Args:
+        content: The message text
+    
+    Returns:
+        zlib-compressed bytes, or the text itself if compression does not help
+    """
+    data = content.encode('utf-8')
+    packed = zlib.compress(data, ARCHIVE_COMPRESSION_LEVEL)
+    return packed if len(packed) < len(data) else content
+
+
+def decompress_content(value: Any) -> str:
+    """
+    Restore archived message content (see compress_content)
+    
+    Args:
+        value: The stored value
+    
+    Returns:
+        The message text
+    """
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode('utf-8')
+    return value
+
+
+class MessageArchive:
+    """
+    A directory of SQLite databases holding archived messages, one per month
+    
+    The archives have the same message columns and history indexes as the
+    main database, so the same keyset queries run against them.
+    """
+    def __init__(self, directory: str, profile: Optional[Any] = None):
+        """
+        Initialize the archive
+        
+        Args:
+            directory: Directory of the archive databases (created on first use)
+            profile: StorageProfile applied to archive connections
+        """
+        self.directory = directory
+        self.profile = profile
+        self._lock = threading.Lock()
+        self._connections: Dict[str, sqlite3.Connection] = {}
+    
+    def _path(self, month: str) -> str:
+        """Get the path of the archive database for a month"""
+        return os.path.join(self.directory, f"{ARCHIVE_PREFIX}{month}{ARCHIVE_SUFFIX}")
+    
+    def months(self) -> List[str]:
+        """
+        Get the months that have an archive database
+        
+        Returns:
+            Sorted list of 'YYYY-MM' strings
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            name[len(ARCHIVE_PREFIX):-len(ARCHIVE_SUFFIX)] for name in os.listdir(self.directory)
+            if name.startswith(ARCHIVE_PREFIX) and name.endswith(ARCHIVE_SUFFIX)
+        )
+    
+    def _connect(self, month: str) -> sqlite3.Connection:
+        """Get the connection to a month's archive, creating the database if needed"""
+        conn = self._connections.get(month)
+        if conn is None:
+            ensure_directory(self.directory)
+            conn = sqlite3.connect(self._path(month), check_same_thread=False)
+            if self.profile is not None:
+                self.profile.apply(conn)
+            with conn:
+                for statement in ARCHIVE_SCHEMA:
+                    conn.execute(statement)
+            self._connections[month] = conn
+        return conn
+    
+    def store(self, rows: Iterable[Tuple[Any, str, str, Optional[str], int]]) -> int:
+        """
+        Copy messages into their month's archive
+        
+        Messages already in the archive are skipped, so an interrupted
+        batch can simply be stored again.
+        
+        Args:
+            rows: (msg_id, content, sender, recipient, timestamp_us) tuples
+        
+        Returns:
+            Number of messages stored
+        """
+        by_month: Dict[str, List[Tuple[Any, ...]]] = {}
+        for msg_id, content, sender, recipient, timestamp_us in rows:
+            by_month.setdefault(archive_month(timestamp_us), []).append(
+                (msg_id, compress_content(content), sender, recipient, timestamp_us)
+            )
+        
+        with self._lock:
+            for month, month_rows in by_month.items():
+                conn = self._connect(month)
+                with conn:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO messages (msg_id, content, sender, recipient, timestamp) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        month_rows
+                    )
+        return sum(len(month_rows) for month_rows in by_month.values())
+    
+    def select(self, month: str, query: str, params: Any = ()) -> List[Tuple[Any, ...]]:
+        """
+        Run a history query against a month's archive
+        
+        Args:
+            month: The archive month
+            query: SQL query selecting (msg_id, content, sender, recipient, timestamp)
+            params: Query parameters
+        
+        Returns:
+            List of row tuples with the content decompressed
+        """
+        with self._lock:
+            rows = self._connect(month).execute(query, params).fetchall()
+        return [(row[0], decompress_content(row[1])) + tuple(row[2:]) for row in rows]
+    
+    def count(self) -> int:
+        """
+        Count the archived messages
+        
+        Returns:
+            Number of messages across all months
+        """
+        with self._lock:
+            return sum(
+                self._connect(month).execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+                for month in self.months()
+            )
+    
+    def close(self) -> None:
+        """Close all archive connections"""
+        with self._lock:
+            for conn in self._connections.values():
+                conn.close()
+            self._connections.clear()
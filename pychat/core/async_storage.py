@@ -0,0 +1,236 @@
+"""
+asyncio facade for PyChat storage backends
+"""
+import asyncio
+import datetime
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar, TYPE_CHECKING
+)
+
+from pychat.common.message import (
+    ConversationSummary, Message, MessageCursor, MessagePage, SearchPage
+)
+from pychat.core.storage import DEFAULT_BACKUP_PAGES, DEFAULT_BACKUP_SLEEP, DEFAULT_READERS
+from pychat.core.storage_backend import StorageBackend
+
+if TYPE_CHECKING:
+    from pychat.core.user import User
+
+
+T = TypeVar('T')
+
+
+class AsyncStorage:
+    """
+    Awaitable versions of the StorageBackend operations
+    
+    Blocking calls run on dedicated threads instead of the event loop.
+    Writes run one at a time on a single writer thread, which matches the
+    single writer connection of Storage. Reads run on a pool of reader
+    threads; Storage hands each thread the reader connection it used last,
+    so every reader thread keeps its own connection and page cache.
+    
+    An operation that is cancelled, or that times out, before its thread
+    picks it up is never run. One that is already running finishes in the
+    background and its result is discarded.
+    """
+    def __init__(self, storage: StorageBackend, readers: int = DEFAULT_READERS,
+                 timeout: Optional[float] = None):
+        """
+        Initialize the facade and its threads
+        
+        Args:
+            storage: The backend to wrap
+            readers: Number of reader threads
+            timeout: Default time limit in seconds for every operation
+                (None for no limit)
+        """
+        self.storage = storage
+        self.timeout = timeout
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pychat-storage-writer")
+        self._readers = ThreadPoolExecutor(max_workers=max(1, readers),
+                                           thread_name_prefix="pychat-storage-reader")
+    
+    async def run(self, func: Callable[..., T], *args: Any, write: bool = False,
+                  timeout: Optional[float] = None, **kwargs: Any) -> T:
+        """
+        Run a blocking function on a storage thread
+        
+        Args:
+            func: The function to run
+            *args: Positional arguments for the function
+            write: Run on the writer thread instead of a reader thread
+            timeout: Time limit in seconds (default: the facade's timeout)
+            **kwargs: Keyword arguments for the function
+        
+        Returns:
+            The function's result
+        
+        Raises:
+            asyncio.TimeoutError: If the time limit is exceeded
+        """
+        loop = asyncio.get_running_loop()
+        executor = self._writer if write else self._readers
+        future = loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+        limit = self.timeout if timeout is None else timeout
+        if limit is None:
+            return await future
+        return await asyncio.wait_for(future, limit)
+    
+    # Messages
+    
+    async def save_message(self, message: Message) -> None:
+        """Save a message (see StorageBackend.save_message)"""
+        await self.run(self.storage.save_message, message, write=True)
+    
+    async def save_messages(self, messages: List[Message]) -> None:
+        """Save a batch of messages atomically (see StorageBackend.save_messages)"""
+        await self.run(self.storage.save_messages, messages, write=True)
+    
+    async def import_messages(self, messages: Iterable[Message], batch_size: int = 1000) -> int:
+        """Save a stream of messages in batches (see StorageBackend.import_messages)"""
+        return await self.run(self.storage.import_messages, messages, batch_size, write=True)
+    
+    async def get_messages(self, limit: int = 100, recipient: Optional[str] = None,
+                           before: Optional[MessageCursor] = None,
+                           after: Optional[MessageCursor] = None) -> List[Message]:
+        """Retrieve messages (see StorageBackend.get_messages)"""
+        return await self.run(self.storage.get_messages, limit, recipient, before, after)
+    
+    async def get_message_page(self, limit: int = 100, recipient: Optional[str] = None,
+                               before: Optional[MessageCursor] = None,
+                               after: Optional[MessageCursor] = None) -> MessagePage:
+        """Retrieve a page of history (see StorageBackend.get_message_page)"""
+        return await self.run(self.storage.get_message_page, limit, recipient, before, after)
+    
+    async def iter_messages(self, batch_size: int = 1000,
+                            recipient: Optional[str] = None) -> AsyncIterator[Message]:
+        """
+        Stream the whole message history, oldest first
+        
+        Each page is awaited on a reader thread (see StorageBackend.iter_messages),
+        so the event loop is never blocked while the history is read.
+        
+        Args:
+            batch_size: Number of messages read per page
+            recipient: Only include broadcasts and private messages to or
+                from this user (None for all messages)
+        
+        Yields:
+            Messages in (timestamp, msg_id) order
+        """
+        after = MessageCursor(datetime.datetime.min, "")
+        while True:
+            page = await self.get_message_page(batch_size, recipient, after=after)
+            for message in page.messages:
+                yield message
+            if len(page) < batch_size:
+                return
+            after = page.newer
+    
+    async def search_messages(self, query: str, username: Optional[str] = None, limit: int = 20,
+                              cursor: Optional[int] = None) -> SearchPage:
+        """Search message content (see StorageBackend.search_messages)"""
+        return await self.run(self.storage.search_messages, query, username, limit, cursor)
+    
+    async def backfill_search_index(self, batch_size: int = 1000) -> int:
+        """Index one batch of old messages (see StorageBackend.backfill_search_index)"""
+        return await self.run(self.storage.backfill_search_index, batch_size, write=True)
+    
+    async def archive_messages(self, batch_size: int = 1000) -> int:
+        """Archive one batch of old messages (see StorageBackend.archive_messages)"""
+        return await self.run(self.storage.archive_messages, batch_size, write=True)
+    
+    # Users
+    
+    async def save_user(self, user: 'User', password_hash: Optional[str] = None,
+                        password_salt: Optional[str] = None, replace: bool = True) -> None:
+        """Save a user (see StorageBackend.save_user)"""
+        await self.run(self.storage.save_user, user, password_hash, password_salt, replace,
+                       write=True)
+    
+    async def update_user(self, user: 'User') -> None:
+        """Update a user's profile (see StorageBackend.update_user)"""
+        await self.run(self.storage.update_user, user, write=True)
+    
+    async def get_user(self, username: str) -> Optional['User']:
+        """Get a user by username (see StorageBackend.get_user)"""
+        return await self.run(self.storage.get_user, username)
+    
+    async def get_users(self, status: Optional[str] = None) -> List['User']:
+        """Get all users (see StorageBackend.get_users)"""
+        return await self.run(self.storage.get_users, status)
+    
+    async def user_exists(self, username: str) -> bool:
+        """Check if a user exists (see StorageBackend.user_exists)"""
+        return await self.run(self.storage.user_exists, username)
+    
+    async def get_users_by_name(self, usernames: Iterable[str]) -> List['User']:
+        """Get several users by username (see StorageBackend.get_users_by_name)"""
+        return await self.run(self.storage.get_users_by_name, list(usernames))
+    
+    async def get_user_auth_data(self, username: str) -> Dict[str, str]:
+        """Get authentication data for a user (see StorageBackend.get_user_auth_data)"""
+        return await self.run(self.storage.get_user_auth_data, username)
+    
+    # Sessions
+    
+    async def create_session(self, username: str, expires_in: int = 86400) -> str:
+        """Create a session (see StorageBackend.create_session)"""
+        return await self.run(self.storage.create_session, username, expires_in, write=True)
+    
+    async def validate_session(self, session_id: str) -> Optional[str]:
+        """Validate a session (see StorageBackend.validate_session)"""
+        return await self.run(self.storage.validate_session, session_id)
+    
+    async def invalidate_session(self, session_id: str) -> None:
+        """Invalidate a session (see StorageBackend.invalidate_session)"""
+        await self.run(self.storage.invalidate_session, session_id, write=True)
+    
+    async def get_active_sessions(self) -> List[Tuple[str, str, int]]:
+        """Get active, unexpired sessions (see StorageBackend.get_active_sessions)"""
+        return await self.run(self.storage.get_active_sessions)
+    
+    async def update_sessions(self, updates: List[Tuple[str, int, bool]]) -> None:
+        """Record session activity in a batch (see StorageBackend.update_sessions)"""
+        await self.run(self.storage.update_sessions, updates, write=True)
+    
+    async def purge_sessions(self, batch_size: int = 1000) -> int:
+        """Delete stale sessions in a batch (see StorageBackend.purge_sessions)"""
+        return await self.run(self.storage.purge_sessions, batch_size, write=True)
+    
+    # Conversations
+    
+    async def get_conversation_summaries(self, username: str) -> List[ConversationSummary]:
+        """Get a user's conversation summaries (see StorageBackend.get_conversation_summaries)"""
+        return await self.run(self.storage.get_conversation_summaries, username)
+    
+    async def get_private_conversations(self, username: str) -> List[Tuple[str, datetime.datetime]]:
+        """Get a user's conversation partners (see StorageBackend.get_private_conversations)"""
+        return await self.run(self.storage.get_private_conversations, username)
+    
+    # Backups (Storage only)
+    
+    async def backup(self, path: str, pages: int = DEFAULT_BACKUP_PAGES,
+                     sleep: float = DEFAULT_BACKUP_SLEEP,
+                     progress: Optional[Callable[[int, int], None]] = None) -> int:
+        """Write a copy of the database to a file (see Storage.backup)"""
+        return await self.run(self.storage.backup, path, pages, sleep, progress, write=True)
+    
+    async def restore(self, path: str) -> None:
+        """Replace the database with a backup (see Storage.restore)"""
+        await self.run(self.storage.restore, path, write=True)
+    
+    def close(self) -> None:
+        """Wait for queued operations, stop the threads and close the backend"""
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        self.storage.close()
+    
+    async def __aenter__(self) -> 'AsyncStorage':
+        return self
+    
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
@@ -5,18 +5,70 @@ import queue
 import threading
 import time
 import datetime
-from typing import Dict, List, Callable, Optional, Set, Tuple
+from typing import Dict, List, Callable, Optional, Sequence, Set, Tuple
 import datetime
 
-from pychat.common.message import Message
+from pychat.common.message import (
+    ConversationSummary, Message, MessageCursor, MessagePage, SearchPage
+)
 from pychat.core.storage import Storage
+from pychat.core.storage_backend import StorageBackend
 from pychat.core.user import UserManager, User
+from pychat.core.write_behind import WriteBehindBuffer
+from pychat.core.maintenance import MaintenanceWorker
+from pychat.core.fanout import FanoutPool, deliver
+from pychat.core.history_cache import HistoryCache
+from pychat.core.session_map import LockStripes, SessionMap
+from pychat.core.session_registry import SessionRegistry
+from pychat.core.timing_wheel import TimingWheel
+
+
+# Group-commit settings for message persistence
+MESSAGE_FLUSH_BATCH = 256       # Messages per transaction
+MESSAGE_FLUSH_INTERVAL = 0.05   # Seconds a message may wait before being committed
+MESSAGE_BUFFER_SIZE = 10000     # Buffered messages before send_message blocks
+MESSAGE_QUEUE_SIZE = 10000      # Undistributed messages before send_message blocks
+MESSAGE_DURABLE_TIMEOUT = 10.0  # Seconds a durable send waits for its commit
+
+# Background indexing of messages saved before full-text search existed
+SEARCH_BACKFILL_BATCH = 2000
+SEARCH_BACKFILL_INTERVAL = 300.0
+
+# Background archiving of messages past the retention period
+RETENTION_BATCH = 500
+RETENTION_INTERVAL = 600.0
+
+# Recent history kept in memory per history view
+HISTORY_CACHE_SIZE = 200
+HISTORY_CACHE_VIEWS = 256
+
+# Seconds between write-backs of session activity and logouts
+SESSION_FLUSH_INTERVAL = 1.0
+
+# Idle sessions are logged out after SESSION_TIMEOUT seconds, checked every
+# SESSION_EXPIRY_TICK seconds, at most SESSION_EXPIRY_BATCH per check
+SESSION_TIMEOUT = 3600
+SESSION_EXPIRY_TICK = 1.0
+SESSION_EXPIRY_BATCH = 1000
+
+# Locks guarding the sessions of a user, shared out by username hash
+SESSION_LOCK_STRIPES = 64
+
+# Delivery of messages to session callbacks
+FANOUT_WORKERS = 8
+SESSION_OUTBOX_SIZE = 1000      # Lag at which the overflow policy applies
+
+# Background deletion of expired and logged-out rows from the sessions table
+SESSION_PURGE_BATCH = 1000
+SESSION_PURGE_INTERVAL = 3600.0
 
 
 class ChatSession:
     """
     Represents a user's active chat session
     """
+    __slots__ = ('user', 'session_id', 'is_active', 'last_activity', 'callbacks')
+    
     def __init__(self, user: User, session_id: str):
         """
         Initialize a chat session
@@ -60,18 +112,63 @@ class ChatManager:
     """
     Central chat manager that handles message distribution and user sessions
     """
-    def __init__(self):
-        """Initialize the chat manager"""
-        self.storage = Storage()
+    def __init__(self, storage: Optional[StorageBackend] = None,
+                 overflow_policy: Optional[str] = None):
+        """
+        Initialize the chat manager
+        
+        Args:
+            storage: Storage backend (default: SQLite Storage in ~/.pychat)
+            overflow_policy: What to do with sessions that fall too far
+                behind (default: PYCHAT_OVERFLOW_POLICY or drop-oldest)
+        
+        Raises:
+            ValueError: If the overflow policy is unknown
+        """
+        self.storage = storage if storage is not None else Storage()
         self.user_manager = UserManager(self.storage)
         
         # Message queue for internal distribution
-        self.message_queue: queue.Queue = queue.Queue()
+        self.message_queue: queue.Queue = queue.Queue(maxsize=MESSAGE_QUEUE_SIZE)
+        
+        # Per-session outboxes drained by a pool of delivery threads
+        self.fanout = FanoutPool(
+            FANOUT_WORKERS,
+            SESSION_OUTBOX_SIZE,
+            policy=overflow_policy,
+            on_overflow=self.logout
+        )
+        
+        # Write-behind buffer that commits messages in batches
+        self.message_writer = WriteBehindBuffer(
+            self._persist_messages,
+            max_batch=MESSAGE_FLUSH_BATCH,
+            flush_interval=MESSAGE_FLUSH_INTERVAL,
+            max_pending=MESSAGE_BUFFER_SIZE,
+            name="message-writer"
+        )
+        
+        # Latest messages of recently requested history views
+        self.history_cache = HistoryCache(HISTORY_CACHE_SIZE, HISTORY_CACHE_VIEWS)
         
         # User sessions
-        self.sessions: Dict[str, ChatSession] = {}
+        self.sessions: SessionMap = SessionMap()
         self.user_sessions: Dict[str, List[str]] = {}  # username -> list of session_ids
         
+        # Serialize session changes per user; see _attach_session
+        self._user_locks = LockStripes(SESSION_LOCK_STRIPES)
+        
+        # Valid session IDs, loaded once and then kept in memory
+        self.session_registry = SessionRegistry(self.storage)
+        self.session_registry.load()
+        
+        # Idle deadlines of the sessions in self.sessions
+        self.session_expiry = TimingWheel(
+            SESSION_EXPIRY_TICK,
+            int(SESSION_TIMEOUT / SESSION_EXPIRY_TICK) + 2,
+            start=time.time()
+        )
+        
         # Start message distribution thread
         self.running = True
         self.distribution_thread = threading.Thread(
@@ -86,6 +183,30 @@ class ChatManager:
             daemon=True
         )
         self.session_cleanup_thread.start()
+        
+        # Start background maintenance jobs
+        self.maintenance = MaintenanceWorker()
+        self.maintenance.add_job(
+            "search-backfill",
+            lambda: self.storage.backfill_search_index(SEARCH_BACKFILL_BATCH),
+            interval=SEARCH_BACKFILL_INTERVAL
+        )
+        self.maintenance.add_job(
+            "retention",
+            lambda: self.storage.archive_messages(RETENTION_BATCH),
+            interval=RETENTION_INTERVAL
+        )
+        self.maintenance.add_job(
+            "session-flush",
+            self.session_registry.flush,
+            interval=SESSION_FLUSH_INTERVAL,
+            busy_interval=SESSION_FLUSH_INTERVAL
+        )
+        self.maintenance.add_job(
+            "session-purge",
+            lambda: self.session_registry.prune() + self.storage.purge_sessions(SESSION_PURGE_BATCH),
+            interval=SESSION_PURGE_INTERVAL
+        )
     
     def register_user(self, username: str, password: str, display_name: Optional[str] = None,
                      email: Optional[str] = None) -> User:
@@ -117,21 +238,38 @@ class ChatManager:
         Returns:
             Tuple of (User, session_id) if login successful, (None, None) otherwise
         """
-        user = self.user_manager.authenticate_user(username, password)
-        if not user:
-            return None, None
+        # Held while the status is set to online, so an overlapping logout
+        # of the user's last session cannot set it back to offline
+        with self._user_locks.for_key(username):
+            user = self.user_manager.authenticate_user(username, password)
+            if not user:
+                return None, None
+            
+            # Create a new session
+            session_id = self.session_registry.create(username)
+            self._attach_session(ChatSession(user, session_id))
         
-        # Create a new session
-        session_id = self.storage.create_session(username)
-        session = ChatSession(user, session_id)
-        self.sessions[session_id] = session
+        return user, session_id
+    
+    def _attach_session(self, session: ChatSession) -> None:
+        """
+        Start tracking a session
         
-        # Add to user sessions
-        if username not in self.user_sessions:
-            self.user_sessions[username] = []
-        self.user_sessions[username].append(session_id)
+        The caller holds the lock of the session's user. The sessions and
+        the online/offline status of a user are only ever changed under
+        that lock, which keeps sessions, user_sessions and the status
+        consistent for each user. The lock is striped, so logins of
+        different users rarely wait for each other. The list in
+        user_sessions is replaced rather than changed in place, so readers
+        can iterate it without a lock.
         
-        return user, session_id
+        Args:
+            session: The new session
+        """
+        username = session.user.username
+        self.sessions[session.session_id] = session
+        self.session_expiry.schedule(session.session_id, session.last_activity + SESSION_TIMEOUT)
+        self.user_sessions[username] = self.user_sessions.get(username, []) + [session.session_id]
     
     def logout(self, session_id: str) -> None:
         """
@@ -140,25 +278,33 @@ class ChatManager:
         Args:
             session_id: The session ID to logout
         """
-        if session_id in self.sessions:
-            session = self.sessions[session_id]
-            username = session.user.username
+        session = self.sessions.get(session_id)
+        if session is None:
+            return
+        username = session.user.username
+        
+        with self._user_locks.for_key(username):
+            # Another thread may have logged the session out meanwhile
+            if self.sessions.pop(session_id, None) is None:
+                return
             
-            # Update user status if this is their last session
-            user_sessions = self.user_sessions.get(username, [])
-            if len(user_sessions) <= 1:
-                self.user_manager.update_user_status(username, 'offline')
+            # Remove from local tracking (see _attach_session)
+            remaining = [s for s in self.user_sessions.get(username, []) if s != session_id]
+            if remaining:
+                self.user_sessions[username] = remaining
+            else:
+                self.user_sessions.pop(username, None)
+            self.session_expiry.cancel(session_id)
+            session.is_active = False
+            self.fanout.remove(session_id)
             
-            # Invalidate session
-            self.storage.invalidate_session(session_id)
+            # Invalidate session (written to storage in the background)
+            self.session_registry.invalidate(session_id)
             
-            # Remove from local tracking
-            del self.sessions[session_id]
-            if username in self.user_sessions:
-                if session_id in self.user_sessions[username]:
-                    self.user_sessions[username].remove(session_id)
-                if not self.user_sessions[username]:
-                    del self.user_sessions[username]
+            # Update user status if this was their last session; a login
+            # of the same user cannot slip in between while the lock is held
+            if not self.user_sessions.get(username):
+                self.user_manager.update_user_status(username, 'offline')
     
     def validate_session(self, session_id: str) -> bool:
         """
@@ -170,27 +316,31 @@ class ChatManager:
         Returns:
             True if session is valid, False otherwise
         """
-        if session_id not in self.sessions:
-            # Check in storage
-            username = self.storage.validate_session(session_id)
+        session = self.sessions.get(session_id)
+        if session is None:
+            # The registry holds every valid session, so this needs no query
+            username = self.session_registry.validate(session_id)
             if not username:
                 return False
             
-            # Session exists in storage but not in memory
+            # Session is valid but was started before this process
             user = self.user_manager.get_user(username)
             if not user:
                 return False
             
-            # Create session in memory
-            session = ChatSession(user, session_id)
-            self.sessions[session_id] = session
-            
-            if username not in self.user_sessions:
-                self.user_sessions[username] = []
-            self.user_sessions[username].append(session_id)
+            # Create session in memory, unless another thread got there first
+            # or logged it out in between
+            with self._user_locks.for_key(username):
+                session = self.sessions.get(session_id)
+                if session is None:
+                    if not self.session_registry.validate(session_id):
+                        return False
+                    session = ChatSession(user, session_id)
+                    self._attach_session(session)
         
         # Update session activity
-        self.sessions[session_id].update_activity()
+        session.update_activity()
+        self.session_registry.touch(session_id)
         return True
     
     def update_user_status(self, session_id: str, status: str) -> Optional[User]:
@@ -204,10 +354,10 @@ class ChatManager:
         Returns:
             Updated User object if successful, None otherwise
         """
-        if session_id not in self.sessions:
+        session = self.sessions.get(session_id)
+        if session is None:
             return None
         
-        session = self.sessions[session_id]
         username = session.user.username
         
         return self.user_manager.update_user_status(username, status)
@@ -226,7 +376,9 @@ class ChatManager:
         if not self.validate_session(session_id):
             return False
         
-        session = self.sessions[session_id]
+        session = self.sessions.get(session_id)
+        if session is None:
+            return False
         session.add_callback(callback)
         return True
     
@@ -238,43 +390,137 @@ class ChatManager:
             session_id: The session ID to unregister the callback from
             callback: Function to remove
         """
-        if session_id in self.sessions:
-            self.sessions[session_id].remove_callback(callback)
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session.remove_callback(callback)
     
-    def send_message(self, message: Message, session_id: Optional[str] = None) -> bool:
+    def send_message(self, message: Message, session_id: Optional[str] = None,
+                     durable: bool = False,
+                     timeout: Optional[float] = MESSAGE_DURABLE_TIMEOUT) -> bool:
         """
         Send a message to the chat
         
         Args:
             message: The message to send
             session_id: Optional session ID for authentication
+            durable: Wait until the message has been committed to storage
+            timeout: Maximum number of seconds a durable send waits for the
+                commit (None waits forever)
             
         Returns:
-            True if message sent successfully, False otherwise
+            True if message sent successfully, False otherwise (for a durable
+            send, also if the commit failed or did not finish in time)
         """
         # Validate session if provided
         if session_id and not self.validate_session(session_id):
             return False
         
+        # Keep cached history current
+        self.history_cache.add(message)
+        
         # Add to message queue for distribution
         self.message_queue.put(message)
         
-        # Save to storage
-        self.storage.save_message(message)
+        # Hand to the write-behind buffer for persistence
+        pending = self.message_writer.submit(message)
+        if durable:
+            return pending.wait(timeout)
         return True
     
-    def get_message_history(self, username: Optional[str] = None, limit: int = 100) -> List[Message]:
+    def flush_messages(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until all sent messages have been committed to storage
+        
+        Args:
+            timeout: Maximum number of seconds to wait (None waits forever)
+        
+        Returns:
+            True if all pending messages were flushed, False on timeout
+        """
+        return self.message_writer.flush(timeout)
+    
+    def get_message_history(self, username: Optional[str] = None, limit: int = 100,
+                            before: Optional[MessageCursor] = None,
+                            after: Optional[MessageCursor] = None) -> List[Message]:
         """
         Get message history
         
         Args:
             username: Username to filter messages for
             limit: Maximum number of messages to retrieve
+            before: Only return messages older than this cursor
+            after: Only return messages newer than this cursor
             
         Returns:
             List of Message objects
         """
-        return self.storage.get_messages(limit, username)
+        if before is not None or after is not None:
+            return self.get_message_page(username, limit, before, after).messages
+        
+        cached = self.history_cache.get(username, limit)
+        if cached is not None:
+            return cached
+        
+        # Make sure messages sent so far are visible to the query
+        load = self.history_cache.begin_load(username)
+        try:
+            self.flush_messages()
+            messages = self.storage.get_messages(limit, username)
+        except Exception:
+            self.history_cache.cancel_load(load)
+            raise
+        self.history_cache.finish_load(load, messages, limit, exhaustive=len(messages) < limit)
+        return messages
+    
+    def get_message_page(self, username: Optional[str] = None, limit: int = 100,
+                         before: Optional[MessageCursor] = None,
+                         after: Optional[MessageCursor] = None) -> MessagePage:
+        """
+        Get a page of message history with continuation cursors
+        
+        Args:
+            username: Username to filter messages for
+            limit: Maximum number of messages on the page
+            before: Cursor the page must end before (page backwards)
+            after: Cursor the page must start after (page forwards)
+        
+        Returns:
+            MessagePage in chronological order
+        """
+        if before is not None or after is not None:
+            self.flush_messages()
+            return self.storage.get_message_page(limit, username, before, after)
+        
+        cached = self.history_cache.get_page(username, limit)
+        if cached is not None:
+            return cached
+        
+        load = self.history_cache.begin_load(username)
+        try:
+            self.flush_messages()
+            page = self.storage.get_message_page(limit, username)
+        except Exception:
+            self.history_cache.cancel_load(load)
+            raise
+        self.history_cache.finish_load(load, page.messages, limit, exhaustive=page.older is None)
+        return page
+    
+    def search_messages(self, query: str, username: Optional[str] = None,
+                        cursor: Optional[int] = None, limit: int = 20) -> SearchPage:
+        """
+        Search message history, best matches first
+        
+        Args:
+            query: Words to search for
+            username: Only include messages this user may see (None for all)
+            cursor: Cursor returned with the previous page of results
+            limit: Maximum number of results on the page
+        
+        Returns:
+            SearchPage of matching messages
+        """
+        self.flush_messages()
+        return self.storage.search_messages(query, username, limit, cursor)
     
     def get_conversations(self, username: str) -> List[Tuple[User, datetime.datetime]]:
         """
@@ -286,15 +532,27 @@ class ChatManager:
         Returns:
             List of tuples (User, last_message_time)
         """
-        conversations = self.storage.get_private_conversations(username)
-        result = []
+        return [(summary.user, summary.last_message_time)
+                for summary in self.get_conversation_summaries(username)]
+    
+    def get_conversation_summaries(self, username: str) -> List[ConversationSummary]:
+        """
+        Get summaries of a user's private conversations, most recent first
+        
+        Args:
+            username: The username to get conversations for
+        
+        Returns:
+            List of ConversationSummary objects
+        """
+        self.flush_messages()
+        summaries = self.storage.get_conversation_summaries(username)
         
-        for other_username, last_time in conversations:
-            user = self.user_manager.get_user(other_username)
-            if user:
-                result.append((user, last_time))
+        # Use the shared instance of each user
+        for summary in summaries:
+            summary.user = self.user_manager.intern_user(summary.user)
         
-        return result
+        return summaries
     
     def get_user(self, username: str) -> Optional[User]:
         """
@@ -326,6 +584,24 @@ class ChatManager:
         """
         return self.user_manager.get_all_users()
     
+    def _persist_messages(self, messages: List[Message]) -> None:
+        """
+        Write a batch of messages to storage
+        Called from the message writer thread
+        
+        The messages were added to the history cache when they were sent;
+        if they cannot be saved they are discarded from it again, so the
+        cache never serves a message that storage does not have.
+        
+        Args:
+            messages: The messages to save
+        """
+        try:
+            self.storage.save_messages(messages)
+        except Exception:
+            self.history_cache.discard(messages)
+            raise
+    
     def _message_distribution_loop(self) -> None:
         """
         Internal message distribution loop
@@ -336,8 +612,8 @@ class ChatManager:
                 # Get message from queue (with timeout to allow clean shutdown)
                 message = self.message_queue.get(timeout=0.5)
                 
-                # Distribute message to appropriate callbacks
-                self._distribute_message(message)
+                # Queue the message for each session's delivery thread
+                self.fanout.publish(message, self._target_sessions(message))
                 
                 # Mark as done
                 self.message_queue.task_done()
@@ -347,74 +623,92 @@ class ChatManager:
             except Exception as e:
                 print(f"Error in message distribution: {e}")
     
-    def _distribute_message(self, message: Message) -> None:
+    def _target_sessions(self, message: Message) -> Sequence[ChatSession]:
         """
-        Distribute a message to appropriate callbacks
+        Get the sessions a message must be delivered to
         
         Args:
-            message: The message to distribute
+            message: The message
+        
+        Returns:
+            The sessions of the recipient and sender of a private message,
+            or every session for a broadcast
         """
         # If message has a specific recipient, only send to that recipient and sender
         if message.recipient:
-            # Send to recipient's sessions
-            recipient_sessions = self.user_sessions.get(message.recipient, [])
-            for session_id in recipient_sessions:
-                if session_id in self.sessions:
-                    session = self.sessions[session_id]
-                    for callback in session.callbacks:
-                        try:
-                            callback(message)
-                        except Exception as e:
-                            print(f"Error delivering message to {message.recipient}: {e}")
-            
-            # Send to sender's sessions
-            sender_sessions = self.user_sessions.get(message.sender, [])
-            for session_id in sender_sessions:
-                if session_id in self.sessions:
-                    session = self.sessions[session_id]
-                    for callback in session.callbacks:
-                        try:
-                            callback(message)
-                        except Exception as e:
-                            print(f"Error delivering message to {message.sender}: {e}")
-        
-        # If broadcast message, send to all active sessions
-        else:
-            for session_id, session in self.sessions.items():
-                for callback in session.callbacks:
-                    try:
-                        callback(message)
-                    except Exception as e:
-                        print(f"Error delivering message to {session.user.username}: {e}")
+            targets = []
+            for username in (message.recipient, message.sender):
+                for session_id in self.user_sessions.get(username, []):
+                    session = self.sessions.get(session_id)
+                    if session is not None and session not in targets:
+                        targets.append(session)
+            return targets
+        
+        # If broadcast message, send to all active sessions (a shared copy,
+        # so sessions can come and go while it is delivered)
+        return self.sessions.snapshot()
+    
+    def _distribute_message(self, message: Message) -> None:
+        """
+        Deliver a message to the appropriate callbacks on the calling thread
+        
+        The distribution thread hands messages to the fan-out pool instead;
+        this is the synchronous equivalent.
+        
+        Args:
+            message: The message to distribute
+        """
+        for session in self._target_sessions(message):
+            deliver(session, message)
+    
+    def expire_sessions(self, now: Optional[float] = None) -> int:
+        """
+        Log out sessions that have been idle for SESSION_TIMEOUT seconds
+        
+        Only sessions whose deadline has come up on the expiry wheel are
+        looked at. Activity does not reschedule a session; a session that
+        turns out to have been active since is scheduled again from its
+        last activity instead. At most SESSION_EXPIRY_BATCH sessions are
+        logged out per call, the rest on the next tick.
+        
+        Args:
+            now: Current time (default: time.time())
+        
+        Returns:
+            Number of sessions logged out
+        """
+        if now is None:
+            now = time.time()
+        
+        expired = []
+        for session_id in self.session_expiry.advance(now):
+            session = self.sessions.get(session_id)
+            if session is None:
+                continue
+            deadline = session.last_activity + SESSION_TIMEOUT
+            if deadline <= now and len(expired) < SESSION_EXPIRY_BATCH:
+                expired.append(session_id)
+            else:
+                self.session_expiry.schedule(session_id, deadline)
+        
+        for session_id in expired:
+            self.logout(session_id)
+        return len(expired)
     
     def _session_cleanup_loop(self) -> None:
         """
         Session cleanup loop
         Runs in a separate thread
-        Removes inactive sessions
+        Logs out idle sessions as their deadlines come up
         """
-        SESSION_TIMEOUT = 3600  # 1 hour
-        
         while self.running:
             try:
-                current_time = time.time()
-                to_remove = []
-                
-                # Find inactive sessions
-                for session_id, session in self.sessions.items():
-                    if current_time - session.last_activity > SESSION_TIMEOUT:
-                        to_remove.append(session_id)
-                
-                # Remove inactive sessions
-                for session_id in to_remove:
-                    self.logout(session_id)
-                
-                # Sleep for a while
-                time.sleep(60)  # Check every minute
+                self.expire_sessions()
+                time.sleep(SESSION_EXPIRY_TICK)
             
             except Exception as e:
                 print(f"Error in session cleanup: {e}")
-                time.sleep(60)  # Sleep on error
+                time.sleep(SESSION_EXPIRY_TICK)  # Sleep on error
     
     def shutdown(self) -> None:
         """Shut down the chat manager"""
@@ -426,10 +720,22 @@ class ChatManager:
         
         if self.distribution_thread.is_alive():
             self.distribution_thread.join(timeout=2.0)
+        self.fanout.close()
         
         if self.session_cleanup_thread.is_alive():
             self.session_cleanup_thread.join(timeout=2.0)
         
+        self.maintenance.stop()
+        
+        # Write back logouts and session activity
+        try:
+            self.session_registry.flush()
+        except Exception as e:
+            print(f"Error in session write-back: {e}")
+        
+        # Commit any buffered messages before closing storage
+        self.message_writer.close()
+        
         self.storage.close()
 
 
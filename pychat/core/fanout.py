@@ -0,0 +1,409 @@
+"""
+Parallel message fan-out for PyChat
+"""
+import collections
+import os
+import queue
+import threading
+from typing import Any, Callable, Deque, Dict, Hashable, Iterable, List, Optional
+
+from pychat.common.message import Message
+
+
+DEFAULT_FANOUT_WORKERS = 8
+DEFAULT_OUTBOX_SIZE = 1000
+
+# Messages a worker delivers from one outbox before giving others a turn
+DEFAULT_DRAIN_BATCH = 64
+
+# What to do when a session falls a full outbox behind
+POLICY_DROP_OLDEST = 'drop-oldest'   # Discard the oldest waiting message
+POLICY_COALESCE = 'coalesce'         # Keep only the newest message per conversation
+POLICY_LOGOUT = 'logout'             # Disconnect the session
+
+OVERFLOW_POLICIES = (POLICY_DROP_OLDEST, POLICY_COALESCE, POLICY_LOGOUT)
+
+DEFAULT_OVERFLOW_POLICY = POLICY_DROP_OLDEST
+
+
+def get_overflow_policy(policy: Optional[str] = None) -> str:
+    """
+    Resolve the overflow policy for slow sessions
+    
+    Args:
+        policy: A policy name, or None to use the PYCHAT_OVERFLOW_POLICY
+            environment variable (default: drop-oldest)
+    
+    Returns:
+        The policy name
+    
+    Raises:
+        ValueError: If the policy name is unknown
+    """
+    name = policy or os.environ.get('PYCHAT_OVERFLOW_POLICY') or DEFAULT_OVERFLOW_POLICY
+    if name not in OVERFLOW_POLICIES:
+        raise ValueError(f"Unknown overflow policy '{name}'")
+    return name
+
+
+def conversation_key(message: Message) -> Optional[Hashable]:
+    """
+    Get the conversation a message belongs to
+    
+    Args:
+        message: The message
+    
+    Returns:
+        None for broadcasts, otherwise the pair of participants
+    """
+    if message.recipient is None:
+        return None
+    return tuple(sorted((message.sender, message.recipient)))
+
+
+def deliver(session: Any, message: Message) -> None:
+    """
+    Call every callback of a session with a message
+    
+    Errors raised by a callback are reported and do not stop delivery to
+    the session's other callbacks.
+    
+    Args:
+        session: The ChatSession
+        message: The message to deliver
+    """
+    for callback in list(session.callbacks):
+        try:
+            callback(message)
+        except Exception as e:
+            print(f"Error delivering message to {session.user.username}: {e}")
+
+
+class Outbox:
+    """
+    Messages waiting to be delivered to one session, oldest first
+    """
+    __slots__ = ('session', 'messages', 'lock', 'scheduled', 'closed',
+                 'delivered', 'dropped', 'coalesced')
+    
+    def __init__(self, session: Any, capacity: int):
+        """
+        Initialize an empty outbox
+        
+        Args:
+            session: The ChatSession the messages are for
+            capacity: Maximum number of waiting messages
+        """
+        self.session = session
+        self.messages: Deque[Message] = collections.deque(maxlen=capacity)
+        self.lock = threading.Lock()
+        
+        # True while the outbox is queued for, or being drained by, a worker
+        self.scheduled = False
+        self.closed = False
+        
+        # Statistics
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+
+class FanoutPool:
+    """
+    Delivers messages to session callbacks on a pool of worker threads
+    
+    Every session with callbacks gets a bounded outbox. Publishing a
+    message only appends it to the outboxes, and a worker picks up each
+    outbox that has messages waiting. An outbox is drained by one worker
+    at a time, so each session sees messages in publishing order, while
+    different sessions are served in parallel and a slow callback only
+    holds up its own session.
+    
+    The number of messages waiting in an outbox is the session's lag.
+    A session whose lag reaches the outbox size is handled by the
+    overflow policy: drop its oldest message, coalesce its backlog down
+    to the newest message of each conversation, or log it out.
+    """
+    def __init__(self, workers: int = DEFAULT_FANOUT_WORKERS,
+                 outbox_size: int = DEFAULT_OUTBOX_SIZE,
+                 drain_batch: int = DEFAULT_DRAIN_BATCH,
+                 policy: Optional[str] = None,
+                 on_overflow: Optional[Callable[[Any], None]] = None):
+        """
+        Initialize the pool and start its workers
+        
+        Args:
+            workers: Number of worker threads
+            outbox_size: Maximum number of waiting messages per session
+            drain_batch: Messages delivered from one outbox per turn
+            policy: Overflow policy name (see get_overflow_policy)
+            on_overflow: Called with the session ID of a session dropped by
+                the logout policy, after its outbox has been removed
+        
+        Raises:
+            ValueError: If the policy name is unknown
+        """
+        self.outbox_size = outbox_size
+        self.drain_batch = drain_batch
+        self.policy = get_overflow_policy(policy)
+        self.on_overflow = on_overflow
+        self._lock = threading.Lock()
+        self._outboxes: Dict[Any, Outbox] = {}
+        self._ready: queue.SimpleQueue = queue.SimpleQueue()
+        
+        # Messages published but not yet delivered or dropped
+        self._pending = 0
+        self._idle = threading.Condition(self._lock)
+        
+        # Totals over outboxes that have been removed
+        self._removed_delivered = 0
+        self._removed_dropped = 0
+        self._removed_coalesced = 0
+        
+        # Sessions disconnected by the logout policy
+        self._logged_out = 0
+        
+        self._workers = [
+            threading.Thread(target=self._worker_loop, name=f"pychat-fanout-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for worker in self._workers:
+            worker.start()
+    
+    def publish(self, message: Message, sessions: Iterable[Any]) -> int:
+        """
+        Queue a message for delivery to sessions
+        
+        Args:
+            message: The message
+            sessions: The ChatSessions to deliver to
+        
+        Returns:
+            Number of outboxes the message was added to
+        """
+        count = 0
+        for session in sessions:
+            if not session.callbacks:
+                continue
+            outbox = self._outboxes.get(session.session_id)
+            if outbox is None:
+                with self._lock:
+                    # A session logged out after the caller picked its
+                    # targets must not get a new outbox: remove has run
+                    # or is about to, and nothing would remove it again
+                    if not session.is_active:
+                        continue
+                    outbox = self._outboxes.setdefault(
+                        session.session_id, Outbox(session, self.outbox_size)
+                    )
+            
+            with outbox.lock:
+                if outbox.closed:
+                    continue
+                added = 1
+                overflow = len(outbox.messages) >= self.outbox_size
+                disconnect = overflow and self.policy == POLICY_LOGOUT
+                if disconnect:
+                    outbox.closed = True
+                elif overflow and self.policy == POLICY_COALESCE:
+                    added -= self._coalesce(outbox, message)
+                else:
+                    if overflow:
+                        outbox.messages.popleft()
+                        outbox.dropped += 1
+                        added = 0
+                    outbox.messages.append(message)
+                wake = not outbox.scheduled and not disconnect
+                outbox.scheduled = True
+            
+            if disconnect:
+                self._disconnect(session.session_id)
+                continue
+            if added:
+                with self._lock:
+                    self._pending += added
+                    if added < 0:
+                        self._idle.notify_all()
+            if wake:
+                self._ready.put(outbox)
+            count += 1
+        return count
+    
+    def remove(self, session_id: Any) -> None:
+        """
+        Discard the outbox of a session
+        
+        The session must be marked inactive first, so a concurrent publish
+        cannot create a new outbox for it.
+        
+        Args:
+            session_id: The session ID
+        """
+        with self._lock:
+            outbox = self._outboxes.pop(session_id, None)
+        if outbox is None:
+            return
+        
+        with outbox.lock:
+            outbox.closed = True
+            discarded = len(outbox.messages)
+            outbox.messages.clear()
+        with self._lock:
+            self._removed_delivered += outbox.delivered
+            self._removed_dropped += outbox.dropped + discarded
+            self._removed_coalesced += outbox.coalesced
+            self._pending -= discarded
+            self._idle.notify_all()
+    
+    def get_lag(self, session_id: Any) -> int:
+        """
+        Get the number of messages waiting for a session
+        
+        Args:
+            session_id: The session ID
+        
+        Returns:
+            Number of waiting messages (0 for unknown sessions)
+        """
+        outbox = self._outboxes.get(session_id)
+        if outbox is None:
+            return 0
+        with outbox.lock:
+            return len(outbox.messages)
+    
+    def _coalesce(self, outbox: Outbox, message: Message) -> int:
+        """
+        Reduce a full outbox to the newest message of each conversation
+        
+        The caller holds the outbox lock. If every waiting message belongs
+        to a different conversation the oldest is dropped instead.
+        
+        Args:
+            outbox: The full outbox
+            message: The message being added
+        
+        Returns:
+            Number of waiting messages removed
+        """
+        backlog = list(outbox.messages)
+        backlog.append(message)
+        
+        seen = set()
+        kept: List[Message] = []
+        for waiting in reversed(backlog):
+            key = conversation_key(waiting)
+            if key not in seen:
+                seen.add(key)
+                kept.append(waiting)
+        kept.reverse()
+        
+        removed = len(backlog) - len(kept)
+        outbox.coalesced += removed
+        if len(kept) > self.outbox_size:
+            kept.pop(0)
+            outbox.dropped += 1
+            removed += 1
+        
+        outbox.messages.clear()
+        outbox.messages.extend(kept)
+        return removed
+    
+    def _disconnect(self, session_id: Any) -> None:
+        """Remove the outbox of a session that fell too far behind"""
+        self.remove(session_id)
+        with self._lock:
+            self._logged_out += 1
+        if self.on_overflow is None:
+            return
+        try:
+            self.on_overflow(session_id)
+        except Exception as e:
+            print(f"Error disconnecting slow session: {e}")
+    
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every published message has been delivered
+        
+        Args:
+            timeout: Maximum number of seconds to wait (None waits forever)
+        
+        Returns:
+            True if all messages were delivered, False on timeout
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending <= 0, timeout)
+    
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Get delivery statistics
+        
+        Returns:
+            Dictionary with the number of outboxes and waiting messages, the
+            largest lag of any session, the messages delivered, dropped and
+            coalesced so far, and the sessions logged out for lagging
+        """
+        with self._lock:
+            outboxes = list(self._outboxes.values())
+            stats = {
+                'outboxes': len(outboxes),
+                'pending': self._pending,
+                'max_lag': 0,
+                'delivered': self._removed_delivered,
+                'dropped': self._removed_dropped,
+                'coalesced': self._removed_coalesced,
+                'logged_out': self._logged_out,
+            }
+        for outbox in outboxes:
+            stats['max_lag'] = max(stats['max_lag'], len(outbox.messages))
+            stats['delivered'] += outbox.delivered
+            stats['dropped'] += outbox.dropped
+            stats['coalesced'] += outbox.coalesced
+        return stats
+    
+    def close(self, timeout: Optional[float] = 2.0) -> None:
+        """
+        Deliver waiting messages and stop the workers
+        
+        Args:
+            timeout: Maximum number of seconds to wait for delivery
+        """
+        self.join(timeout)
+        for _ in self._workers:
+            self._ready.put(None)
+        for worker in self._workers:
+            worker.join(timeout)
+    
+    def _worker_loop(self) -> None:
+        """
+        Worker main loop
+        Runs in a separate thread
+        """
+        while True:
+            outbox = self._ready.get()
+            if outbox is None:
+                return
+            try:
+                self._drain(outbox)
+            except Exception as e:
+                print(f"Error in message fan-out: {e}")
+    
+    def _drain(self, outbox: Outbox) -> None:
+        """Deliver one batch from an outbox and hand it back if more remain"""
+        with outbox.lock:
+            count = min(len(outbox.messages), self.drain_batch)
+            batch: List[Message] = [outbox.messages.popleft() for _ in range(count)]
+        
+        for message in batch:
+            deliver(outbox.session, message)
+        
+        with outbox.lock:
+            outbox.delivered += len(batch)
+            more = bool(outbox.messages) and not outbox.closed
+            outbox.scheduled = more
+        
+        with self._lock:
+            self._pending -= len(batch)
+            self._idle.notify_all()
+        
+        if more:
+            self._ready.put(outbox)
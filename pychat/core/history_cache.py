@@ -0,0 +1,271 @@
+"""
+Recent-history cache for PyChat
+"""
+import collections
+import itertools
+import threading
+from typing import Deque, Dict, List, Optional, Tuple
+
+from pychat.common.message import Message, MessageCursor, MessagePage
+from pychat.core.storage_backend import message_key
+
+
+# Messages kept per history view, and number of views kept
+DEFAULT_HISTORY_CACHE_SIZE = 200
+DEFAULT_HISTORY_CACHE_VIEWS = 256
+
+
+class _HistoryRing:
+    """
+    The latest messages of one history view, oldest first
+    """
+    __slots__ = ('messages', 'complete', 'exhaustive')
+    
+    def __init__(self, messages: List[Message], capacity: int, complete: int, exhaustive: bool):
+        """
+        Initialize a ring
+        
+        Args:
+            messages: Initial messages in history order
+            capacity: Maximum number of messages kept
+            complete: How many of the newest messages are known to be exactly
+                the latest messages of the view
+            exhaustive: True if the messages are the view's entire history
+        """
+        self.messages: Deque[Message] = collections.deque(messages, maxlen=capacity)
+        self.complete = complete
+        self.exhaustive = exhaustive
+    
+    def append(self, message: Message) -> bool:
+        """
+        Add a new message to the ring
+        
+        Args:
+            message: The message
+        
+        Returns:
+            False if the message does not sort after the ring's newest
+            message, in which case the ring can no longer be trusted
+        """
+        if self.messages:
+            last = self.messages[-1]
+            if message_key(message.timestamp_us, message.msg_id) <= \
+                    message_key(last.timestamp_us, last.msg_id):
+                return False
+        
+        if len(self.messages) == self.messages.maxlen:
+            self.exhaustive = False
+        self.messages.append(message)
+        self.complete = min(self.complete + 1, len(self.messages))
+        return True
+    
+    def covers(self, count: int) -> bool:
+        """Check if the ring holds the latest count messages of its view"""
+        return self.exhaustive or count <= self.complete
+
+
+class HistoryCache:
+    """
+    Read-through cache of the latest messages of each history view
+    
+    A view is what get_messages(limit, username) returns: everything for
+    username None, otherwise broadcasts plus the user's private messages.
+    Each view cached keeps its newest messages in a bounded ring. A ring
+    is filled by the first query for its view and then kept current by
+    add(), so repeated requests for the latest messages need no query.
+    Views are evicted least recently used first.
+    """
+    def __init__(self, capacity: int = DEFAULT_HISTORY_CACHE_SIZE,
+                 max_views: int = DEFAULT_HISTORY_CACHE_VIEWS):
+        """
+        Initialize an empty cache
+        
+        Args:
+            capacity: Messages kept per view
+            max_views: Number of views kept
+        """
+        self.capacity = capacity
+        self.max_views = max_views
+        self._lock = threading.Lock()
+        self._views: 'collections.OrderedDict[Optional[str], _HistoryRing]' = collections.OrderedDict()
+        
+        # Loads in progress: load ID -> (view, messages added since it began),
+        # or (view, None) once the load may no longer be cached (see discard)
+        self._loading: Dict[int, Tuple[Optional[str], Optional[List[Message]]]] = {}
+        self._load_ids = itertools.count()
+        
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+    
+    def add(self, message: Message) -> None:
+        """
+        Add a newly sent message to every cached view that shows it
+        
+        Args:
+            message: The message
+        """
+        with self._lock:
+            if message.recipient is None:
+                views = list(self._views)
+            else:
+                parties = {None, message.sender, message.recipient}
+                views = [view for view in parties if view in self._views]
+            
+            for view in views:
+                if not self._views[view].append(message):
+                    del self._views[view]
+            for view, pending in self._loading.values():
+                if pending is not None and \
+                        (message.recipient is None or view in (None, message.sender, message.recipient)):
+                    pending.append(message)
+    
+    def discard(self, messages: List[Message]) -> None:
+        """
+        Forget messages that were added but could not be saved
+        
+        Every view that may show one of the messages is dropped, and loads
+        in progress that recorded one of them are not cached when they
+        finish, so the next request for those views queries storage.
+        
+        Args:
+            messages: The messages added with add
+        """
+        ids = {message.msg_id for message in messages}
+        with self._lock:
+            views = set()
+            for message in messages:
+                if message.recipient is None:
+                    views.update(self._views)
+                else:
+                    views.update((None, message.sender, message.recipient))
+            for view in views:
+                self._views.pop(view, None)
+            
+            for load, (view, pending) in self._loading.items():
+                if pending is not None and any(m.msg_id in ids for m in pending):
+                    self._loading[load] = (view, None)
+    
+    def get(self, username: Optional[str], limit: int) -> Optional[List[Message]]:
+        """
+        Get the latest messages of a view if they are cached
+        
+        Args:
+            username: The view (None for all messages)
+            limit: Number of messages wanted
+        
+        Returns:
+            Up to limit messages in history order, or None on a miss
+        """
+        with self._lock:
+            ring = self._views.get(username)
+            if ring is None or not ring.covers(limit):
+                self.misses += 1
+                return None
+            self._views.move_to_end(username)
+            self.hits += 1
+            if limit >= len(ring.messages):
+                return list(ring.messages)
+            return list(ring.messages)[-limit:]
+    
+    def get_page(self, username: Optional[str], limit: int) -> Optional[MessagePage]:
+        """
+        Get the latest page of a view if it is cached
+        
+        Args:
+            username: The view (None for all messages)
+            limit: Number of messages on the page
+        
+        Returns:
+            MessagePage like StorageBackend.get_message_page without
+            cursors, or None on a miss
+        """
+        # One extra message tells whether older history exists
+        messages = self.get(username, limit + 1)
+        if messages is None:
+            return None
+        
+        page = messages[-limit:] if limit > 0 else []
+        if not page:
+            return MessagePage([])
+        return MessagePage(
+            page,
+            older=MessageCursor.from_message(page[0]) if len(messages) > len(page) else None,
+            newer=MessageCursor.from_message(page[-1])
+        )
+    
+    def begin_load(self, username: Optional[str]) -> int:
+        """
+        Start recording messages for a view that is about to be queried
+        
+        Must be called before the storage query, so messages sent while it
+        runs are not lost (see finish_load). Concurrent loads of the same
+        view each record their own messages.
+        
+        Args:
+            username: The view
+        
+        Returns:
+            ID of the load, to pass to finish_load
+        """
+        with self._lock:
+            load = next(self._load_ids)
+            self._loading[load] = (username, [])
+            return load
+    
+    def finish_load(self, load: int, messages: List[Message], limit: int,
+                    exhaustive: bool) -> None:
+        """
+        Fill a view from the result of a storage query
+        
+        Args:
+            load: ID returned by begin_load
+            messages: The latest messages of the view, as returned by storage
+            limit: Number of messages the query asked for
+            exhaustive: True if the query returned the view's entire history
+        """
+        with self._lock:
+            username, pending = self._loading.pop(load)
+            if pending is None or limit > self.capacity:
+                return
+            
+            known = {message.msg_id for message in messages}
+            combined = list(messages) + [m for m in pending if m.msg_id not in known]
+            combined.sort(key=lambda m: message_key(m.timestamp_us, m.msg_id))
+            
+            # A message sent during the query that sorts before its results
+            # may hide older stored messages; leave the view uncached
+            if not exhaustive and messages and len(combined) > len(messages) and \
+                    combined[0].msg_id not in known:
+                return
+            
+            ring = _HistoryRing(combined[-self.capacity:], self.capacity,
+                                complete=min(len(combined), self.capacity),
+                                exhaustive=exhaustive and len(combined) <= self.capacity)
+            self._views[username] = ring
+            self._views.move_to_end(username)
+            while len(self._views) > self.max_views:
+                self._views.popitem(last=False)
+    
+    def cancel_load(self, load: int) -> None:
+        """
+        Stop recording messages for a load whose query failed
+        
+        Args:
+            load: ID returned by begin_load
+        """
+        with self._lock:
+            self._loading.pop(load, None)
+    
+    def invalidate(self, username: Optional[str] = None) -> None:
+        """
+        Drop cached views
+        
+        Args:
+            username: The view to drop (None drops every view)
+        """
+        with self._lock:
+            if username is None:
+                self._views.clear()
+            else:
+                self._views.pop(username, None)
@@ -0,0 +1,704 @@
+"""
+Append-only log storage backend for PyChat
+"""
+import bisect
+import heapq
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, TYPE_CHECKING
+
+from pychat.common.message import (
+    ConversationSummary, Message, MessageCursor, MessagePage, SearchPage,
+    decode_message_record, decode_record_key, encode_message_record
+)
+from pychat.common.utils import ensure_directory, from_epoch_micros, get_app_data_dir
+from pychat.core.storage import Storage
+from pychat.core.storage_backend import (
+    ConversationIndex, MessageKey, StorageBackend, cursor_key, make_message_page, message_key,
+    search_scan
+)
+
+if TYPE_CHECKING:
+    from pychat.core.user import User
+
+
+# Frame around each record: body length and flags before the body, the body
+# length again after it, so segments can be walked in both directions
+_FRAME_HEADER = struct.Struct('<IB')
+_FRAME_TRAILER = struct.Struct('<I')
+
+# Flag of a record whose key sorts before a record appended earlier
+FLAG_OUT_OF_ORDER = 0x01
+
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+DEFAULT_INDEX_INTERVAL = 4096
+SEGMENT_SUFFIX = '.log'
+
+# Location of a record: (key, segment, body offset, body length)
+RecordLocation = Tuple[MessageKey, 'LogSegment', int, int]
+
+
+class LogSegment:
+    """
+    One file of the message log
+    
+    Records are only ever appended. Reads go through a read-only memory
+    map that is re-created when the file has grown since it was mapped.
+    """
+    def __init__(self, path: str, number: int):
+        """
+        Initialize a segment
+        
+        Args:
+            path: Path of the segment file
+            number: Sequence number of the segment
+        """
+        self.path = path
+        self.number = number
+        self.size = os.path.getsize(path) if os.path.exists(path) else 0
+        
+        # Sparse index over the in-order records: one entry every index_interval bytes
+        self.index_keys: List[MessageKey] = []
+        self.index_offsets: List[int] = []
+        
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+        self._view: Optional[memoryview] = None
+        self._mapped = 0
+    
+    def view(self) -> Optional[memoryview]:
+        """
+        Get a view of the segment contents
+        
+        Returns:
+            Memoryview over the mapped file, or None if the segment is empty
+        """
+        if self.size == 0:
+            return None
+        if self._mapped != self.size:
+            self._unmap()
+            with open(self.path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), self.size, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._map)
+            self._mapped = self.size
+        return self._view
+    
+    def append(self, data: bytes, sync: bool = False) -> int:
+        """
+        Append bytes to the segment
+        
+        A failed write is cut back off the file, so the segment never ends
+        in a partial batch.
+        
+        Args:
+            data: The bytes to append
+            sync: Flush the file to disk before returning
+        
+        Returns:
+            Offset at which the data starts
+        """
+        if self._file is None:
+            self._file = open(self.path, 'ab', buffering=0)
+        
+        start = self.size
+        try:
+            written = 0
+            while written < len(data):
+                written += self._file.write(data[written:])
+            if sync:
+                os.fsync(self._file.fileno())
+        except OSError:
+            self._file.truncate(start)
+            raise
+        
+        self.size += len(data)
+        return start
+    
+    def add_index_entry(self, key: MessageKey, offset: int, interval: int) -> None:
+        """
+        Record an in-order record in the sparse index if it is due
+        
+        Args:
+            key: Key of the record
+            offset: Offset of the record frame
+            interval: Minimum number of bytes between index entries
+        """
+        if not self.index_offsets or offset - self.index_offsets[-1] >= interval:
+            self.index_keys.append(key)
+            self.index_offsets.append(offset)
+    
+    def truncate(self, size: int) -> None:
+        """
+        Cut the segment file back to a size
+        
+        Args:
+            size: New size in bytes
+        """
+        self._unmap()
+        os.truncate(self.path, size)
+        self.size = size
+    
+    def seal(self) -> None:
+        """Close the append handle once the segment is no longer written"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+    
+    def close(self) -> None:
+        """Close the file and release the memory map"""
+        self.seal()
+        self._unmap()
+    
+    def _unmap(self) -> None:
+        """Release the current memory map"""
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._mapped = 0
+
+
+def _read_frame(view: memoryview, offset: int) -> Tuple[int, int, int]:
+    """
+    Read the frame of the record starting at an offset
+    
+    Returns:
+        (flags, body length, offset of the next record)
+    """
+    length, flags = _FRAME_HEADER.unpack_from(view, offset)
+    return flags, length, offset + _FRAME_HEADER.size + length + _FRAME_TRAILER.size
+
+
+class LogStorage(StorageBackend):
+    """
+    Storage backend that appends messages to a segmented log
+    
+    Messages are length-prefixed records appended to numbered segment
+    files, which roll over once they reach segment_bytes. History is kept
+    in (timestamp, msg_id) order by the log itself: a sparse index per
+    segment locates a key, and the few messages that arrive with an older
+    key than one already written are flagged and kept in a small sorted
+    index that is merged into every read.
+    
+    User profiles, credentials and sessions are delegated to a metadata
+    backend (a SQLite Storage by default).
+    """
+    def __init__(self, log_dir: Optional[str] = None, metadata: Optional[StorageBackend] = None,
+                 segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+                 index_interval: int = DEFAULT_INDEX_INTERVAL, sync: bool = False):
+        """
+        Open the log, recovering its indexes from the segment files
+        
+        Args:
+            log_dir: Directory of the segment files (default: ~/.pychat/log)
+            metadata: Backend for users and sessions (default: Storage(),
+                which is closed along with the log)
+            segment_bytes: Size at which a new segment is started
+            index_interval: Bytes of log between sparse index entries
+            sync: Flush every append to disk before returning
+        """
+        if log_dir is None:
+            log_dir = os.path.join(get_app_data_dir(), "log")
+        ensure_directory(log_dir)
+        
+        self.log_dir = log_dir
+        self.metadata = metadata if metadata is not None else Storage()
+        self._owns_metadata = metadata is None
+        self.segment_bytes = segment_bytes
+        self.index_interval = index_interval
+        self.sync = sync
+        self._lock = threading.RLock()
+        
+        self.segments: List[LogSegment] = []
+        self._message_ids: Set[object] = set()
+        self._last_key: Optional[MessageKey] = None
+        self._late_keys: List[MessageKey] = []
+        self._late: List[RecordLocation] = []
+        self._conversations = ConversationIndex()
+        
+        self._open_segments()
+    
+    def _segment_path(self, number: int) -> str:
+        """Get the path of a segment file"""
+        return os.path.join(self.log_dir, f"{number:08d}{SEGMENT_SUFFIX}")
+    
+    def _open_segments(self) -> None:
+        """Load the existing segments and rebuild the in-memory indexes"""
+        numbers = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.log_dir)
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+        )
+        for number in numbers:
+            segment = LogSegment(self._segment_path(number), number)
+            self.segments.append(segment)
+            self._recover_segment(segment)
+        
+        if not self.segments:
+            self.segments.append(LogSegment(self._segment_path(0), 0))
+    
+    def _recover_segment(self, segment: LogSegment) -> None:
+        """
+        Index the records of a segment, cutting off a torn tail
+        
+        Args:
+            segment: The segment to scan
+        """
+        view = segment.view()
+        offset = 0
+        while offset < segment.size:
+            body = offset + _FRAME_HEADER.size
+            if body > segment.size:
+                break
+            flags, length, next_offset = _read_frame(view, offset)
+            if next_offset > segment.size or \
+                    _FRAME_TRAILER.unpack_from(view, next_offset - _FRAME_TRAILER.size)[0] != length:
+                break
+            
+            message = decode_message_record(view, body, length)
+            key = decode_record_key(view, body)
+            self._index_record(segment, offset, flags, key, message, length)
+            offset = next_offset
+        
+        if offset < segment.size:
+            print(f"Error in log segment {segment.path}: dropping damaged records after byte {offset}")
+            segment.truncate(offset)
+    
+    def _index_record(self, segment: LogSegment, offset: int, flags: int, key: MessageKey,
+                      message: Message, length: int) -> None:
+        """Add a record to the in-memory indexes"""
+        self._message_ids.add(key[2])
+        self._conversations.add(message)
+        
+        if flags & FLAG_OUT_OF_ORDER:
+            position = bisect.bisect_left(self._late_keys, key)
+            self._late_keys.insert(position, key)
+            self._late.insert(position, (key, segment, offset + _FRAME_HEADER.size, length))
+            return
+        
+        segment.add_index_entry(key, offset, self.index_interval)
+        self._last_key = key
+    
+    def save_message(self, message: Message) -> None:
+        """
+        Append a message to the log
+        
+        Args:
+            message: The message to save
+        
+        Raises:
+            ValueError: If a message with the same ID exists
+        """
+        self.save_messages([message])
+    
+    def save_messages(self, messages: List[Message]) -> None:
+        """
+        Append a batch of messages with a single write
+        
+        Args:
+            messages: The messages to save
+        
+        Raises:
+            ValueError: If any message ID already exists (nothing is saved)
+        """
+        if not messages:
+            return
+        
+        with self._lock:
+            keys = [message_key(message.timestamp_us, message.msg_id) for message in messages]
+            seen: Set[object] = set()
+            for message, key in zip(messages, keys):
+                if key[2] in self._message_ids or key[2] in seen:
+                    raise ValueError(f"Duplicate message ID '{message.msg_id}'")
+                seen.add(key[2])
+            
+            # Frame the batch, flagging records that sort before the log tail
+            frames = []
+            records = []
+            last_key = self._last_key
+            for message, key in zip(messages, keys):
+                record = encode_message_record(message)
+                flags = 0
+                if last_key is not None and key < last_key:
+                    flags = FLAG_OUT_OF_ORDER
+                else:
+                    last_key = key
+                frames.append(_FRAME_HEADER.pack(len(record), flags))
+                frames.append(record)
+                frames.append(_FRAME_TRAILER.pack(len(record)))
+                records.append((flags, len(record)))
+            data = b''.join(frames)
+            
+            segment = self.segments[-1]
+            if segment.size and segment.size + len(data) > self.segment_bytes:
+                segment = self._roll_segment()
+            offset = segment.append(data, self.sync)
+            
+            for message, key, (flags, length) in zip(messages, keys, records):
+                self._index_record(segment, offset, flags, key, message, length)
+                offset += _FRAME_HEADER.size + length + _FRAME_TRAILER.size
+    
+    def _roll_segment(self) -> LogSegment:
+        """Start a new segment and make it the one appended to"""
+        self.segments[-1].seal()
+        number = self.segments[-1].number + 1
+        segment = LogSegment(self._segment_path(number), number)
+        self.segments.append(segment)
+        return segment
+    
+    def get_message_page(self, limit: int = 100, recipient: Optional[str] = None,
+                         before: Optional[MessageCursor] = None,
+                         after: Optional[MessageCursor] = None) -> MessagePage:
+        """
+        Retrieve a page of messages using keyset pagination
+        
+        Args:
+            limit: Maximum number of messages on the page
+            recipient: Only include broadcasts and private messages to or
+                from this user (None for all messages)
+            before: Cursor the page must end before
+            after: Cursor the page must start after
+        
+        Returns:
+            MessagePage with messages in chronological order
+        """
+        descending = after is None or before is not None
+        before_key = cursor_key(before) if before is not None else None
+        after_key = cursor_key(after) if after is not None else None
+        
+        # Fetch one extra message to learn whether the history continues
+        fetch = limit + 1
+        messages: List[Message] = []
+        
+        with self._lock:
+            for message in self._iter_messages(descending, before_key, after_key):
+                if recipient is None or message.recipient is None \
+                        or recipient in (message.sender, message.recipient):
+                    messages.append(message)
+                    if len(messages) == fetch:
+                        break
+        
+        return make_message_page(messages, limit, descending, after)
+    
+    def _iter_messages(self, descending: bool, before: Optional[MessageKey] = None,
+                       after: Optional[MessageKey] = None) -> Iterator[Message]:
+        """
+        Iterate over the messages between two keys in key order
+        
+        Must be called with the lock held.
+        
+        Args:
+            descending: Walk from the newest message backwards
+            before: Exclusive upper bound
+            after: Exclusive lower bound
+        
+        Yields:
+            Messages decoded from the mapped segments
+        """
+        if descending:
+            ordered = self._scan_backward(before, after)
+        else:
+            ordered = self._scan_forward(after, before)
+        
+        low = bisect.bisect_right(self._late_keys, after) if after is not None else 0
+        high = bisect.bisect_left(self._late_keys, before) if before is not None else len(self._late)
+        late = reversed(self._late[low:high]) if descending else iter(self._late[low:high])
+        
+        for _, segment, offset, length in heapq.merge(ordered, late, key=lambda entry: entry[0],
+                                                      reverse=descending):
+            yield decode_message_record(segment.view(), offset, length)
+    
+    def _seek(self, key: MessageKey, strict: bool) -> Tuple[int, int]:
+        """
+        Find the first in-order record at or after a key
+        
+        Args:
+            key: The key to look for
+            strict: Skip records equal to the key
+        
+        Returns:
+            (segment position, frame offset) of the record; the end of the
+            log if there is none
+        """
+        # Segments hold consecutive key ranges: start in the last one beginning before the key
+        position = None
+        for i in range(len(self.segments) - 1, -1, -1):
+            keys = self.segments[i].index_keys
+            if keys and (keys[0] <= key if strict else keys[0] < key):
+                position = i
+                break
+        if position is None:
+            return 0, 0
+        
+        segment = self.segments[position]
+        if strict:
+            entry = bisect.bisect_right(segment.index_keys, key) - 1
+        else:
+            entry = bisect.bisect_left(segment.index_keys, key) - 1
+        
+        view = segment.view()
+        offset = segment.index_offsets[entry]
+        while offset < segment.size:
+            flags, _, next_offset = _read_frame(view, offset)
+            if not flags & FLAG_OUT_OF_ORDER:
+                found = decode_record_key(view, offset + _FRAME_HEADER.size)
+                if found > key or (found == key and not strict):
+                    return position, offset
+            offset = next_offset
+        
+        if position + 1 < len(self.segments):
+            return position + 1, 0
+        return position, segment.size
+    
+    def _scan_forward(self, after: Optional[MessageKey],
+                      before: Optional[MessageKey]) -> Iterator[RecordLocation]:
+        """Walk the in-order records upwards from after (exclusive) to before (exclusive)"""
+        start, offset = self._seek(after, strict=True) if after is not None else (0, 0)
+        for segment in self.segments[start:]:
+            view = segment.view()
+            while offset < segment.size:
+                flags, length, next_offset = _read_frame(view, offset)
+                if not flags & FLAG_OUT_OF_ORDER:
+                    body = offset + _FRAME_HEADER.size
+                    key = decode_record_key(view, body)
+                    if before is not None and key >= before:
+                        return
+                    yield key, segment, body, length
+                offset = next_offset
+            offset = 0
+    
+    def _scan_backward(self, before: Optional[MessageKey],
+                       after: Optional[MessageKey]) -> Iterator[RecordLocation]:
+        """Walk the in-order records downwards from before (exclusive) to after (exclusive)"""
+        if before is not None:
+            start, end = self._seek(before, strict=False)
+        else:
+            start, end = len(self.segments) - 1, self.segments[-1].size
+        
+        for i in range(start, -1, -1):
+            segment = self.segments[i]
+            view = segment.view()
+            if i != start:
+                end = segment.size
+            while end > 0:
+                length = _FRAME_TRAILER.unpack_from(view, end - _FRAME_TRAILER.size)[0]
+                offset = end - _FRAME_TRAILER.size - length - _FRAME_HEADER.size
+                flags = _FRAME_HEADER.unpack_from(view, offset)[1]
+                if not flags & FLAG_OUT_OF_ORDER:
+                    body = offset + _FRAME_HEADER.size
+                    key = decode_record_key(view, body)
+                    if after is not None and key <= after:
+                        return
+                    yield key, segment, body, length
+                end = offset
+    
+    def search_messages(self, query: str, username: Optional[str] = None, limit: int = 20,
+                        cursor: Optional[int] = None) -> SearchPage:
+        """
+        Search message content, newest matches first
+        
+        Scans the log from its tail; all words must appear and the last
+        word may match as a prefix.
+        
+        Args:
+            query: Words to search for
+            username: Only include messages this user may see (None for all)
+            limit: Maximum number of results on the page
+            cursor: Cursor returned with the previous page
+        
+        Returns:
+            SearchPage of matching messages
+        """
+        with self._lock:
+            return search_scan(self._iter_messages(True), query, username, limit, cursor)
+    
+    def save_user(self, user: 'User', password_hash: Optional[str] = None,
+                  password_salt: Optional[str] = None, replace: bool = True) -> None:
+        """
+        Save a user in the metadata backend
+        
+        Args:
+            user: The user to save
+            password_hash: Optional password hash
+            password_salt: Optional password salt
+            replace: False to only create a new user
+        
+        Raises:
+            ValueError: If replace is False and the username is taken
+        """
+        self.metadata.save_user(user, password_hash, password_salt, replace)
+    
+    def update_user(self, user: 'User') -> None:
+        """
+        Update a user in the metadata backend
+        
+        Args:
+            user: The user to update
+        """
+        self.metadata.update_user(user)
+    
+    def get_user(self, username: str) -> Optional['User']:
+        """
+        Get a user by username
+        
+        Args:
+            username: The username to look up
+        
+        Returns:
+            User object if found, None otherwise
+        """
+        return self.metadata.get_user(username)
+    
+    def get_users(self, status: Optional[str] = None) -> List['User']:
+        """
+        Get all users
+        
+        Args:
+            status: Optional filter by status
+        
+        Returns:
+            List of User objects
+        """
+        return self.metadata.get_users(status)
+    
+    def user_exists(self, username: str) -> bool:
+        """
+        Check if a user exists
+        
+        Args:
+            username: The username to check
+        
+        Returns:
+            True if user exists, False otherwise
+        """
+        return self.metadata.user_exists(username)
+    
+    def get_users_by_name(self, usernames: Iterable[str]) -> List['User']:
+        """
+        Get several users from the metadata backend in one lookup
+        
+        Args:
+            usernames: The usernames to look up
+        
+        Returns:
+            The users found, in no particular order (unknown names are skipped)
+        """
+        return self.metadata.get_users_by_name(usernames)
+    
+    def get_user_auth_data(self, username: str) -> Dict[str, str]:
+        """
+        Get authentication data for a user
+        
+        Args:
+            username: The username to look up
+        
+        Returns:
+            Dictionary with 'password_hash' and 'password_salt'
+        """
+        return self.metadata.get_user_auth_data(username)
+    
+    def create_session(self, username: str, expires_in: int = 86400) -> str:
+        """
+        Create a new session for a user
+        
+        Args:
+            username: The username to create a session for
+            expires_in: Session duration in seconds (default: 24 hours)
+        
+        Returns:
+            Session ID
+        """
+        return self.metadata.create_session(username, expires_in)
+    
+    def validate_session(self, session_id: str) -> Optional[str]:
+        """
+        Validate a session and return the associated username
+        
+        Args:
+            session_id: The session ID to validate
+        
+        Returns:
+            Username if session is valid, None otherwise
+        """
+        return self.metadata.validate_session(session_id)
+    
+    def invalidate_session(self, session_id: str) -> None:
+        """
+        Invalidate a session
+        
+        Args:
+            session_id: The session ID to invalidate
+        """
+        self.metadata.invalidate_session(session_id)
+    
+    def get_active_sessions(self) -> List[Tuple[str, str, int]]:
+        """
+        Get every session that is active and not expired
+        
+        Returns:
+            List of (session_id, username, expires_at_us) tuples
+        """
+        return self.metadata.get_active_sessions()
+    
+    def update_sessions(self, updates: List[Tuple[str, int, bool]]) -> None:
+        """
+        Record activity and invalidation of sessions in one batch
+        
+        Args:
+            updates: (session_id, last_activity_us, is_active) tuples
+        """
+        self.metadata.update_sessions(updates)
+    
+    def purge_sessions(self, batch_size: int = 1000) -> int:
+        """
+        Delete one batch of expired or invalidated sessions
+        
+        Args:
+            batch_size: Maximum number of sessions to delete
+        
+        Returns:
+            Number of sessions deleted (0 when there is nothing to do)
+        """
+        return self.metadata.purge_sessions(batch_size)
+    
+    def get_conversation_summaries(self, username: str) -> List[ConversationSummary]:
+        """
+        Get summaries of a user's private conversations, most recent first
+        
+        Args:
+            username: The username to look up conversations for
+        
+        Returns:
+            List of ConversationSummary objects for partners that still exist
+        """
+        with self._lock:
+            entries = self._conversations.entries(username)
+        
+        # Load every partner at once rather than one lookup per conversation
+        users = {user.username: user
+                 for user in self.metadata.get_users_by_name(entry[0] for entry in entries)}
+        
+        summaries = []
+        for partner, last_message_us, last_sender, preview, count in entries:
+            user = users.get(partner)
+            if user is None:
+                continue
+            summaries.append(ConversationSummary(
+                user=user,
+                last_message_time=from_epoch_micros(last_message_us),
+                last_sender=last_sender,
+                last_message_preview=preview,
+                message_count=count
+            ))
+        return summaries
+    
+    def close(self) -> None:
+        """Close the segment files and the metadata backend if it was created here"""
+        with self._lock:
+            for segment in self.segments:
+                segment.close()
+        if self._owns_metadata:
+            self.metadata.close()
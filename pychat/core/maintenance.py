@@ -0,0 +1,176 @@
+"""
+Background maintenance jobs for PyChat
+"""
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+
+class MaintenanceJob:
+    """
+    A periodic unit of background work
+    
+    The job function does one bounded batch of work and returns how much
+    it did. While it keeps reporting work the job is re-run after
+    busy_interval seconds; once it reports 0 it waits for interval seconds.
+    """
+    def __init__(self, name: str, func: Callable[[], int], interval: float,
+                 busy_interval: float = 0.1):
+        """
+        Initialize a job
+        
+        Args:
+            name: Unique job name
+            func: Function doing one batch of work, returning the amount done
+            interval: Seconds between runs when there is nothing to do
+            busy_interval: Seconds between runs while work remains
+        """
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.busy_interval = busy_interval
+        self.next_run = 0.0
+        
+        # Statistics
+        self.runs = 0
+        self.last_result = 0
+        self.total = 0
+        self.last_error: Optional[str] = None
+
+
+class MaintenanceWorker:
+    """
+    Runs maintenance jobs on a single background thread
+    """
+    def __init__(self, name: str = "maintenance"):
+        """
+        Initialize the worker and start its thread
+        
+        Args:
+            name: Name of the worker thread
+        """
+        self.jobs: Dict[str, MaintenanceJob] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self.running = True
+        
+        self._thread = threading.Thread(target=self._run_loop, name=name, daemon=True)
+        self._thread.start()
+    
+    def add_job(self, name: str, func: Callable[[], int], interval: float,
+                busy_interval: float = 0.1, delay: float = 0.0) -> MaintenanceJob:
+        """
+        Register a job
+        
+        Args:
+            name: Unique job name (replaces an existing job of the same name)
+            func: Function doing one batch of work, returning the amount done
+            interval: Seconds between runs when there is nothing to do
+            busy_interval: Seconds between runs while work remains
+            delay: Seconds to wait before the first run
+        
+        Returns:
+            The registered MaintenanceJob
+        """
+        job = MaintenanceJob(name, func, interval, busy_interval)
+        job.next_run = time.monotonic() + delay
+        with self._lock:
+            self.jobs[name] = job
+        self._wakeup.set()
+        return job
+    
+    def remove_job(self, name: str) -> None:
+        """
+        Unregister a job
+        
+        Args:
+            name: Name of the job to remove
+        """
+        with self._lock:
+            self.jobs.pop(name, None)
+    
+    def run_now(self, name: str) -> int:
+        """
+        Run a job immediately on the calling thread
+        
+        Args:
+            name: Name of the job to run
+        
+        Returns:
+            Amount of work done by the run
+        """
+        with self._lock:
+            job = self.jobs[name]
+        return self._run_job(job)
+    
+    def get_stats(self) -> List[Dict[str, object]]:
+        """
+        Get per-job statistics
+        
+        Returns:
+            List of dictionaries with the job name, run count, last result,
+            total work done and last error
+        """
+        with self._lock:
+            jobs = list(self.jobs.values())
+        return [
+            {
+                'name': job.name,
+                'runs': job.runs,
+                'last_result': job.last_result,
+                'total': job.total,
+                'last_error': job.last_error
+            }
+            for job in jobs
+        ]
+    
+    def stop(self, timeout: Optional[float] = 2.0) -> None:
+        """
+        Stop the worker thread
+        
+        Args:
+            timeout: Maximum number of seconds to wait for a running job
+        """
+        self.running = False
+        self._wakeup.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+    
+    def _run_job(self, job: MaintenanceJob) -> int:
+        """Run one batch of a job and reschedule it"""
+        try:
+            result = int(job.func() or 0)
+            job.last_error = None
+        except Exception as e:
+            print(f"Error in maintenance job {job.name}: {e}")
+            job.last_error = str(e)
+            result = 0
+        
+        job.runs += 1
+        job.last_result = result
+        job.total += result
+        job.next_run = time.monotonic() + (job.busy_interval if result else job.interval)
+        return result
+    
+    def _run_loop(self) -> None:
+        """
+        Worker main loop
+        Runs in a separate thread
+        """
+        while self.running:
+            with self._lock:
+                jobs = list(self.jobs.values())
+            
+            now = time.monotonic()
+            for job in jobs:
+                if not self.running:
+                    return
+                if job.next_run <= now:
+                    self._run_job(job)
+            
+            with self._lock:
+                next_run = min((job.next_run for job in self.jobs.values()), default=None)
+            
+            timeout = 1.0 if next_run is None else max(0.0, next_run - time.monotonic())
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
@@ -0,0 +1,468 @@
+"""
+In-memory storage backend for PyChat
+"""
+import bisect
+import datetime
+import heapq
+import threading
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, TYPE_CHECKING
+
+from pychat.common.message import (
+    ConversationSummary, Message, MessageCursor, MessagePage, SearchPage
+)
+from pychat.common.utils import from_epoch_micros, to_epoch_micros
+from pychat.core.storage_backend import (
+    ConversationIndex, MessageKey, StorageBackend, cursor_key, make_message_page, message_key,
+    search_scan
+)
+
+if TYPE_CHECKING:
+    from pychat.core.user import User
+
+
+class _SortedIndex:
+    """
+    Messages kept in key order in parallel lists for binary search
+    
+    Messages usually arrive in time order, so inserts are appends.
+    """
+    def __init__(self):
+        """Initialize an empty index"""
+        self.keys: List[MessageKey] = []
+        self.messages: List[Message] = []
+    
+    def insert(self, key: MessageKey, message: Message) -> None:
+        """
+        Add a message to the index
+        
+        Args:
+            key: Sort key of the message
+            message: The message
+        """
+        if not self.keys or key > self.keys[-1]:
+            self.keys.append(key)
+            self.messages.append(message)
+            return
+        position = bisect.bisect_left(self.keys, key)
+        self.keys.insert(position, key)
+        self.messages.insert(position, message)
+    
+    def range(self, count: int, descending: bool, before: Optional[MessageKey] = None,
+              after: Optional[MessageKey] = None) -> List[Tuple[MessageKey, Message]]:
+        """
+        Get up to count entries between two keys
+        
+        Args:
+            count: Maximum number of entries
+            descending: Start from the newest end of the range
+            before: Exclusive upper bound
+            after: Exclusive lower bound
+        
+        Returns:
+            List of (key, message) tuples in the requested order
+        """
+        low = bisect.bisect_right(self.keys, after) if after is not None else 0
+        high = bisect.bisect_left(self.keys, before) if before is not None else len(self.keys)
+        if descending:
+            start = max(low, high - count)
+            return list(zip(reversed(self.keys[start:high]), reversed(self.messages[start:high])))
+        end = min(high, low + count)
+        return list(zip(self.keys[low:end], self.messages[low:end]))
+
+
+class MemoryStorage(StorageBackend):
+    """
+    Storage backend that keeps everything in process memory
+    
+    History queries are binary searches over sorted indexes: one over all
+    messages, one over broadcasts and one per sender and recipient.
+    Nothing survives the process, which suits ephemeral rooms, tests and
+    benchmarks.
+    """
+    def __init__(self):
+        """Initialize empty storage"""
+        self._lock = threading.RLock()
+        
+        # Messages
+        self._message_ids: Set[str] = set()
+        self._all = _SortedIndex()
+        self._broadcasts = _SortedIndex()
+        self._by_sender: Dict[str, _SortedIndex] = {}
+        self._by_recipient: Dict[str, _SortedIndex] = {}
+        
+        # Users: username -> (user_id, username, display_name, email, status, last_seen_us)
+        self._users: Dict[str, Tuple[Any, ...]] = {}
+        self._auth: Dict[str, Tuple[str, str]] = {}
+        
+        # Sessions: session_id -> [username, created_us, expires_us, is_active, last_activity_us]
+        self._sessions: Dict[str, List[Any]] = {}
+        
+        self._conversations = ConversationIndex()
+    
+    def save_message(self, message: Message) -> None:
+        """
+        Save a message
+        
+        Args:
+            message: The message to save
+        
+        Raises:
+            ValueError: If a message with the same ID exists
+        """
+        self.save_messages([message])
+    
+    def save_messages(self, messages: List[Message]) -> None:
+        """
+        Save a batch of messages atomically
+        
+        Args:
+            messages: The messages to save
+        
+        Raises:
+            ValueError: If any message ID already exists (nothing is saved)
+        """
+        with self._lock:
+            seen: Set[str] = set()
+            for message in messages:
+                if message.msg_id in self._message_ids or message.msg_id in seen:
+                    raise ValueError(f"Duplicate message ID '{message.msg_id}'")
+                seen.add(message.msg_id)
+            
+            for message in messages:
+                self._insert_message(message)
+    
+    def _insert_message(self, message: Message) -> None:
+        """Add a message to every index it belongs to"""
+        key = message_key(message.timestamp_us, message.msg_id)
+        self._message_ids.add(message.msg_id)
+        self._all.insert(key, message)
+        
+        if message.recipient is None:
+            self._broadcasts.insert(key, message)
+            return
+        
+        self._by_sender.setdefault(message.sender, _SortedIndex()).insert(key, message)
+        self._by_recipient.setdefault(message.recipient, _SortedIndex()).insert(key, message)
+        self._conversations.add(message)
+    
+    def get_message_page(self, limit: int = 100, recipient: Optional[str] = None,
+                         before: Optional[MessageCursor] = None,
+                         after: Optional[MessageCursor] = None) -> MessagePage:
+        """
+        Retrieve a page of messages using keyset pagination
+        
+        Args:
+            limit: Maximum number of messages on the page
+            recipient: Only include broadcasts and private messages to or
+                from this user (None for all messages)
+            before: Cursor the page must end before
+            after: Cursor the page must start after
+        
+        Returns:
+            MessagePage with messages in chronological order
+        """
+        descending = after is None or before is not None
+        before_key = cursor_key(before) if before is not None else None
+        after_key = cursor_key(after) if after is not None else None
+        
+        # Fetch one extra message to learn whether the history continues
+        fetch = limit + 1
+        
+        with self._lock:
+            if recipient is None:
+                entries = self._all.range(fetch, descending, before_key, after_key)
+            else:
+                indexes = [self._broadcasts]
+                for index in (self._by_recipient.get(recipient), self._by_sender.get(recipient)):
+                    if index is not None:
+                        indexes.append(index)
+                ranges = [index.range(fetch, descending, before_key, after_key) for index in indexes]
+                
+                # A message to oneself is in both the sender and recipient index
+                entries = []
+                seen: Set[str] = set()
+                for key, message in heapq.merge(*ranges, key=lambda entry: entry[0],
+                                                reverse=descending):
+                    if message.msg_id not in seen:
+                        seen.add(message.msg_id)
+                        entries.append((key, message))
+                        if len(entries) == fetch:
+                            break
+        
+        return make_message_page([message for _, message in entries], limit, descending, after)
+    
+    def search_messages(self, query: str, username: Optional[str] = None, limit: int = 20,
+                        cursor: Optional[int] = None) -> SearchPage:
+        """
+        Search message content, newest matches first
+        
+        Scans every message; all words must appear and the last word may
+        match as a prefix.
+        
+        Args:
+            query: Words to search for
+            username: Only include messages this user may see (None for all)
+            limit: Maximum number of results on the page
+            cursor: Cursor returned with the previous page
+        
+        Returns:
+            SearchPage of matching messages
+        """
+        with self._lock:
+            return search_scan(reversed(self._all.messages), query, username, limit, cursor)
+    
+    def save_user(self, user: 'User', password_hash: Optional[str] = None,
+                  password_salt: Optional[str] = None, replace: bool = True) -> None:
+        """
+        Save a user
+        
+        Args:
+            user: The user to save
+            password_hash: Optional password hash
+            password_salt: Optional password salt
+            replace: False to only create a new user
+        
+        Raises:
+            ValueError: If replace is False and the username is taken
+        """
+        with self._lock:
+            if not replace and user.username in self._users:
+                raise ValueError(f"Username '{user.username}' is already taken")
+            if not user.user_id:
+                user.user_id = str(uuid.uuid4())
+            self._users[user.username] = self._user_row(user)
+            if password_hash and password_salt:
+                self._auth[user.username] = (password_hash, password_salt)
+    
+    def update_user(self, user: 'User') -> None:
+        """
+        Update a user
+        
+        Args:
+            user: The user to update
+        """
+        with self._lock:
+            stored = self._users.get(user.username)
+            if stored is not None:
+                self._users[user.username] = (stored[0],) + self._user_row(user)[1:]
+    
+    def _user_row(self, user: 'User') -> Tuple[Any, ...]:
+        """Snapshot a user in the row layout of User.from_rows"""
+        return (user.user_id, user.username, user.display_name, user.email,
+                user.status, user.last_seen_us)
+    
+    def get_user(self, username: str) -> Optional['User']:
+        """
+        Get a user by username
+        
+        Args:
+            username: The username to look up
+        
+        Returns:
+            User object if found, None otherwise
+        """
+        # Import here to avoid circular import
+        from pychat.core.user import User
+        
+        row = self._users.get(username)
+        return User.from_rows([row])[0] if row else None
+    
+    def get_users(self, status: Optional[str] = None) -> List['User']:
+        """
+        Get all users
+        
+        Args:
+            status: Optional filter by status
+        
+        Returns:
+            List of User objects
+        """
+        # Import here to avoid circular import
+        from pychat.core.user import User
+        
+        with self._lock:
+            rows = [row for row in self._users.values() if status is None or row[4] == status]
+        return User.from_rows(rows)
+    
+    def user_exists(self, username: str) -> bool:
+        """
+        Check if a user exists
+        
+        Args:
+            username: The username to check
+        
+        Returns:
+            True if user exists, False otherwise
+        """
+        return username in self._users
+    
+    def get_users_by_name(self, usernames: Iterable[str]) -> List['User']:
+        """
+        Get several users by username in one lookup
+        
+        Args:
+            usernames: The usernames to look up
+        
+        Returns:
+            The users found, in no particular order (unknown names are skipped)
+        """
+        # Import here to avoid circular import
+        from pychat.core.user import User
+        
+        with self._lock:
+            rows = [self._users[username] for username in set(usernames) if username in self._users]
+        return User.from_rows(rows)
+    
+    def get_user_auth_data(self, username: str) -> Dict[str, str]:
+        """
+        Get authentication data for a user
+        
+        Args:
+            username: The username to look up
+        
+        Returns:
+            Dictionary with 'password_hash' and 'password_salt'
+        """
+        auth = self._auth.get(username)
+        if not auth:
+            return {}
+        return {'password_hash': auth[0], 'password_salt': auth[1]}
+    
+    def create_session(self, username: str, expires_in: int = 86400) -> str:
+        """
+        Create a new session for a user
+        
+        Args:
+            username: The username to create a session for
+            expires_in: Session duration in seconds (default: 24 hours)
+        
+        Returns:
+            Session ID
+        """
+        session_id = str(uuid.uuid4())
+        created_at = datetime.datetime.now()
+        expires_at = created_at + datetime.timedelta(seconds=expires_in)
+        with self._lock:
+            self._sessions[session_id] = [
+                username, to_epoch_micros(created_at), to_epoch_micros(expires_at), True, None
+            ]
+        return session_id
+    
+    def validate_session(self, session_id: str) -> Optional[str]:
+        """
+        Validate a session and return the associated username
+        
+        Args:
+            session_id: The session ID to validate
+        
+        Returns:
+            Username if session is valid, None otherwise
+        """
+        session = self._sessions.get(session_id)
+        if not session or not session[3]:
+            return None
+        if session[2] <= to_epoch_micros(datetime.datetime.now()):
+            return None
+        return session[0]
+    
+    def invalidate_session(self, session_id: str) -> None:
+        """
+        Invalidate a session
+        
+        Args:
+            session_id: The session ID to invalidate
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session:
+                session[3] = False
+    
+    def get_active_sessions(self) -> List[Tuple[str, str, int]]:
+        """
+        Get every session that is active and not expired
+        
+        Returns:
+            List of (session_id, username, expires_at_us) tuples
+        """
+        now = to_epoch_micros(datetime.datetime.now())
+        with self._lock:
+            return [(session_id, session[0], session[2])
+                    for session_id, session in self._sessions.items()
+                    if session[3] and session[2] > now]
+    
+    def update_sessions(self, updates: List[Tuple[str, int, bool]]) -> None:
+        """
+        Record activity and invalidation of sessions
+        
+        Args:
+            updates: (session_id, last_activity_us, is_active) tuples
+        """
+        with self._lock:
+            for session_id, last_activity, is_active in updates:
+                session = self._sessions.get(session_id)
+                if session:
+                    session[3] = is_active
+                    session[4] = last_activity
+    
+    def purge_sessions(self, batch_size: int = 1000) -> int:
+        """
+        Delete one batch of expired or invalidated sessions
+        
+        Args:
+            batch_size: Maximum number of sessions to delete
+        
+        Returns:
+            Number of sessions deleted (0 when there is nothing to do)
+        """
+        now = to_epoch_micros(datetime.datetime.now())
+        with self._lock:
+            stale = [session_id for session_id, session in self._sessions.items()
+                     if not session[3] or session[2] <= now][:batch_size]
+            for session_id in stale:
+                del self._sessions[session_id]
+        return len(stale)
+    
+    def get_conversation_summaries(self, username: str) -> List[ConversationSummary]:
+        """
+        Get summaries of a user's private conversations, most recent first
+        
+        Args:
+            username: The username to look up conversations for
+        
+        Returns:
+            List of ConversationSummary objects for partners that still exist
+        """
+        # Import here to avoid circular import
+        from pychat.core.user import User
+        
+        with self._lock:
+            entries = [(self._users.get(entry[0]), entry)
+                       for entry in self._conversations.entries(username)]
+        entries = [(row, entry) for row, entry in entries if row is not None]
+        
+        users = User.from_rows(row for row, _ in entries)
+        return [
+            ConversationSummary(
+                user=user,
+                last_message_time=from_epoch_micros(last_message_us),
+                last_sender=last_sender,
+                last_message_preview=preview,
+                message_count=count
+            )
+            for user, (_, (_, last_message_us, last_sender, preview, count)) in zip(users, entries)
+        ]
+    
+    def get_private_conversations(self, username: str) -> List[Tuple[str, datetime.datetime]]:
+        """
+        Get a list of users that the given user has had private conversations with
+        
+        Args:
+            username: The username to look up conversations for
+        
+        Returns:
+            List of tuples (username, last_message_time)
+        """
+        with self._lock:
+            entries = self._conversations.entries(username)
+        return [(entry[0], from_epoch_micros(entry[1])) for entry in entries]
@@ -0,0 +1,583 @@
+"""
+Versioned schema migrations for the PyChat SQLite database
+"""
+import datetime
+import sqlite3
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+from pychat.common.message import encode_message_id
+
+
+# Rows touched per transaction by batched migration steps
+DEFAULT_BATCH_SIZE = 5000
+
+
+class Migration:
+    """
+    A single schema change
+    
+    Statements run one per transaction so that each write lock is held
+    only for that statement; a list of statements runs as one transaction.
+    Batch steps are called repeatedly, each call in its own transaction,
+    until they report that no rows were left. A batch step must be
+    resumable: it is re-run from the start if the process stops before
+    the migration is recorded.
+    """
+    def __init__(self, version: int, description: str,
+                 statements: Sequence[Union[str, Sequence[str]]] = (),
+                 batch_steps: Sequence[Callable[[sqlite3.Connection, int], int]] = (),
+                 condition: Optional[Callable[[sqlite3.Connection], bool]] = None):
+        """
+        Initialize a migration
+        
+        Args:
+            version: Schema version reached once this migration is applied
+            description: Short human-readable description
+            statements: SQL statements (or lists of statements that must be
+                applied atomically) to execute, in order
+            batch_steps: Functions called as step(conn, batch_size) that
+                process one batch and return the number of rows handled
+            condition: Optional check; when it returns False the migration
+                is skipped and retried the next time the database is opened
+        """
+        self.version = version
+        self.description = description
+        self.statements = list(statements)
+        self.batch_steps = list(batch_steps)
+        self.condition = condition
+
+
+def fts5_available(conn: sqlite3.Connection) -> bool:
+    """
+    Check whether the SQLite library was built with FTS5
+    
+    Args:
+        conn: Database connection
+    
+    Returns:
+        True if FTS5 virtual tables can be created
+    """
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+# An FTS5 row exists for a message once the trigger below has indexed it
+# (rowid above the backfill high-water mark) or the backfill has reached it
+_FTS_INDEXED = """(
+    old.rowid > (SELECT CAST(value AS INTEGER) FROM storage_meta WHERE key = 'fts_backfill_upto')
+    OR old.rowid <= (SELECT CAST(value AS INTEGER) FROM storage_meta WHERE key = 'fts_backfill_cursor')
+)"""
+
+
+# Characters of the last message kept in the conversation summary
+CONVERSATION_PREVIEW_LENGTH = 100
+
+# Folds one private message into its conversations row. The source must
+# provide sender, recipient, timestamp and content columns.
+_CONVERSATION_UPSERT = f"""
+INSERT INTO conversations
+    (user_a, user_b, last_message_at, last_sender, last_preview, message_count)
+SELECT
+    MIN(sender, recipient), MAX(sender, recipient), timestamp, sender,
+    SUBSTR(content, 1, {CONVERSATION_PREVIEW_LENGTH}), 1
+FROM {{source}}
+ON CONFLICT (user_a, user_b) DO UPDATE SET
+    message_count = message_count + 1,
+    last_message_at = MAX(last_message_at, excluded.last_message_at),
+    last_sender = CASE WHEN excluded.last_message_at >= last_message_at
+                       THEN excluded.last_sender ELSE last_sender END,
+    last_preview = CASE WHEN excluded.last_message_at >= last_message_at
+                        THEN excluded.last_preview ELSE last_preview END
+"""
+
+
+def _backfill_conversations(conn: sqlite3.Connection, batch_size: int) -> int:
+    """
+    Fold one batch of private messages saved before the conversations
+    table existed into their summaries
+    
+    Args:
+        conn: Database connection (inside a transaction)
+        batch_size: Maximum number of messages to process
+    
+    Returns:
+        Number of messages processed
+    """
+    progress = dict(conn.execute(
+        "SELECT key, CAST(value AS INTEGER) FROM storage_meta "
+        "WHERE key IN ('conversations_backfill_cursor', 'conversations_backfill_upto')"
+    ).fetchall())
+    position = progress.get('conversations_backfill_cursor', 0)
+    upto = progress.get('conversations_backfill_upto', 0)
+    if position >= upto:
+        return 0
+    
+    last, count = conn.execute(
+        "SELECT MAX(rowid), COUNT(*) FROM "
+        "(SELECT rowid FROM messages WHERE rowid > ? AND rowid <= ? ORDER BY rowid LIMIT ?)",
+        (position, upto, batch_size)
+    ).fetchone()
+    if not count:
+        last = upto
+    else:
+        conn.execute(
+            _CONVERSATION_UPSERT.format(source=(
+                "(SELECT * FROM messages WHERE rowid > ? AND rowid <= ? "
+                "AND recipient IS NOT NULL ORDER BY rowid) WHERE true"
+            )),
+            (position, last)
+        )
+    
+    conn.execute(
+        "UPDATE storage_meta SET value = ? WHERE key = 'conversations_backfill_cursor'",
+        (last,)
+    )
+    return count
+
+
+def _iso_to_micros(column: str) -> str:
+    """
+    SQL expression converting an ISO-8601 TEXT timestamp, as written by
+    datetime.isoformat() for naive datetimes, to integer microseconds since
+    the epoch (see pychat.common.utils.to_epoch_micros). Values that are
+    not TEXT, such as NULL or already-converted integers, pass through.
+    """
+    return f"""CASE WHEN typeof({column}) = 'text' THEN
+        CAST(strftime('%s', substr({column}, 1, 19)) AS INTEGER) * 1000000
+        + CASE WHEN substr({column}, 20, 1) = '.'
+               THEN CAST(substr({column}, 21, 6) AS INTEGER) ELSE 0 END
+        ELSE {column} END"""
+
+
+def _rebuild_table(table: str, create_sql: str, columns: Sequence[str],
+                   conversions: Dict[str, str]) -> List[Callable[[sqlite3.Connection, int], int]]:
+    """
+    Build batch steps that move a table to a new definition
+    
+    Changing a column's declared type needs a new table in SQLite. Rows are
+    copied in rowid order, one batch per transaction, keeping their rowids
+    (the full-text index refers to messages by rowid). The last step copies
+    any rows added since, swaps the tables and recreates the indexes and
+    triggers of the old table, all in one transaction. The copy resumes
+    from the rows already in the new table.
+    
+    Args:
+        table: Name of the table to rebuild
+        create_sql: CREATE TABLE IF NOT EXISTS statement with a {table}
+            placeholder for the name
+        columns: Columns to copy
+        conversions: SQL expressions for the columns whose values change
+    
+    Returns:
+        Batch steps for a Migration
+    """
+    staging = f"{table}_rebuild"
+    column_list = ", ".join(columns)
+    select_list = ", ".join(conversions.get(column, column) for column in columns)
+    copy_sql = (
+        f"INSERT INTO {staging} (rowid, {column_list}) "
+        f"SELECT rowid, {select_list} FROM {table} "
+        f"WHERE rowid > (SELECT COALESCE(MAX(rowid), 0) FROM {staging}) ORDER BY rowid"
+    )
+    
+    def copy_batch(conn: sqlite3.Connection, batch_size: int) -> int:
+        conn.execute(create_sql.format(table=staging))
+        return conn.execute(f"{copy_sql} LIMIT ?", (batch_size,)).rowcount
+    
+    def swap(conn: sqlite3.Connection, batch_size: int) -> int:
+        conn.execute(copy_sql)
+        schema = [row[0] for row in conn.execute(
+            "SELECT sql FROM sqlite_master WHERE tbl_name = ? "
+            "AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+            (table,)
+        )]
+        
+        # Other tables' triggers may refer to the table while it is being
+        # replaced; the legacy rename skips re-checking them
+        conn.execute("PRAGMA legacy_alter_table = ON")
+        try:
+            conn.execute(f"DROP TABLE {table}")
+            conn.execute(f"ALTER TABLE {staging} RENAME TO {table}")
+        finally:
+            conn.execute("PRAGMA legacy_alter_table = OFF")
+        
+        for sql in schema:
+            conn.execute(sql)
+        
+        # Runs once: nothing is left to copy afterwards
+        return 0
+    
+    return [copy_batch, swap]
+
+
+def _compact_message_ids(conn: sqlite3.Connection, batch_size: int) -> int:
+    """
+    Re-encode one batch of message IDs stored as UUID text into 16-byte
+    BLOBs (see pychat.common.message.encode_message_id)
+    
+    Args:
+        conn: Database connection (inside a transaction)
+        batch_size: Maximum number of messages to examine
+    
+    Returns:
+        Number of messages examined
+    """
+    position = conn.execute(
+        "SELECT CAST(value AS INTEGER) FROM storage_meta WHERE key = 'message_id_cursor'"
+    ).fetchone()[0]
+    rows = conn.execute(
+        "SELECT rowid, msg_id FROM messages WHERE rowid > ? ORDER BY rowid LIMIT ?",
+        (position, batch_size)
+    ).fetchall()
+    if not rows:
+        return 0
+    
+    updates = []
+    for rowid, msg_id in rows:
+        if isinstance(msg_id, str):
+            encoded = encode_message_id(msg_id)
+            if encoded is not msg_id:
+                updates.append((encoded, rowid))
+    conn.executemany("UPDATE messages SET msg_id = ? WHERE rowid = ?", updates)
+    
+    conn.execute(
+        "UPDATE storage_meta SET value = ? WHERE key = 'message_id_cursor'",
+        (rows[-1][0],)
+    )
+    return len(rows)
+
+
+def _add_session_activity(conn: sqlite3.Connection, batch_size: int) -> int:
+    """
+    Add the last_activity column to sessions unless it is already there
+    
+    Args:
+        conn: Database connection (inside a transaction)
+        batch_size: Unused
+    
+    Returns:
+        0 (a single step)
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(sessions)")]
+    if 'last_activity' not in columns:
+        conn.execute("ALTER TABLE sessions ADD COLUMN last_activity INTEGER")
+    return 0
+
+
+# Indexes serving history pages, by name; bulk imports drop and rebuild them
+MESSAGE_HISTORY_INDEXES: Dict[str, str] = {
+    'idx_messages_timestamp':
+        "CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp, msg_id)",
+    'idx_messages_recipient':
+        "CREATE INDEX IF NOT EXISTS idx_messages_recipient ON messages(recipient, timestamp, msg_id)",
+    'idx_messages_sender':
+        "CREATE INDEX IF NOT EXISTS idx_messages_sender ON messages(sender, timestamp, msg_id)",
+}
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(
+        1,
+        "Add history and session expiry indexes",
+        statements=[
+            *MESSAGE_HISTORY_INDEXES.values(),
+            "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at)",
+        ]
+    ),
+    Migration(
+        2,
+        "Add full-text search index on message content",
+        condition=fts5_available,
+        statements=[
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                content,
+                content='messages',
+                content_rowid='rowid',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+            """,
+            # Existing rows up to the high-water mark are indexed in the
+            # background by Storage.backfill_search_index; the triggers
+            # keep every later insert in sync
+            [
+                """
+                INSERT OR REPLACE INTO storage_meta (key, value)
+                SELECT 'fts_backfill_upto', COALESCE(MAX(rowid), 0) FROM messages
+                """,
+                "INSERT OR REPLACE INTO storage_meta (key, value) VALUES ('fts_backfill_cursor', 0)",
+                """
+                CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+                    INSERT INTO messages_fts (rowid, content) VALUES (new.rowid, new.content);
+                END
+                """,
+                f"""
+                CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages
+                WHEN {_FTS_INDEXED} BEGIN
+                    INSERT INTO messages_fts (messages_fts, rowid, content)
+                    VALUES ('delete', old.rowid, old.content);
+                END
+                """,
+                f"""
+                CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages
+                WHEN {_FTS_INDEXED} BEGIN
+                    INSERT INTO messages_fts (messages_fts, rowid, content)
+                    VALUES ('delete', old.rowid, old.content);
+                    INSERT INTO messages_fts (rowid, content) VALUES (new.rowid, new.content);
+                END
+                """,
+            ],
+        ]
+    ),
+    Migration(
+        3,
+        "Add materialized private conversation summaries",
+        statements=[
+            """
+            CREATE TABLE IF NOT EXISTS conversations (
+                user_a TEXT NOT NULL,
+                user_b TEXT NOT NULL,
+                last_message_at TEXT NOT NULL,
+                last_sender TEXT NOT NULL,
+                last_preview TEXT NOT NULL,
+                message_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_a, user_b)
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_conversations_user_b ON conversations(user_b)",
+            # Messages up to the high-water mark are folded in by the batch
+            # step; the trigger handles every later private message
+            [
+                """
+                INSERT OR REPLACE INTO storage_meta (key, value)
+                SELECT 'conversations_backfill_upto', COALESCE(MAX(rowid), 0) FROM messages
+                """,
+                """
+                INSERT OR REPLACE INTO storage_meta (key, value)
+                VALUES ('conversations_backfill_cursor', 0)
+                """,
+                f"""
+                CREATE TRIGGER IF NOT EXISTS messages_conversations_insert AFTER INSERT ON messages
+                WHEN new.recipient IS NOT NULL BEGIN
+                    {_CONVERSATION_UPSERT.format(source="(SELECT new.sender AS sender, new.recipient AS recipient, new.timestamp AS timestamp, new.content AS content) WHERE true")};
+                END
+                """,
+            ],
+        ],
+        batch_steps=[_backfill_conversations]
+    ),
+    Migration(
+        4,
+        "Store timestamps as integer microseconds since the epoch",
+        batch_steps=[
+            *_rebuild_table(
+                "messages",
+                """
+                CREATE TABLE IF NOT EXISTS {table} (
+                    msg_id TEXT PRIMARY KEY,
+                    content TEXT NOT NULL,
+                    sender TEXT NOT NULL,
+                    recipient TEXT,
+                    timestamp INTEGER NOT NULL
+                )
+                """,
+                ["msg_id", "content", "sender", "recipient", "timestamp"],
+                {"timestamp": _iso_to_micros("timestamp")}
+            ),
+            *_rebuild_table(
+                "users",
+                """
+                CREATE TABLE IF NOT EXISTS {table} (
+                    user_id TEXT PRIMARY KEY,
+                    username TEXT UNIQUE NOT NULL,
+                    display_name TEXT,
+                    email TEXT,
+                    status TEXT DEFAULT 'offline',
+                    last_seen INTEGER
+                )
+                """,
+                ["user_id", "username", "display_name", "email", "status", "last_seen"],
+                {"last_seen": _iso_to_micros("last_seen")}
+            ),
+            *_rebuild_table(
+                "sessions",
+                """
+                CREATE TABLE IF NOT EXISTS {table} (
+                    session_id TEXT PRIMARY KEY,
+                    username TEXT NOT NULL,
+                    created_at INTEGER NOT NULL,
+                    expires_at INTEGER NOT NULL,
+                    is_active INTEGER DEFAULT 1,
+                    FOREIGN KEY (username) REFERENCES users(username)
+                )
+                """,
+                ["session_id", "username", "created_at", "expires_at", "is_active"],
+                {"created_at": _iso_to_micros("created_at"),
+                 "expires_at": _iso_to_micros("expires_at")}
+            ),
+            *_rebuild_table(
+                "conversations",
+                """
+                CREATE TABLE IF NOT EXISTS {table} (
+                    user_a TEXT NOT NULL,
+                    user_b TEXT NOT NULL,
+                    last_message_at INTEGER NOT NULL,
+                    last_sender TEXT NOT NULL,
+                    last_preview TEXT NOT NULL,
+                    message_count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (user_a, user_b)
+                )
+                """,
+                ["user_a", "user_b", "last_message_at", "last_sender",
+                 "last_preview", "message_count"],
+                {"last_message_at": _iso_to_micros("last_message_at")}
+            ),
+        ]
+    ),
+    Migration(
+        5,
+        "Store UUID message IDs as 16-byte BLOBs",
+        statements=[
+            "INSERT OR REPLACE INTO storage_meta (key, value) VALUES ('message_id_cursor', 0)",
+        ],
+        batch_steps=[_compact_message_ids]
+    ),
+    Migration(
+        6,
+        "Record session activity",
+        batch_steps=[_add_session_activity]
+    ),
+    Migration(
+        7,
+        "Index invalidated sessions for purging",
+        statements=[
+            "CREATE INDEX IF NOT EXISTS idx_sessions_inactive ON sessions(expires_at) WHERE is_active = 0",
+        ]
+    ),
+]
+
+
+def _ensure_migration_tables(conn: sqlite3.Connection) -> None:
+    """Create the bookkeeping tables used by migrations and background jobs"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TEXT NOT NULL
+    )
+    ''')
+    
+    # Key/value progress markers for resumable background work
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS storage_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )
+    ''')
+    conn.commit()
+
+
+def get_applied_versions(conn: sqlite3.Connection) -> List[int]:
+    """
+    Get the versions of all applied migrations
+    
+    Args:
+        conn: Database connection
+    
+    Returns:
+        Sorted list of applied versions
+    """
+    _ensure_migration_tables(conn)
+    return [row[0] for row in conn.execute("SELECT version FROM schema_migrations ORDER BY version")]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """
+    Get the current schema version of a database
+    
+    Args:
+        conn: Database connection
+    
+    Returns:
+        Highest applied migration version (0 if none)
+    """
+    _ensure_migration_tables(conn)
+    row = conn.execute("SELECT MAX(version) FROM schema_migrations").fetchone()
+    return row[0] or 0
+
+
+def run_migrations(conn: sqlite3.Connection, migrations: Optional[List[Migration]] = None,
+                   batch_size: int = DEFAULT_BATCH_SIZE, pause: float = 0.0) -> List[int]:
+    """
+    Apply all pending migrations
+    
+    Args:
+        conn: Database connection
+        migrations: Migrations to consider (default: MIGRATIONS)
+        batch_size: Rows processed per transaction by batch steps
+        pause: Seconds to sleep between transactions so other writers
+            can take the lock
+    
+    Returns:
+        Versions that were applied, in order
+    """
+    if migrations is None:
+        migrations = MIGRATIONS
+    
+    done = set(get_applied_versions(conn))
+    applied = []
+    
+    for migration in sorted(migrations, key=lambda m: m.version):
+        if migration.version in done:
+            continue
+        if migration.condition is not None and not migration.condition(conn):
+            continue
+        
+        for statement in migration.statements:
+            group = [statement] if isinstance(statement, str) else list(statement)
+            _run_in_transaction(conn, lambda: [conn.execute(sql) for sql in group])
+            if pause:
+                time.sleep(pause)
+        
+        for step in migration.batch_steps:
+            while True:
+                processed = _run_in_transaction(conn, lambda: step(conn, batch_size))
+                if not processed:
+                    break
+                if pause:
+                    time.sleep(pause)
+        
+        # OR IGNORE: another process may have applied it concurrently
+        _run_in_transaction(conn, lambda: conn.execute(
+            "INSERT OR IGNORE INTO schema_migrations (version, description, applied_at) VALUES (?, ?, ?)",
+            (migration.version, migration.description, datetime.datetime.now().isoformat())
+        ))
+        applied.append(migration.version)
+    
+    return applied
+
+
+def _run_in_transaction(conn: sqlite3.Connection, work: Callable[[], object]) -> object:
+    """
+    Run work inside an immediate transaction
+    
+    Args:
+        conn: Database connection
+        work: Callable performing the statements
+    
+    Returns:
+        The value returned by work
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        result = work()
+        conn.commit()
+        return result
+    except Exception:
+        conn.rollback()
+        raise
@@ -0,0 +1,120 @@
+"""
+Concurrent session bookkeeping for PyChat
+"""
+import threading
+import zlib
+from typing import Any, Hashable, List, Optional, Tuple
+
+
+# Number of locks shared out among usernames
+DEFAULT_LOCK_STRIPES = 64
+
+_MISSING = object()
+
+
+class LockStripes:
+    """
+    A fixed set of locks shared out among keys by hash
+    
+    Operations on the same key always take the same lock, so they are
+    serialized, while operations on different keys usually take
+    different locks and run in parallel. Memory stays constant however
+    many keys there are.
+    """
+    def __init__(self, count: int = DEFAULT_LOCK_STRIPES):
+        """
+        Initialize the locks
+        
+        Args:
+            count: Number of locks
+        """
+        self._locks: List[threading.RLock] = [threading.RLock() for _ in range(max(1, count))]
+    
+    def for_key(self, key: str) -> threading.RLock:
+        """
+        Get the lock guarding a key
+        
+        Args:
+            key: The key (such as a username)
+        
+        Returns:
+            The lock; the same key always maps to the same lock
+        """
+        # crc32 rather than hash() so the stripe does not change per process
+        return self._locks[zlib.crc32(key.encode('utf-8')) % len(self._locks)]
+    
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+class SessionMap(dict):
+    """
+    A dict of sessions that hands out read-only snapshots of its values
+    
+    Every change drops the cached snapshot, and the next call to snapshot
+    copies the values once and shares that copy with every reader until
+    the map changes again. Iterating a snapshot never sees the map change
+    underneath it, and readers take no lock unless a copy has to be
+    made. Changes to the map itself are single dict operations; callers
+    that change several related entries together hold their own lock.
+    """
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Tuple[Any, ...]] = None
+    
+    def snapshot(self) -> Tuple[Any, ...]:
+        """
+        Get the values of the map as of now
+        
+        Returns:
+            A tuple of the values, shared between callers until the next change
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None:
+                    snapshot = self._snapshot = tuple(dict.values(self))
+        return snapshot
+    
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            dict.__setitem__(self, key, value)
+            self._snapshot = None
+    
+    def __delitem__(self, key: Hashable) -> None:
+        with self._lock:
+            dict.__delitem__(self, key)
+            self._snapshot = None
+    
+    def pop(self, key: Hashable, default: Any = _MISSING) -> Any:
+        with self._lock:
+            if default is _MISSING:
+                value = dict.pop(self, key)
+            else:
+                value = dict.pop(self, key, default)
+            self._snapshot = None
+        return value
+    
+    def popitem(self) -> Tuple[Hashable, Any]:
+        with self._lock:
+            item = dict.popitem(self)
+            self._snapshot = None
+        return item
+    
+    def setdefault(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = dict.setdefault(self, key, default)
+            self._snapshot = None
+        return value
+    
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        with self._lock:
+            dict.update(self, *args, **kwargs)
+            self._snapshot = None
+    
+    def clear(self) -> None:
+        with self._lock:
+            dict.clear(self)
+            self._snapshot = None
@@ -0,0 +1,189 @@
+"""
+In-memory session registry for PyChat
+"""
+import datetime
+import threading
+from typing import Dict, Optional, Tuple
+
+from pychat.common.utils import to_epoch_micros
+from pychat.core.storage_backend import StorageBackend
+
+
+# Lifetime of a new session in seconds
+DEFAULT_SESSION_LIFETIME = 86400
+
+
+def _now_us() -> int:
+    """Get the current time in microseconds since the epoch"""
+    return to_epoch_micros(datetime.datetime.now())
+
+
+class SessionRegistry:
+    """
+    The set of valid sessions, kept in memory
+    
+    The registry is loaded from the backend's active, unexpired sessions
+    when it starts and is the source of truth from then on: validating a
+    session never touches storage. New sessions are written through so a
+    login is durable at once. Activity and invalidation are recorded in
+    memory and written back in batches by flush, which ChatManager runs
+    as a maintenance job.
+    """
+    def __init__(self, storage: StorageBackend):
+        """
+        Initialize an empty registry
+        
+        Args:
+            storage: Backend holding the sessions table
+        """
+        self.storage = storage
+        self._lock = threading.Lock()
+        
+        # session_id -> (username, expires_at_us)
+        self._sessions: Dict[str, Tuple[str, int]] = {}
+        
+        # session_id -> (last_activity_us, is_active) not yet written back
+        self._dirty: Dict[str, Tuple[int, bool]] = {}
+    
+    def load(self) -> int:
+        """
+        Load the active sessions from storage
+        
+        Returns:
+            Number of sessions loaded
+        """
+        rows = self.storage.get_active_sessions()
+        with self._lock:
+            for session_id, username, expires_us in rows:
+                self._sessions[session_id] = (username, expires_us)
+        return len(rows)
+    
+    def create(self, username: str, expires_in: int = DEFAULT_SESSION_LIFETIME) -> str:
+        """
+        Create a session in storage and register it
+        
+        Args:
+            username: The user the session belongs to
+            expires_in: Session lifetime in seconds
+        
+        Returns:
+            The new session ID
+        """
+        expires_us = _now_us() + expires_in * 1000000
+        session_id = self.storage.create_session(username, expires_in)
+        self.add(session_id, username, expires_us)
+        return session_id
+    
+    def add(self, session_id: str, username: str, expires_us: int) -> None:
+        """
+        Register a session that already exists in storage
+        
+        Args:
+            session_id: The session ID
+            username: The user the session belongs to
+            expires_us: Expiry time in microseconds since the epoch
+        """
+        with self._lock:
+            self._sessions[session_id] = (username, expires_us)
+    
+    def validate(self, session_id: str) -> Optional[str]:
+        """
+        Look up the user of a valid session
+        
+        Args:
+            session_id: The session ID
+        
+        Returns:
+            The username, or None if the session is unknown, invalidated
+            or expired
+        """
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        if entry[1] <= _now_us():
+            with self._lock:
+                self._sessions.pop(session_id, None)
+            return None
+        return entry[0]
+    
+    def touch(self, session_id: str) -> None:
+        """
+        Record activity on a session
+        
+        Args:
+            session_id: The session ID
+        """
+        with self._lock:
+            if session_id in self._sessions:
+                self._dirty[session_id] = (_now_us(), True)
+    
+    def invalidate(self, session_id: str) -> None:
+        """
+        Invalidate a session; storage is updated by the next flush
+        
+        Args:
+            session_id: The session ID
+        """
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._dirty[session_id] = (_now_us(), False)
+    
+    def flush(self) -> int:
+        """
+        Write recorded activity and invalidations to storage
+        
+        Returns:
+            Number of sessions written
+        """
+        with self._lock:
+            if not self._dirty:
+                return 0
+            dirty, self._dirty = self._dirty, {}
+        
+        try:
+            self.storage.update_sessions(
+                [(session_id, last_activity, is_active)
+                 for session_id, (last_activity, is_active) in dirty.items()]
+            )
+        except Exception:
+            # Keep the changes for the next attempt unless newer ones exist
+            with self._lock:
+                for session_id, state in dirty.items():
+                    self._dirty.setdefault(session_id, state)
+            raise
+        return len(dirty)
+    
+    def prune(self) -> int:
+        """
+        Forget sessions that have expired
+        
+        Expired sessions are otherwise only dropped when they are looked
+        up again, which a client that never comes back never does.
+        ChatManager runs this together with the purge of the sessions table.
+        
+        Returns:
+            Number of sessions removed
+        """
+        now_us = _now_us()
+        with self._lock:
+            expired = [session_id for session_id, (_, expires_us) in self._sessions.items()
+                       if expires_us <= now_us]
+            for session_id in expired:
+                del self._sessions[session_id]
+        return len(expired)
+    
+    def pending_count(self) -> int:
+        """
+        Get the number of sessions with changes not yet written back
+        
+        Returns:
+            Number of dirty sessions
+        """
+        with self._lock:
+            return len(self._dirty)
+    
+    def __contains__(self, session_id: str) -> bool:
+        return self.validate(session_id) is not None
+    
+    def __len__(self) -> int:
+        return len(self._sessions)
@@ -4,43 +4,575 @@ Storage module for PyChat
 import os
 import sqlite3
 import datetime
+import threading
+import time
 import uuid
-from typing import List, Optional, Dict, Any, Tuple, TYPE_CHECKING
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, List, Optional, Dict, Any, Tuple, Union, TYPE_CHECKING
 
-from pychat.common.message import Message
-from pychat.common.utils import get_app_data_dir, ensure_directory
+from pychat.common.message import (
+    ConversationSummary, Message, MessageCursor, MessagePage, SearchPage,
+    encode_message_id
+)
+from pychat.common.utils import (
+    BloomFilter, ensure_directory, from_epoch_micros, get_app_data_dir, iter_batches,
+    to_epoch_micros
+)
+from pychat.core.archive import MessageArchive, archive_month
+from pychat.core.migrations import MESSAGE_HISTORY_INDEXES, run_migrations
+from pychat.core.storage_backend import StorageBackend, make_message_page
 
 if TYPE_CHECKING:
     from pychat.core.user import User
 
 
-class Storage:
+class StorageProfile:
     """
-    Handles persistent storage for messages and user profiles
+    SQLite connection tuning applied by Storage at connect time
     """
-    def __init__(self, db_path: Optional[str] = None):
+    def __init__(self, name: str, journal_mode: str = 'wal', synchronous: str = 'normal',
+                 cache_size_kib: int = 16384, mmap_size: int = 64 * 1024 * 1024,
+                 temp_store: str = 'memory', busy_timeout_ms: int = 5000):
+        """
+        Initialize a storage profile
+        
+        Args:
+            name: Name of the profile
+            journal_mode: SQLite journal mode (wal, delete, truncate, ...)
+            synchronous: SQLite synchronous level (off, normal, full, extra)
+            cache_size_kib: Page cache size in KiB (0 keeps the SQLite default)
+            mmap_size: Bytes of the database to memory-map (0 disables mmap)
+            temp_store: Where temporary tables and indexes live (default, file, memory)
+            busy_timeout_ms: How long to wait on a locked database before failing
+        """
+        self.name = name
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.cache_size_kib = cache_size_kib
+        self.mmap_size = mmap_size
+        self.temp_store = temp_store
+        self.busy_timeout_ms = busy_timeout_ms
+    
+    def pragmas(self) -> List[Tuple[str, Any]]:
+        """
+        Get the pragma statements for this profile
+        
+        Returns:
+            List of (pragma, value) tuples in the order they should be applied
+        """
+        pragmas: List[Tuple[str, Any]] = [
+            ('busy_timeout', self.busy_timeout_ms),
+            ('journal_mode', self.journal_mode),
+            ('synchronous', self.synchronous),
+            ('temp_store', self.temp_store),
+            ('mmap_size', self.mmap_size),
+        ]
+        if self.cache_size_kib:
+            # A negative cache_size is interpreted by SQLite as KiB instead of pages
+            pragmas.append(('cache_size', -self.cache_size_kib))
+        return pragmas
+    
+    def apply(self, conn: sqlite3.Connection) -> None:
+        """
+        Apply the profile to a connection
+        
+        Args:
+            conn: The connection to configure
+        """
+        for pragma, value in self.pragmas():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+
+
+# Built-in profiles, selectable by name
+STORAGE_PROFILES: Dict[str, StorageProfile] = {
+    # SQLite defaults: rollback journal and a full fsync on every commit
+    'compat': StorageProfile('compat', journal_mode='delete', synchronous='full',
+                             cache_size_kib=0, mmap_size=0, temp_store='default'),
+    # WAL with fsync only at checkpoints; readers never block the writer
+    'balanced': StorageProfile('balanced'),
+    # Larger cache and mmap window for hosts with memory to spare
+    'throughput': StorageProfile('throughput', cache_size_kib=65536,
+                                 mmap_size=256 * 1024 * 1024),
+}
+
+DEFAULT_PROFILE = 'balanced'
+
+
+def get_storage_profile(profile: Optional[Any] = None) -> StorageProfile:
+    """
+    Resolve a storage profile
+    
+    Args:
+        profile: A StorageProfile, a profile name, or None to use the
+            PYCHAT_STORAGE_PROFILE environment variable (default: balanced)
+        
+    Returns:
+        The resolved StorageProfile
+        
+    Raises:
+        ValueError: If the profile name is unknown
+    """
+    if isinstance(profile, StorageProfile):
+        return profile
+    
+    name = profile or os.environ.get('PYCHAT_STORAGE_PROFILE') or DEFAULT_PROFILE
+    if name not in STORAGE_PROFILES:
+        raise ValueError(f"Unknown storage profile '{name}'")
+    return STORAGE_PROFILES[name]
+
+
+def get_retention_days(days: Optional[float] = None) -> Optional[float]:
+    """
+    Resolve the message retention period
+    
+    Args:
+        days: Age in days after which messages are archived, or None to use
+            the PYCHAT_RETENTION_DAYS environment variable (default: never)
+    
+    Returns:
+        The retention period in days, or None to keep all messages hot
+    
+    Raises:
+        ValueError: If the period is not a positive number
+    """
+    if days is None:
+        value = os.environ.get('PYCHAT_RETENTION_DAYS')
+        if not value:
+            return None
+        try:
+            days = float(value)
+        except ValueError:
+            raise ValueError(f"Invalid retention period '{value}'")
+    if days <= 0:
+        raise ValueError(f"Invalid retention period '{days}'")
+    return days
+
+
+# Column order expected by Message.from_rows and User.from_rows
+MESSAGE_COLUMNS = ('msg_id', 'content', 'sender', 'recipient', 'timestamp')
+USER_COLUMNS = ('user_id', 'username', 'display_name', 'email', 'status', 'last_seen')
+
+
+def _column_list(columns: Tuple[str, ...], alias: str = '') -> str:
+    """Format columns for a SELECT list, optionally qualified by a table alias"""
+    prefix = f"{alias}." if alias else ''
+    return ", ".join(prefix + column for column in columns)
+
+
+def _history_query(recipient: Optional[str], conditions: List[str], key_params: List[Any],
+                   descending: bool, fetch: int) -> Tuple[str, List[Any]]:
+    """
+    Build a keyset query over a messages table
+    
+    Args:
+        recipient: Only include messages visible to this user (None for all)
+        conditions: SQL conditions on (timestamp, msg_id)
+        key_params: Parameters of the conditions
+        descending: Walk backwards in time
+        fetch: Maximum number of rows
+    
+    Returns:
+        Tuple of (query, parameters)
+    """
+    direction = "DESC" if descending else "ASC"
+    order = f"ORDER BY timestamp {direction}, msg_id {direction}"
+    columns = _column_list(MESSAGE_COLUMNS)
+    
+    if recipient is None:
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return f"SELECT {columns} FROM messages {where} {order} LIMIT ?", key_params + [fetch]
+    
+    # One index range scan per visibility rule, merged and trimmed;
+    # UNION drops messages matched by more than one rule
+    key_filter = "".join(f" AND {condition}" for condition in conditions)
+    branches = []
+    params: List[Any] = []
+    for rule, rule_params in (("recipient IS NULL", []),
+                              ("recipient = ?", [recipient]),
+                              ("sender = ?", [recipient])):
+        branches.append(
+            f"SELECT * FROM (SELECT {columns} FROM messages WHERE {rule}{key_filter} {order} LIMIT ?)"
+        )
+        params.extend(rule_params + key_params + [fetch])
+    params.append(fetch)
+    return f"SELECT * FROM ({' UNION '.join(branches)}) {order} LIMIT ?", params
+
+
+def _row_key(row: Tuple[Any, ...]) -> Tuple[int, bool, Any]:
+    """Sort key of a message row, ordering msg_ids like SQLite (TEXT before BLOB)"""
+    return (row[4], isinstance(row[0], bytes), row[0])
+
+
+# Reader connections opened by a Storage by default
+DEFAULT_READERS = 4
+
+# Online backups copy this many pages per step and pause this long between steps
+DEFAULT_BACKUP_PAGES = 256
+DEFAULT_BACKUP_SLEEP = 0.005
+
+# In-memory username filter: sizing, and how often a miss may look for
+# users registered through other connections to the database
+USERNAME_FILTER_MIN_CAPACITY = 1024
+USERNAME_FILTER_ERROR_RATE = 0.01
+USERNAME_REFRESH_INTERVAL = 1.0
+
+# Usernames per query when users are looked up in bulk (SQLite limits
+# the number of parameters of one statement)
+USER_LOOKUP_BATCH = 500
+
+
+class ConnectionPool:
+    """
+    SQLite connections for a single database, shared between threads
+    
+    All writes go through one writer connection guarded by a lock, since
+    SQLite allows a single writer at a time anyway. Reads use up to
+    max_readers separate connections; with a WAL journal they run in
+    parallel with each other and with the writer. A thread gets back the
+    reader it used last when that reader is idle, so its page cache stays
+    warm. In-memory databases cannot be shared between connections and use
+    the writer for everything.
+    """
+    def __init__(self, db_path: str, profile: StorageProfile, max_readers: int = DEFAULT_READERS):
+        """
+        Initialize the pool and open the writer connection
+        
+        Args:
+            db_path: Path to the SQLite database
+            profile: Tuning applied to every connection
+            max_readers: Maximum number of reader connections (0 reads on the writer)
+        """
+        self.db_path = db_path
+        self.profile = profile
+        self.max_readers = 0 if db_path == ':memory:' else max_readers
+        
+        self.writer = self._connect()
+        self._write_lock = threading.RLock()
+        self._write_depth = 0
+        self._writer_owner: Optional[int] = None
+        
+        self._readers: List[sqlite3.Connection] = []
+        self._idle: List[sqlite3.Connection] = []
+        self._readers_available = threading.Condition()
+        self._local = threading.local()
+        self.closed = False
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open and configure a connection"""
+        # Connections are handed between threads by the pool
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        self.profile.apply(conn)
+        return conn
+    
+    @contextmanager
+    def write(self) -> Iterator[sqlite3.Connection]:
+        """
+        Run a transaction on the writer connection
+        
+        The transaction is committed when the outermost write block exits
+        and rolled back if it raises. Write blocks nest on the same thread.
+        
+        Yields:
+            The writer connection
+        """
+        with self._write_lock:
+            if self._write_depth:
+                # Part of an enclosing transaction
+                self._write_depth += 1
+                try:
+                    yield self.writer
+                finally:
+                    self._write_depth -= 1
+                return
+            
+            self._write_depth = 1
+            self._writer_owner = threading.get_ident()
+            try:
+                yield self.writer
+                self.writer.commit()
+            except BaseException:
+                self.writer.rollback()
+                raise
+            finally:
+                self._write_depth = 0
+                self._writer_owner = None
+    
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrow a connection for reading
+        
+        Rows must be fetched before the block exits. Inside a write block
+        the writer is used so the transaction sees its own changes.
+        
+        Yields:
+            A reader connection (or the writer, see above)
+        """
+        if self._writer_owner == threading.get_ident() or not self.max_readers:
+            with self._write_lock:
+                yield self.writer
+            return
+        
+        # Nested reads on one thread share its connection
+        current = getattr(self._local, 'current', None)
+        if current is not None:
+            yield current
+            return
+        
+        conn = self._acquire_reader()
+        self._local.current = conn
+        try:
+            yield conn
+        finally:
+            self._local.current = None
+            self._release_reader(conn)
+    
+    def backup(self, target: sqlite3.Connection, pages: int = DEFAULT_BACKUP_PAGES,
+               sleep: float = DEFAULT_BACKUP_SLEEP,
+               progress: Optional[Callable[[int, int], None]] = None) -> int:
+        """
+        Copy the database into another connection a few pages at a time
+        
+        The copy is read through the writer connection, so writes made
+        between steps are carried into the backup instead of restarting it.
+        The writer lock is only held while a step runs and is released
+        during the pause after it, so writers wait for at most one step.
+        Must not be called inside a write block.
+        
+        Args:
+            target: Connection to the destination database
+            pages: Number of pages copied per step
+            sleep: Seconds to pause between steps
+            progress: Optional callback receiving (remaining, total) pages
+        
+        Returns:
+            Number of pages in the database
+        """
+        total_pages = 0
+        
+        def step_done(status: int, remaining: int, total: int) -> None:
+            nonlocal total_pages
+            total_pages = total
+            if progress is not None:
+                progress(remaining, total)
+            if remaining:
+                self._write_lock.release()
+                try:
+                    time.sleep(sleep)
+                finally:
+                    self._write_lock.acquire()
+        
+        with self._write_lock:
+            self.writer.backup(target, pages=pages, progress=step_done)
+        return total_pages
+    
+    def _acquire_reader(self) -> sqlite3.Connection:
+        """Take an idle reader, opening one if the pool is not full yet"""
+        with self._readers_available:
+            while True:
+                if self.closed:
+                    raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+                
+                preferred = getattr(self._local, 'last', None)
+                if preferred is not None and preferred in self._idle:
+                    self._idle.remove(preferred)
+                    return preferred
+                if self._idle:
+                    conn = self._idle.pop()
+                    self._local.last = conn
+                    return conn
+                if len(self._readers) < self.max_readers:
+                    conn = self._connect()
+                    self._readers.append(conn)
+                    self._local.last = conn
+                    return conn
+                
+                self._readers_available.wait()
+    
+    def _release_reader(self, conn: sqlite3.Connection) -> None:
+        """Return a reader to the pool"""
+        with self._readers_available:
+            if self.closed:
+                conn.close()
+                return
+            self._idle.append(conn)
+            self._readers_available.notify()
+    
+    def reader_count(self) -> int:
+        """
+        Get the number of open reader connections
+        
+        Returns:
+            Number of reader connections opened so far
+        """
+        with self._readers_available:
+            return len(self._readers)
+    
+    def close(self) -> None:
+        """Close all connections; readers in use are closed when returned"""
+        with self._readers_available:
+            if self.closed:
+                return
+            self.closed = True
+            for conn in self._idle:
+                conn.close()
+            self._idle.clear()
+            self._readers_available.notify_all()
+        
+        with self._write_lock:
+            self.writer.close()
+
+
+class Storage(StorageBackend):
+    """
+    Handles persistent storage for messages and user profiles in SQLite
+    """
+    def __init__(self, db_path: Optional[str] = None, profile: Optional[Any] = None,
+                 readers: int = DEFAULT_READERS, retention_days: Optional[float] = None,
+                 archive_dir: Optional[str] = None):
         """
         Initialize the storage with a SQLite database
         
         Args:
             db_path: Path to SQLite database (default: ~/.pychat/pychat.db)
+            profile: StorageProfile or profile name (see get_storage_profile)
+            readers: Maximum number of reader connections
+            retention_days: Age after which archive_messages moves messages
+                to the monthly archives (see get_retention_days)
+            archive_dir: Directory of the monthly archives (default: an
+                'archive' directory next to the database; none for an
+                in-memory database)
         """
         if db_path is None:
             app_dir = get_app_data_dir()
             db_path = os.path.join(app_dir, "pychat.db")
         
         self.db_path = db_path
-        ensure_directory(os.path.dirname(db_path))
+        self.profile = get_storage_profile(profile)
+        if db_path != ':memory:':
+            ensure_directory(os.path.dirname(db_path))
         
-        self.conn = sqlite3.connect(db_path)
-        self.conn.row_factory = sqlite3.Row
+        # Shared by the caller threads and the ChatManager worker threads
+        self.pool = ConnectionPool(db_path, self.profile, readers)
+        
+        # The writer connection, for migrations and maintenance
+        self.conn = self.pool.writer
+        
+        # Cold storage for messages past the retention period
+        self.retention_days = get_retention_days(retention_days)
+        if archive_dir is None and db_path != ':memory:':
+            archive_dir = os.path.join(os.path.dirname(db_path), "archive")
+        self.archive = MessageArchive(archive_dir, self.profile) if archive_dir else None
+        self._archived_upto: Optional[int] = None
+        
+        # Usernames known to exist, so unknown names need no query
+        self._usernames = BloomFilter(USERNAME_FILTER_MIN_CAPACITY, USERNAME_FILTER_ERROR_RATE)
+        self._usernames_lock = threading.Lock()
+        self._usernames_rowid = 0
+        self._usernames_checked = 0.0
         
         # Initialize tables
         self._init_db()
     
     def _init_db(self) -> None:
         """Initialize database tables if they don't exist"""
-        cursor = self.conn.cursor()
+        with self.pool.write() as conn:
+            self._create_tables(conn)
+            
+            # Bring indexes and later schema changes up to date
+            run_migrations(conn)
+            
+            # Restore history indexes an interrupted import_messages left dropped
+            for statement in MESSAGE_HISTORY_INDEXES.values():
+                conn.execute(statement)
+            self._load_archive_boundary(conn)
+            self._load_usernames(conn)
+    
+    def _load_archive_boundary(self, conn: sqlite3.Connection) -> None:
+        """Read the timestamp of the newest archived message"""
+        row = conn.execute(
+            "SELECT CAST(value AS INTEGER) FROM storage_meta WHERE key = 'archived_upto'"
+        ).fetchone()
+        self._archived_upto = row[0] if row is not None and self.archive is not None else None
+    
+    def _load_usernames(self, conn: sqlite3.Connection) -> None:
+        """Build the username filter from the users table"""
+        rows = conn.execute("SELECT rowid, username FROM users").fetchall()
+        usernames = BloomFilter(max(USERNAME_FILTER_MIN_CAPACITY, 2 * len(rows)),
+                                USERNAME_FILTER_ERROR_RATE)
+        for row in rows:
+            usernames.add(row[1])
+        
+        with self._usernames_lock:
+            self._usernames = usernames
+            self._usernames_rowid = max((row[0] for row in rows), default=0)
+            self._usernames_checked = time.monotonic()
+    
+    def _add_usernames(self, rows: List[Tuple[int, str]], conn: sqlite3.Connection) -> None:
+        """Add (rowid, username) rows to the username filter, rebuilding it when full"""
+        with self._usernames_lock:
+            for rowid, username in rows:
+                self._usernames.add(username)
+                self._usernames_rowid = max(self._usernames_rowid, rowid)
+            full = len(self._usernames) > self._usernames.capacity
+        if full:
+            self._load_usernames(conn)
+    
+    def _may_exist(self, username: str) -> bool:
+        """
+        Check the username filter before looking a user up
+        
+        A name the filter has not seen may still have been registered by
+        another connection to the database, so at most once per
+        USERNAME_REFRESH_INTERVAL a miss picks up users added since the
+        filter was last updated. Until then such a user is reported
+        missing; registration does not rely on that answer, because
+        save_user(replace=False) is rejected by the UNIQUE constraint.
+        If the largest rowid has shrunk, the table was rewritten (by a
+        restore from another process, for example) and the filter is
+        rebuilt from scratch.
+        
+        Args:
+            username: The username to check
+        
+        Returns:
+            False if no user of that name is known to this connection
+        """
+        if username in self._usernames:
+            return True
+        
+        now = time.monotonic()
+        with self._usernames_lock:
+            if now - self._usernames_checked < USERNAME_REFRESH_INTERVAL:
+                return False
+            self._usernames_checked = now
+            last_rowid = self._usernames_rowid
+        
+        with self.pool.read() as conn:
+            max_rowid = conn.execute("SELECT MAX(rowid) FROM users").fetchone()[0] or 0
+            if max_rowid < last_rowid:
+                self._load_usernames(conn)
+            else:
+                rows = conn.execute(
+                    "SELECT rowid, username FROM users WHERE rowid > ?", (last_rowid,)
+                ).fetchall()
+                if rows:
+                    self._add_usernames([(row[0], row[1]) for row in rows], conn)
+        return username in self._usernames
+    
+    def _create_tables(self, conn: sqlite3.Connection) -> None:
+        """
+        Create the base tables
+        
+        Args:
+            conn: The writer connection
+        """
+        cursor = conn.cursor()
+        
+        # Timestamps are integer microseconds since the epoch
+        # (see pychat.common.utils.to_epoch_micros); UUID message IDs are
+        # stored as 16-byte BLOBs (see encode_message_id)
         
         # Create messages table
         cursor.execute('''
@@ -49,7 +581,7 @@ class Storage:
             content TEXT NOT NULL,
             sender TEXT NOT NULL,
             recipient TEXT,
-            timestamp TEXT NOT NULL
+            timestamp INTEGER NOT NULL
         )
         ''')
         
@@ -61,7 +593,7 @@ class Storage:
             display_name TEXT,
             email TEXT,
             status TEXT DEFAULT 'offline',
-            last_seen TEXT
+            last_seen INTEGER
         )
         ''')
         
@@ -80,14 +612,12 @@ class Storage:
         CREATE TABLE IF NOT EXISTS sessions (
             session_id TEXT PRIMARY KEY,
             username TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            expires_at TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            expires_at INTEGER NOT NULL,
             is_active INTEGER DEFAULT 1,
             FOREIGN KEY (username) REFERENCES users(username)
         )
         ''')
-        
-        self.conn.commit()
     
     def save_message(self, message: Message) -> None:
         """
@@ -96,60 +626,370 @@ class Storage:
         Args:
             message: The message to save
         """
-        cursor = self.conn.cursor()
-        cursor.execute(
-            "INSERT INTO messages (msg_id, content, sender, recipient, timestamp) VALUES (?, ?, ?, ?, ?)",
-            (message.msg_id, message.content, message.sender, message.recipient, message.timestamp.isoformat())
+        with self.pool.write() as conn:
+            conn.execute(
+                "INSERT INTO messages (msg_id, content, sender, recipient, timestamp) VALUES (?, ?, ?, ?, ?)",
+                (encode_message_id(message.msg_id), message.content, message.sender, message.recipient,
+                 message.timestamp_us)
+            )
+    
+    def save_messages(self, messages: List[Message]) -> None:
+        """
+        Save a batch of messages in a single transaction
+        
+        Args:
+            messages: The messages to save
+        """
+        with self.pool.write() as conn:
+            conn.executemany(
+                "INSERT INTO messages (msg_id, content, sender, recipient, timestamp) VALUES (?, ?, ?, ?, ?)",
+                [(encode_message_id(message.msg_id), message.content, message.sender, message.recipient,
+                  message.timestamp_us) for message in messages]
+            )
+    
+    def import_messages(self, messages: Iterable[Message], batch_size: int = 10000,
+                        rebuild_indexes: bool = True) -> int:
+        """
+        Bulk-load a stream of messages
+        
+        Messages are inserted with executemany, one transaction per batch.
+        Messages whose ID is already stored are skipped, so an interrupted
+        import can be run again.
+        
+        Args:
+            messages: The messages to import (consumed lazily)
+            batch_size: Number of messages per transaction
+            rebuild_indexes: Drop the history indexes for the duration of the
+                import and build them once at the end, which is much faster
+                for large imports; history pages fall back to table scans
+                while it runs. If the import is killed, the indexes are
+                rebuilt the next time the database is opened
+        
+        Returns:
+            Number of messages imported
+        """
+        if rebuild_indexes:
+            with self.pool.write() as conn:
+                for name in MESSAGE_HISTORY_INDEXES:
+                    conn.execute(f"DROP INDEX IF EXISTS {name}")
+        
+        total = 0
+        try:
+            for batch in iter_batches(messages, batch_size):
+                with self.pool.write() as conn:
+                    cursor = conn.executemany(
+                        "INSERT OR IGNORE INTO messages (msg_id, content, sender, recipient, timestamp) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        [(encode_message_id(message.msg_id), message.content, message.sender,
+                          message.recipient, message.timestamp_us) for message in batch]
+                    )
+                    total += cursor.rowcount
+        finally:
+            if rebuild_indexes:
+                with self.pool.write() as conn:
+                    for statement in MESSAGE_HISTORY_INDEXES.values():
+                        conn.execute(statement)
+        return total
+    
+    def get_message_page(self, limit: int = 100, recipient: Optional[str] = None,
+                         before: Optional[MessageCursor] = None,
+                         after: Optional[MessageCursor] = None) -> MessagePage:
+        """
+        Retrieve a page of messages using keyset pagination
+        
+        Without cursors the latest messages are returned. With 'before' the
+        page ends just before the cursor; with only 'after' it starts just
+        after it. Each page is an index range scan on (timestamp, msg_id),
+        however far back the cursor points.
+        
+        Args:
+            limit: Maximum number of messages on the page
+            recipient: Only include broadcasts and private messages to or
+                from this user (None for all messages)
+            before: Cursor the page must end before
+            after: Cursor the page must start after
+        
+        Returns:
+            MessagePage with messages in chronological order
+        """
+        # Walk backwards from 'before' (or the end) unless only 'after' is given
+        descending = after is None or before is not None
+        
+        conditions = []
+        key_params: List[Any] = []
+        if before is not None:
+            conditions.append("(timestamp, msg_id) < (?, ?)")
+            key_params.extend(self._cursor_key(before))
+        if after is not None:
+            conditions.append("(timestamp, msg_id) > (?, ?)")
+            key_params.extend(self._cursor_key(after))
+        
+        # Fetch one extra row to learn whether the history continues
+        fetch = limit + 1
+        query, params = _history_query(recipient, conditions, key_params, descending, fetch)
+        rows = self._select_tuples(query, params)
+        
+        # Only pages that reach back past the newest archived message read the archive
+        archived_upto = self._archived_upto
+        if archived_upto is not None:
+            if descending:
+                reaches_archive = len(rows) < fetch or rows[-1][4] <= archived_upto
+            else:
+                reaches_archive = to_epoch_micros(after.timestamp) <= archived_upto
+            if reaches_archive:
+                rows = self._merge_archived(rows, query, params, descending, fetch,
+                                            before, after)
+        
+        return make_message_page(Message.from_rows(rows), limit, descending, after)
+    
+    def _merge_archived(self, rows: List[Tuple[Any, ...]], query: str, params: List[Any],
+                        descending: bool, fetch: int, before: Optional[MessageCursor],
+                        after: Optional[MessageCursor]) -> List[Tuple[Any, ...]]:
+        """
+        Complete a page of hot rows with rows from the monthly archives
+        
+        Months are read nearest the cursor first, and reading stops once
+        they have supplied a full page, since each month only holds older
+        (or newer) messages than the one before it.
+        
+        Args:
+            rows: Rows from the main database in page order
+            query: The history query
+            params: Parameters of the query
+            descending: True if the page walks backwards in time
+            fetch: Number of rows wanted
+            before: Cursor the page must end before
+            after: Cursor the page must start after
+        
+        Returns:
+            Up to fetch rows in page order
+        """
+        months = self.archive.months()
+        if descending:
+            if before is not None:
+                last = archive_month(to_epoch_micros(before.timestamp))
+                months = [month for month in months if month <= last]
+            months.reverse()
+        elif after is not None:
+            first = archive_month(to_epoch_micros(after.timestamp))
+            months = [month for month in months if month >= first]
+        
+        archived: List[Tuple[Any, ...]] = []
+        for month in months:
+            archived.extend(self.archive.select(month, query, params))
+            if len(archived) >= fetch:
+                break
+        
+        # A message being archived right now can be in both databases
+        merged = []
+        seen = set()
+        for row in sorted(rows + archived, key=_row_key, reverse=descending):
+            if row[0] not in seen:
+                seen.add(row[0])
+                merged.append(row)
+                if len(merged) == fetch:
+                    break
+        return merged
+    
+    def archive_messages(self, batch_size: int = 1000) -> int:
+        """
+        Move one batch of messages older than the retention period to the
+        monthly archives
+        
+        Messages are copied into the archive before they are deleted here,
+        so an interrupted batch is simply archived again.
+        
+        Args:
+            batch_size: Maximum number of messages to move
+        
+        Returns:
+            Number of messages archived (0 when there is nothing to do)
+        """
+        if self.retention_days is None or self.archive is None:
+            return 0
+        
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=self.retention_days)
+        rows = self._select_tuples(
+            f"SELECT {_column_list(MESSAGE_COLUMNS)} FROM messages WHERE timestamp < ? "
+            "ORDER BY timestamp, msg_id LIMIT ?",
+            (to_epoch_micros(cutoff), batch_size)
         )
-        self.conn.commit()
+        if not rows:
+            return 0
+        
+        self.archive.store(rows)
+        newest = max(row[4] for row in rows)
+        with self.pool.write() as conn:
+            # Readers must see the archive boundary no later than the deletes
+            conn.execute(
+                "INSERT INTO storage_meta (key, value) VALUES ('archived_upto', ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = "
+                "MAX(CAST(value AS INTEGER), CAST(excluded.value AS INTEGER))",
+                (newest,)
+            )
+            conn.executemany("DELETE FROM messages WHERE msg_id = ?", [(row[0],) for row in rows])
+            self._archived_upto = max(newest, self._archived_upto or newest)
+        return len(rows)
     
-    def get_messages(self, limit: int = 100, recipient: Optional[str] = None) -> List[Message]:
+    @property
+    def search_enabled(self) -> bool:
+        """True if the full-text search index is available"""
+        with self.pool.read() as conn:
+            row = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone()
+        return row is not None
+    
+    def search_messages(self, query: str, username: Optional[str] = None, limit: int = 20,
+                        cursor: Optional[int] = None) -> SearchPage:
         """
-        Retrieve messages from the database
+        Search message content, best matches first
         
         Args:
-            limit: Maximum number of messages to retrieve
-            recipient: Filter messages by recipient (None for all messages)
-            
+            query: Words to search for (the last word also matches as a prefix)
+            username: Only include messages this user may see (None for all)
+            limit: Maximum number of results on the page
+            cursor: Cursor returned with the previous page
+        
         Returns:
-            List of Message objects
+            SearchPage of matching messages
         """
-        cursor = self.conn.cursor()
+        match = self._fts_query(query)
+        if not match:
+            return SearchPage([])
+        
+        offset = cursor or 0
+        params: List[Any] = []
+        visibility = ""
+        if username is not None:
+            visibility = "AND (m.recipient IS NULL OR m.recipient = ? OR m.sender = ?)"
+            params = [username, username]
         
-        if recipient is None:
-            query = """
-            SELECT * FROM messages 
-            ORDER BY timestamp DESC 
-            LIMIT ?
+        if self.search_enabled:
+            query_sql = f"""
+            SELECT {_column_list(MESSAGE_COLUMNS, 'm')} FROM messages_fts
+            JOIN messages m ON m.rowid = messages_fts.rowid
+            WHERE messages_fts MATCH ? {visibility}
+            ORDER BY messages_fts.rank
+            LIMIT ? OFFSET ?
             """
-            cursor.execute(query, (limit,))
+            params = [match] + params
         else:
-            query = """
-            SELECT * FROM messages 
-            WHERE recipient IS NULL OR recipient = ? OR sender = ?
-            ORDER BY timestamp DESC 
-            LIMIT ?
+            # SQLite without FTS5: fall back to a scan, newest first
+            query_sql = f"""
+            SELECT {_column_list(MESSAGE_COLUMNS, 'm')} FROM messages m
+            WHERE m.content LIKE ? ESCAPE '\\' {visibility}
+            ORDER BY m.timestamp DESC
+            LIMIT ? OFFSET ?
             """
-            cursor.execute(query, (recipient, recipient, limit))
+            escaped = query.strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            params = [f"%{escaped}%"] + params
         
-        rows = cursor.fetchall()
-        messages = []
+        # Fetch one extra row to learn whether there is another page
+        params.extend([limit + 1, offset])
         
-        for row in rows:
-            message = Message(
-                content=row['content'],
-                sender=row['sender'],
-                recipient=row['recipient'],
-                msg_id=row['msg_id'],
-                timestamp=datetime.datetime.fromisoformat(row['timestamp'])
+        rows = self._select_tuples(query_sql, params)
+        
+        messages = Message.from_rows(rows[:limit])
+        next_cursor = offset + limit if len(rows) > limit else None
+        return SearchPage(messages, next_cursor)
+    
+    def backfill_search_index(self, batch_size: int = 1000) -> int:
+        """
+        Add one batch of messages saved before search was enabled to the
+        full-text index
+        
+        Args:
+            batch_size: Maximum number of messages to index
+        
+        Returns:
+            Number of messages indexed (0 once the backfill is complete)
+        """
+        if not self.search_enabled:
+            return 0
+        
+        with self.pool.write() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT key, CAST(value AS INTEGER) AS value FROM storage_meta "
+                "WHERE key IN ('fts_backfill_cursor', 'fts_backfill_upto')"
+            )
+            progress = {row['key']: row['value'] for row in cursor.fetchall()}
+            position = progress.get('fts_backfill_cursor', 0)
+            upto = progress.get('fts_backfill_upto', 0)
+            if position >= upto:
+                return 0
+            
+            cursor.execute(
+                "SELECT MAX(rowid) AS last, COUNT(*) AS count FROM "
+                "(SELECT rowid FROM messages WHERE rowid > ? AND rowid <= ? ORDER BY rowid LIMIT ?)",
+                (position, upto, batch_size)
             )
-            messages.append(message)
+            row = cursor.fetchone()
+            count = row['count']
+            # No rows left below the high-water mark: the backfill is done
+            last = row['last'] if count else upto
+            
+            if count:
+                cursor.execute(
+                    "INSERT INTO messages_fts (rowid, content) "
+                    "SELECT rowid, content FROM messages WHERE rowid > ? AND rowid <= ?",
+                    (position, last)
+                )
+            cursor.execute(
+                "UPDATE storage_meta SET value = ? WHERE key = 'fts_backfill_cursor'",
+                (last,)
+            )
+            return count
+    
+    def _fts_query(self, text: str) -> str:
+        """
+        Build an FTS5 query from user input
+        
+        Every word is quoted so punctuation cannot be read as query syntax.
+        Words are combined with AND and the last word matches as a prefix.
+        
+        Args:
+            text: Raw search text
+        
+        Returns:
+            FTS5 MATCH expression (empty if there is nothing to search for)
+        """
+        words = ['"' + word.replace('"', '""') + '"' for word in text.split()]
+        if not words:
+            return ""
+        words[-1] += "*"
+        return " ".join(words)
+    
+    def _cursor_key(self, cursor: MessageCursor) -> Tuple[int, Union[bytes, str]]:
+        """
+        Convert a cursor to the stored (timestamp, msg_id) key
+        
+        Args:
+            cursor: The cursor to convert
+        
+        Returns:
+            Tuple of column values comparable with stored rows
+        """
+        return to_epoch_micros(cursor.timestamp), encode_message_id(cursor.msg_id)
+    
+    def _select_tuples(self, query: str, params: Any = ()) -> List[Tuple[Any, ...]]:
+        """
+        Run a read query returning plain tuples instead of sqlite3.Row
+        objects, for queries whose rows are decoded in bulk
+        
+        Args:
+            query: SQL query
+            params: Query parameters
         
-        # Return in chronological order
-        return list(reversed(messages))
+        Returns:
+            List of row tuples
+        """
+        with self.pool.read() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            return cursor.execute(query, params).fetchall()
     
     def save_user(self, user: 'User', password_hash: Optional[str] = None, 
-                 password_salt: Optional[str] = None) -> None:
+                 password_salt: Optional[str] = None, replace: bool = True) -> None:
         """
         Save a user to the database
         
@@ -157,42 +997,50 @@ class Storage:
             user: The user to save
             password_hash: Optional password hash
             password_salt: Optional password salt
-        """
-        cursor = self.conn.cursor()
-        
-        # Generate user_id if not present
-        if not user.user_id:
-            user.user_id = str(uuid.uuid4())
-        
-        # Save user data
-        cursor.execute(
-            """
-            INSERT OR REPLACE INTO users 
-            (user_id, username, display_name, email, status, last_seen) 
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            (
-                user.user_id,
-                user.username,
-                user.display_name,
-                user.email,
-                user.status,
-                user.last_seen.isoformat() if user.last_seen else None
-            )
-        )
+            replace: False to only create a new user; the UNIQUE constraint
+                on username then rejects a name taken by any connection
         
-        # Save authentication data if provided
-        if password_hash and password_salt:
-            cursor.execute(
-                """
-                INSERT OR REPLACE INTO user_auth
-                (username, password_hash, password_salt)
-                VALUES (?, ?, ?)
-                """,
-                (user.username, password_hash, password_salt)
-            )
-        
-        self.conn.commit()
+        Raises:
+            ValueError: If replace is False and the username is taken
+        """
+        with self.pool.write() as conn:
+            cursor = conn.cursor()
+            
+            # Generate user_id if not present
+            if not user.user_id:
+                user.user_id = str(uuid.uuid4())
+            
+            # Save user data
+            try:
+                cursor.execute(
+                    f"""
+                    INSERT {'OR REPLACE ' if replace else ''}INTO users 
+                    (user_id, username, display_name, email, status, last_seen) 
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        user.user_id,
+                        user.username,
+                        user.display_name,
+                        user.email,
+                        user.status,
+                        user.last_seen_us
+                    )
+                )
+            except sqlite3.IntegrityError:
+                raise ValueError(f"Username '{user.username}' is already taken")
+            self._add_usernames([(cursor.lastrowid, user.username)], conn)
+            
+            # Save authentication data if provided
+            if password_hash and password_salt:
+                cursor.execute(
+                    """
+                    INSERT OR REPLACE INTO user_auth
+                    (username, password_hash, password_salt)
+                    VALUES (?, ?, ?)
+                    """,
+                    (user.username, password_hash, password_salt)
+                )
     
     def update_user(self, user: 'User') -> None:
         """
@@ -201,28 +1049,25 @@ class Storage:
         Args:
             user: The user to update
         """
-        cursor = self.conn.cursor()
-        
-        # Update user data
-        cursor.execute(
-            """
-            UPDATE users SET
-            display_name = ?,
-            email = ?,
-            status = ?,
-            last_seen = ?
-            WHERE username = ?
-            """,
-            (
-                user.display_name,
-                user.email,
-                user.status,
-                user.last_seen.isoformat() if user.last_seen else None,
-                user.username
+        with self.pool.write() as conn:
+            # Update user data
+            conn.execute(
+                """
+                UPDATE users SET
+                display_name = ?,
+                email = ?,
+                status = ?,
+                last_seen = ?
+                WHERE username = ?
+                """,
+                (
+                    user.display_name,
+                    user.email,
+                    user.status,
+                    user.last_seen_us,
+                    user.username
+                )
             )
-        )
-        
-        self.conn.commit()
     
     def get_user(self, username: str) -> Optional['User']:
         """
@@ -234,28 +1079,20 @@ class Storage:
         Returns:
             User object if found, None otherwise
         """
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
-        row = cursor.fetchone()
-        
-        if not row:
+        if not self._may_exist(username):
             return None
         
         # Import here to avoid circular import
         from pychat.core.user import User
         
-        user = User(
-            username=row['username'],
-            display_name=row['display_name'],
-            email=row['email'],
-            status=row['status'],
-            user_id=row['user_id']
+        rows = self._select_tuples(
+            f"SELECT {_column_list(USER_COLUMNS)} FROM users WHERE username = ?", (username,)
         )
         
-        if row['last_seen']:
-            user.last_seen = datetime.datetime.fromisoformat(row['last_seen'])
+        if not rows:
+            return None
         
-        return user
+        return User.from_rows(rows)[0]
     
     def get_users(self, status: Optional[str] = None) -> List['User']:
         """
@@ -267,34 +1104,16 @@ class Storage:
         Returns:
             List of User objects
         """
-        cursor = self.conn.cursor()
-        
-        if status:
-            cursor.execute("SELECT * FROM users WHERE status = ?", (status,))
-        else:
-            cursor.execute("SELECT * FROM users")
-        
-        rows = cursor.fetchall()
-        
         # Import here to avoid circular import
         from pychat.core.user import User
         
-        users = []
-        for row in rows:
-            user = User(
-                username=row['username'],
-                display_name=row['display_name'],
-                email=row['email'],
-                status=row['status'],
-                user_id=row['user_id']
-            )
-            
-            if row['last_seen']:
-                user.last_seen = datetime.datetime.fromisoformat(row['last_seen'])
-            
-            users.append(user)
+        columns = _column_list(USER_COLUMNS)
+        if status:
+            rows = self._select_tuples(f"SELECT {columns} FROM users WHERE status = ?", (status,))
+        else:
+            rows = self._select_tuples(f"SELECT {columns} FROM users")
         
-        return users
+        return User.from_rows(rows)
     
     def user_exists(self, username: str) -> bool:
         """
@@ -306,9 +1125,34 @@ class Storage:
         Returns:
             True if user exists, False otherwise
         """
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT 1 FROM users WHERE username = ?", (username,))
-        return cursor.fetchone() is not None
+        if not self._may_exist(username):
+            return False
+        
+        with self.pool.read() as conn:
+            row = conn.execute("SELECT 1 FROM users WHERE username = ?", (username,)).fetchone()
+        return row is not None
+    
+    def get_users_by_name(self, usernames: Iterable[str]) -> List['User']:
+        """
+        Get several users by username in one lookup
+        
+        Args:
+            usernames: The usernames to look up
+        
+        Returns:
+            The users found, in no particular order (unknown names are skipped)
+        """
+        # Import here to avoid circular import
+        from pychat.core.user import User
+        
+        rows = []
+        for batch in iter_batches(sorted(set(usernames)), USER_LOOKUP_BATCH):
+            rows.extend(self._select_tuples(
+                f"SELECT {_column_list(USER_COLUMNS)} FROM users "
+                f"WHERE username IN ({', '.join('?' * len(batch))})",
+                batch
+            ))
+        return User.from_rows(rows)
     
     def get_user_auth_data(self, username: str) -> Dict[str, str]:
         """
@@ -320,9 +1164,14 @@ class Storage:
         Returns:
             Dictionary with 'password_hash' and 'password_salt'
         """
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT password_hash, password_salt FROM user_auth WHERE username = ?", (username,))
-        row = cursor.fetchone()
+        if not self._may_exist(username):
+            return {}
+        
+        with self.pool.read() as conn:
+            row = conn.execute(
+                "SELECT password_hash, password_salt FROM user_auth WHERE username = ?",
+                (username,)
+            ).fetchone()
         
         if not row:
             return {}
@@ -347,22 +1196,20 @@ class Storage:
         created_at = datetime.datetime.now()
         expires_at = created_at + datetime.timedelta(seconds=expires_in)
         
-        cursor = self.conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO sessions
-            (session_id, username, created_at, expires_at)
-            VALUES (?, ?, ?, ?)
-            """,
-            (
-                session_id,
-                username,
-                created_at.isoformat(),
-                expires_at.isoformat()
+        with self.pool.write() as conn:
+            conn.execute(
+                """
+                INSERT INTO sessions
+                (session_id, username, created_at, expires_at)
+                VALUES (?, ?, ?, ?)
+                """,
+                (
+                    session_id,
+                    username,
+                    to_epoch_micros(created_at),
+                    to_epoch_micros(expires_at)
+                )
             )
-        )
-        
-        self.conn.commit()
         return session_id
     
     def validate_session(self, session_id: str) -> Optional[str]:
@@ -375,20 +1222,19 @@ class Storage:
         Returns:
             Username if session is valid, None otherwise
         """
-        now = datetime.datetime.now().isoformat()
+        now = to_epoch_micros(datetime.datetime.now())
         
-        cursor = self.conn.cursor()
-        cursor.execute(
-            """
-            SELECT username FROM sessions
-            WHERE session_id = ?
-            AND expires_at > ?
-            AND is_active = 1
-            """,
-            (session_id, now)
-        )
+        with self.pool.read() as conn:
+            row = conn.execute(
+                """
+                SELECT username FROM sessions
+                WHERE session_id = ?
+                AND expires_at > ?
+                AND is_active = 1
+                """,
+                (session_id, now)
+            ).fetchone()
         
-        row = cursor.fetchone()
         return row['username'] if row else None
     
     def invalidate_session(self, session_id: str) -> None:
@@ -398,12 +1244,115 @@ class Storage:
         Args:
             session_id: The session ID to invalidate
         """
-        cursor = self.conn.cursor()
-        cursor.execute(
-            "UPDATE sessions SET is_active = 0 WHERE session_id = ?",
-            (session_id,)
+        with self.pool.write() as conn:
+            conn.execute(
+                "UPDATE sessions SET is_active = 0 WHERE session_id = ?",
+                (session_id,)
+            )
+    
+    def get_active_sessions(self) -> List[Tuple[str, str, int]]:
+        """
+        Get every session that is active and not expired
+        
+        Returns:
+            List of (session_id, username, expires_at_us) tuples
+        """
+        return self._select_tuples(
+            "SELECT session_id, username, expires_at FROM sessions "
+            "WHERE expires_at > ? AND is_active = 1",
+            (to_epoch_micros(datetime.datetime.now()),)
         )
-        self.conn.commit()
+    
+    def update_sessions(self, updates: List[Tuple[str, int, bool]]) -> None:
+        """
+        Record activity and invalidation of sessions in one transaction
+        
+        Args:
+            updates: (session_id, last_activity_us, is_active) tuples
+        """
+        with self.pool.write() as conn:
+            conn.executemany(
+                "UPDATE sessions SET last_activity = ?, is_active = ? WHERE session_id = ?",
+                [(last_activity, 1 if is_active else 0, session_id)
+                 for session_id, last_activity, is_active in updates]
+            )
+    
+    def purge_sessions(self, batch_size: int = 1000) -> int:
+        """
+        Delete one batch of expired or invalidated sessions
+        
+        Expired sessions are found through idx_sessions_expires and
+        invalidated ones through the partial index idx_sessions_inactive,
+        so a batch never scans the live sessions.
+        
+        Args:
+            batch_size: Maximum number of sessions to delete
+        
+        Returns:
+            Number of sessions deleted (0 when there is nothing to do)
+        """
+        now = to_epoch_micros(datetime.datetime.now())
+        with self.pool.write() as conn:
+            deleted = conn.execute(
+                "DELETE FROM sessions WHERE rowid IN "
+                "(SELECT rowid FROM sessions WHERE expires_at <= ? LIMIT ?)",
+                (now, batch_size)
+            ).rowcount
+            if deleted < batch_size:
+                deleted += conn.execute(
+                    "DELETE FROM sessions WHERE rowid IN "
+                    "(SELECT rowid FROM sessions WHERE is_active = 0 LIMIT ?)",
+                    (batch_size - deleted,)
+                ).rowcount
+        return deleted
+    
+    def get_conversation_summaries(self, username: str) -> List[ConversationSummary]:
+        """
+        Get summaries of a user's private conversations, most recent first
+        
+        Reads the conversations table, which is kept up to date by a trigger
+        on messages, so the cost depends on the number of conversations
+        rather than the number of messages.
+        
+        Args:
+            username: The username to look up conversations for
+        
+        Returns:
+            List of ConversationSummary objects for partners that still exist
+        """
+        # Import here to avoid circular import
+        from pychat.core.user import User
+        
+        rows = self._select_tuples(
+            f"""
+            SELECT c.last_message_at, c.last_sender, c.last_preview, c.message_count,
+                   {_column_list(USER_COLUMNS, 'u')}
+            FROM (
+                SELECT user_b AS other_user, last_message_at, last_sender,
+                       last_preview, message_count
+                FROM conversations WHERE user_a = ?
+                UNION ALL
+                SELECT user_a, last_message_at, last_sender, last_preview, message_count
+                FROM conversations WHERE user_b = ? AND user_a != user_b
+            ) AS c
+            JOIN users AS u ON u.username = c.other_user
+            ORDER BY c.last_message_at DESC
+            """,
+            (username, username)
+        )
+        
+        users = User.from_rows(row[4:] for row in rows)
+        return [
+            ConversationSummary(
+                user=user,
+                last_message_time=from_epoch_micros(last_message_at),
+                last_sender=last_sender,
+                last_message_preview=last_preview,
+                message_count=message_count
+            )
+            for (last_message_at, last_sender, last_preview, message_count, *_), user
+            in zip(rows, users)
+        ]
     
     def get_private_conversations(self, username: str) -> List[Tuple[str, datetime.datetime]]:
         """
@@ -415,35 +1364,99 @@ class Storage:
         Returns:
             List of tuples (username, last_message_time)
         """
-        cursor = self.conn.cursor()
-        cursor.execute(
-            """
-            SELECT DISTINCT
-                CASE
-                    WHEN sender = ? THEN recipient
-                    ELSE sender
-                END as other_user,
-                MAX(timestamp) as last_message
-            FROM messages
-            WHERE 
-                (sender = ? AND recipient IS NOT NULL)
-                OR
-                (recipient = ?)
-            GROUP BY other_user
-            ORDER BY last_message DESC
-            """,
-            (username, username, username)
-        )
+        with self.pool.read() as conn:
+            rows = conn.execute(
+                """
+                SELECT user_b AS other_user, last_message_at FROM conversations WHERE user_a = ?
+                UNION ALL
+                SELECT user_a, last_message_at FROM conversations WHERE user_b = ? AND user_a != user_b
+                ORDER BY last_message_at DESC
+                """,
+                (username, username)
+            ).fetchall()
+        
+        return [(row['other_user'], from_epoch_micros(row['last_message_at']))
+                for row in rows]
+    
+    def backup(self, path: str, pages: int = DEFAULT_BACKUP_PAGES,
+               sleep: float = DEFAULT_BACKUP_SLEEP,
+               progress: Optional[Callable[[int, int], None]] = None) -> int:
+        """
+        Write a consistent copy of the live database to a file
+        
+        Uses SQLite's online backup API in small steps (see
+        ConnectionPool.backup), so chat traffic continues while it runs.
+        The copy is written next to the destination and moved into place
+        when complete. Monthly archives are separate files and are not
+        included.
+        
+        Args:
+            path: Destination file
+            pages: Number of pages copied per step
+            sleep: Seconds to pause between steps
+            progress: Optional callback receiving (remaining, total) pages
+        
+        Returns:
+            Number of pages copied
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        ensure_directory(directory)
+        partial = f"{path}.partial"
+        
+        target = sqlite3.connect(partial)
+        try:
+            total = self.pool.backup(target, pages, sleep, progress)
+        except BaseException:
+            target.close()
+            os.remove(partial)
+            raise
+        target.close()
+        os.replace(partial, path)
+        return total
+    
+    def restore(self, path: str) -> None:
+        """
+        Replace the contents of the database with a backup
+        
+        The backup is copied in through the writer connection and then
+        migrated to the current schema, so this Storage (and any other
+        connection to the database) sees the restored data at once.
+        
+        Only the database and this Storage's own state are replaced. A
+        running ChatManager keeps its user cache, history cache and
+        session registry, which would go on serving the old data, so
+        restore is meant to run while the chat server is stopped (as the
+        admin command line does).
+        
+        Args:
+            path: Backup file created by backup
+        
+        Raises:
+            FileNotFoundError: If the backup file does not exist
+            sqlite3.DatabaseError: If the file is not a SQLite database
+        """
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Backup file '{path}' not found")
         
-        rows = cursor.fetchall()
-        return [(row['other_user'], datetime.datetime.fromisoformat(row['last_message'])) 
-                for row in rows if row['other_user']]
+        source = sqlite3.connect(path)
+        try:
+            with self.pool.write() as conn:
+                source.backup(conn)
+                run_migrations(conn)
+                self._load_archive_boundary(conn)
+                self._load_usernames(conn)
+        finally:
+            source.close()
     
     def close(self) -> None:
-        """Close the database connection"""
-        if self.conn:
-            self.conn.close()
+        """Close all database and archive connections"""
+        pool = getattr(self, 'pool', None)
+        if pool:
+            pool.close()
+        archive = getattr(self, 'archive', None)
+        if archive:
+            archive.close()
     
     def __del__(self) -> None:
-        """Ensure connection is closed on deletion"""
+        """Ensure connections are closed on deletion"""
         self.close()
@@ -0,0 +1,510 @@
+"""
+Storage backend protocol for PyChat
+"""
+import datetime
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, TYPE_CHECKING
+
+from pychat.common.message import (
+    ConversationSummary, Message, MessageCursor, MessagePage, SearchPage, encode_message_id
+)
+from pychat.common.utils import iter_batches, to_epoch_micros
+from pychat.core.migrations import CONVERSATION_PREVIEW_LENGTH
+
+if TYPE_CHECKING:
+    from pychat.core.user import User
+
+
+class StorageBackend(ABC):
+    """
+    Persistence interface used by ChatManager and UserManager
+    
+    Backends store messages, user profiles, credentials and sessions.
+    Optional capabilities, such as background index maintenance, have
+    default implementations that do nothing.
+    """
+    
+    # Messages
+    
+    @abstractmethod
+    def save_message(self, message: Message) -> None:
+        """
+        Save a message
+        
+        Args:
+            message: The message to save
+        """
+    
+    @abstractmethod
+    def save_messages(self, messages: List[Message]) -> None:
+        """
+        Save a batch of messages atomically
+        
+        Args:
+            messages: The messages to save
+        """
+    
+    def get_messages(self, limit: int = 100, recipient: Optional[str] = None,
+                     before: Optional[MessageCursor] = None,
+                     after: Optional[MessageCursor] = None) -> List[Message]:
+        """
+        Retrieve messages
+        
+        Args:
+            limit: Maximum number of messages to retrieve
+            recipient: Filter messages by recipient (None for all messages)
+            before: Only return messages older than this cursor
+            after: Only return messages newer than this cursor
+        
+        Returns:
+            List of Message objects
+        """
+        return self.get_message_page(limit, recipient, before, after).messages
+    
+    @abstractmethod
+    def get_message_page(self, limit: int = 100, recipient: Optional[str] = None,
+                         before: Optional[MessageCursor] = None,
+                         after: Optional[MessageCursor] = None) -> MessagePage:
+        """
+        Retrieve a page of messages ordered by (timestamp, msg_id)
+        
+        Without cursors the latest messages are returned. With 'before' the
+        page ends just before the cursor; with only 'after' it starts just
+        after it.
+        
+        Args:
+            limit: Maximum number of messages on the page
+            recipient: Only include broadcasts and private messages to or
+                from this user (None for all messages)
+            before: Cursor the page must end before
+            after: Cursor the page must start after
+        
+        Returns:
+            MessagePage with messages in chronological order
+        """
+    
+    def iter_messages(self, batch_size: int = 1000,
+                      recipient: Optional[str] = None) -> Iterator[Message]:
+        """
+        Stream the whole message history, oldest first
+        
+        Messages are read one page at a time, so memory use does not grow
+        with the size of the history.
+        
+        Args:
+            batch_size: Number of messages read per page
+            recipient: Only include broadcasts and private messages to or
+                from this user (None for all messages)
+        
+        Yields:
+            Messages in (timestamp, msg_id) order
+        """
+        after = MessageCursor(datetime.datetime.min, "")
+        while True:
+            page = self.get_message_page(batch_size, recipient, after=after)
+            yield from page.messages
+            if len(page) < batch_size:
+                return
+            after = page.newer
+    
+    def import_messages(self, messages: Iterable[Message], batch_size: int = 1000) -> int:
+        """
+        Save a stream of messages in large batches
+        
+        Args:
+            messages: The messages to save (consumed lazily)
+            batch_size: Number of messages saved per batch
+        
+        Returns:
+            Number of messages saved
+        """
+        total = 0
+        for batch in iter_batches(messages, batch_size):
+            self.save_messages(batch)
+            total += len(batch)
+        return total
+    
+    @abstractmethod
+    def search_messages(self, query: str, username: Optional[str] = None, limit: int = 20,
+                        cursor: Optional[int] = None) -> SearchPage:
+        """
+        Search message content, best matches first
+        
+        Args:
+            query: Words to search for (the last word also matches as a prefix)
+            username: Only include messages this user may see (None for all)
+            limit: Maximum number of results on the page
+            cursor: Cursor returned with the previous page
+        
+        Returns:
+            SearchPage of matching messages
+        """
+    
+    def backfill_search_index(self, batch_size: int = 1000) -> int:
+        """
+        Index one batch of messages that predate the search index
+        
+        Args:
+            batch_size: Maximum number of messages to index
+        
+        Returns:
+            Number of messages indexed (0 when there is nothing to do)
+        """
+        return 0
+    
+    def archive_messages(self, batch_size: int = 1000) -> int:
+        """
+        Move one batch of messages past the retention period to cold storage
+        
+        Args:
+            batch_size: Maximum number of messages to move
+        
+        Returns:
+            Number of messages moved (0 when there is nothing to do)
+        """
+        return 0
+    
+    # Users
+    
+    @abstractmethod
+    def save_user(self, user: 'User', password_hash: Optional[str] = None,
+                  password_salt: Optional[str] = None, replace: bool = True) -> None:
+        """
+        Save a user, replacing any stored profile with the same username
+        
+        Args:
+            user: The user to save (a user_id is assigned if missing)
+            password_hash: Optional password hash
+            password_salt: Optional password salt
+            replace: False to only create a new user, as registration does
+        
+        Raises:
+            ValueError: If replace is False and the username is taken
+        """
+    
+    @abstractmethod
+    def update_user(self, user: 'User') -> None:
+        """
+        Update the profile of an existing user
+        
+        Args:
+            user: The user to update
+        """
+    
+    @abstractmethod
+    def get_user(self, username: str) -> Optional['User']:
+        """
+        Get a user by username
+        
+        Args:
+            username: The username to look up
+        
+        Returns:
+            User object if found, None otherwise
+        """
+    
+    @abstractmethod
+    def get_users(self, status: Optional[str] = None) -> List['User']:
+        """
+        Get all users
+        
+        Args:
+            status: Optional filter by status
+        
+        Returns:
+            List of User objects
+        """
+    
+    def user_exists(self, username: str) -> bool:
+        """
+        Check if a user exists
+        
+        Args:
+            username: The username to check
+        
+        Returns:
+            True if user exists, False otherwise
+        """
+        return self.get_user(username) is not None
+    
+    def get_users_by_name(self, usernames: Iterable[str]) -> List['User']:
+        """
+        Get several users by username in one lookup
+        
+        Args:
+            usernames: The usernames to look up
+        
+        Returns:
+            The users found, in no particular order (unknown names are skipped)
+        """
+        users = (self.get_user(username) for username in set(usernames))
+        return [user for user in users if user is not None]
+    
+    @abstractmethod
+    def get_user_auth_data(self, username: str) -> Dict[str, str]:
+        """
+        Get authentication data for a user
+        
+        Args:
+            username: The username to look up
+        
+        Returns:
+            Dictionary with 'password_hash' and 'password_salt' (empty if unknown)
+        """
+    
+    # Sessions
+    
+    @abstractmethod
+    def create_session(self, username: str, expires_in: int = 86400) -> str:
+        """
+        Create a new session for a user
+        
+        Args:
+            username: The username to create a session for
+            expires_in: Session duration in seconds
+        
+        Returns:
+            Session ID
+        """
+    
+    @abstractmethod
+    def validate_session(self, session_id: str) -> Optional[str]:
+        """
+        Validate a session and return the associated username
+        
+        Args:
+            session_id: The session ID to validate
+        
+        Returns:
+            Username if session is valid, None otherwise
+        """
+    
+    @abstractmethod
+    def invalidate_session(self, session_id: str) -> None:
+        """
+        Invalidate a session
+        
+        Args:
+            session_id: The session ID to invalidate
+        """
+    
+    def get_active_sessions(self) -> List[Tuple[str, str, int]]:
+        """
+        Get every session that is active and not expired
+        
+        Returns:
+            List of (session_id, username, expires_at_us) tuples
+        """
+        return []
+    
+    def update_sessions(self, updates: List[Tuple[str, int, bool]]) -> None:
+        """
+        Record activity and invalidation of sessions in one batch
+        
+        Args:
+            updates: (session_id, last_activity_us, is_active) tuples
+        """
+        for session_id, _, is_active in updates:
+            if not is_active:
+                self.invalidate_session(session_id)
+    
+    def purge_sessions(self, batch_size: int = 1000) -> int:
+        """
+        Delete one batch of expired or invalidated sessions
+        
+        Args:
+            batch_size: Maximum number of sessions to delete
+        
+        Returns:
+            Number of sessions deleted (0 when there is nothing to do)
+        """
+        return 0
+    
+    # Conversations
+    
+    @abstractmethod
+    def get_conversation_summaries(self, username: str) -> List[ConversationSummary]:
+        """
+        Get summaries of a user's private conversations, most recent first
+        
+        Args:
+            username: The username to look up conversations for
+        
+        Returns:
+            List of ConversationSummary objects for partners that still exist
+        """
+    
+    def get_private_conversations(self, username: str) -> List[Tuple[str, datetime.datetime]]:
+        """
+        Get a list of users that the given user has had private conversations with
+        
+        Args:
+            username: The username to look up conversations for
+        
+        Returns:
+            List of tuples (username, last_message_time)
+        """
+        return [(summary.user.username, summary.last_message_time)
+                for summary in self.get_conversation_summaries(username)]
+    
+    def close(self) -> None:
+        """Release any resources held by the backend"""
+
+
+def make_message_page(messages: Sequence[Message], limit: int, descending: bool,
+                      after: Optional[MessageCursor]) -> MessagePage:
+    """
+    Assemble a MessagePage from the rows of a keyset query
+    
+    Args:
+        messages: Up to limit + 1 messages in query order
+        limit: Requested page size
+        descending: True if the query walked backwards in time
+        after: The 'after' cursor of the request
+    
+    Returns:
+        MessagePage with messages in chronological order
+    """
+    has_more = len(messages) > limit
+    page = list(messages[:limit])
+    
+    # Return in chronological order
+    if descending:
+        page.reverse()
+    
+    if not page:
+        return MessagePage([], older=None, newer=after)
+    
+    first = MessageCursor.from_message(page[0])
+    last = MessageCursor.from_message(page[-1])
+    older_exists = has_more if descending else True
+    return MessagePage(page, older=first if older_exists else None, newer=last)
+
+
+# Sort key of a message: (timestamp_us, storage class, encoded msg_id).
+# Matches the SQLite order of (timestamp, msg_id), where TEXT sorts before BLOB.
+MessageKey = Tuple[int, int, Any]
+
+
+def message_key(timestamp_us: int, msg_id: str) -> MessageKey:
+    """
+    Build the sort key of a message
+    
+    Args:
+        timestamp_us: Send time in microseconds since the epoch
+        msg_id: The message ID
+    
+    Returns:
+        Key ordering messages like the SQLite history indexes
+    """
+    encoded = encode_message_id(msg_id)
+    return (timestamp_us, 1 if isinstance(encoded, bytes) else 0, encoded)
+
+
+def cursor_key(cursor: MessageCursor) -> MessageKey:
+    """
+    Build the sort key a cursor points at
+    
+    Args:
+        cursor: The history cursor
+    
+    Returns:
+        Key of the message at the cursor position
+    """
+    return message_key(to_epoch_micros(cursor.timestamp), cursor.msg_id)
+
+
+class ConversationIndex:
+    """
+    Private conversation summaries kept in memory, for backends without
+    a conversations table
+    """
+    def __init__(self):
+        """Initialize an empty index"""
+        # (user_a, user_b) -> [last_message_us, last_sender, preview, count]
+        self._conversations: Dict[Tuple[str, str], List[Any]] = {}
+        self._partners: Dict[str, Set[str]] = {}
+    
+    def add(self, message: Message) -> None:
+        """
+        Fold a message into its conversation summary
+        
+        Args:
+            message: The message (broadcasts are ignored)
+        """
+        if message.recipient is None:
+            return
+        
+        pair = (min(message.sender, message.recipient), max(message.sender, message.recipient))
+        summary = self._conversations.get(pair)
+        preview = message.content[:CONVERSATION_PREVIEW_LENGTH]
+        
+        if summary is None:
+            self._conversations[pair] = [message.timestamp_us, message.sender, preview, 1]
+            self._partners.setdefault(pair[0], set()).add(pair[1])
+            self._partners.setdefault(pair[1], set()).add(pair[0])
+            return
+        
+        summary[3] += 1
+        if message.timestamp_us >= summary[0]:
+            summary[0:3] = [message.timestamp_us, message.sender, preview]
+    
+    def entries(self, username: str) -> List[Tuple[str, int, str, str, int]]:
+        """
+        Get the conversations of a user, most recent first
+        
+        Args:
+            username: The username to look up conversations for
+        
+        Returns:
+            List of (partner, last_message_us, last_sender, preview, count) tuples
+        """
+        entries = []
+        for partner in self._partners.get(username, ()):
+            pair = (min(username, partner), max(username, partner))
+            entries.append((partner,) + tuple(self._conversations[pair]))
+        entries.sort(key=lambda entry: entry[1], reverse=True)
+        return entries
+
+
+def search_scan(messages: Iterable[Message], query: str, username: Optional[str] = None,
+                limit: int = 20, cursor: Optional[int] = None) -> SearchPage:
+    """
+    Search messages by scanning them, for backends without a search index
+    
+    All words must appear in a message and the last word may match as a
+    prefix.
+    
+    Args:
+        messages: Messages to search, newest first
+        query: Words to search for
+        username: Only include messages this user may see (None for all)
+        limit: Maximum number of results on the page
+        cursor: Cursor returned with the previous page
+    
+    Returns:
+        SearchPage of matching messages, newest first
+    """
+    words = query.lower().split()
+    if not words:
+        return SearchPage([])
+    
+    *whole, prefix = words
+    offset = cursor or 0
+    matches: List[Message] = []
+    
+    for message in messages:
+        if username is not None and message.recipient is not None \
+                and username not in (message.sender, message.recipient):
+            continue
+        tokens = message.content.lower().split()
+        if all(word in tokens for word in whole) and \
+                any(token.startswith(prefix) for token in tokens):
+            matches.append(message)
+            # One extra match tells whether there is another page
+            if len(matches) > offset + limit:
+                break
+    
+    page = matches[offset:offset + limit]
+    next_cursor = offset + limit if len(matches) > offset + limit else None
+    return SearchPage(page, next_cursor)
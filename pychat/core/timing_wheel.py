@@ -0,0 +1,103 @@
+"""
+Timing wheel for PyChat timeouts
+"""
+import math
+import threading
+from typing import Dict, Hashable, List, Set
+
+
+class TimingWheel:
+    """
+    Schedules deadlines for many keys at a fixed tick resolution
+    
+    A ring of slots, one per tick. Scheduling and cancelling a key cost
+    O(1), and advancing the wheel only visits the slots whose time has
+    come, so idle keys cost nothing until they are due.
+    
+    Deadlines further away than one turn of the wheel are parked in the
+    last slot it reaches; callers re-check the real deadline of every key
+    advance returns and schedule it again if it has moved. That also
+    lets a deadline that is pushed back often (such as last activity
+    plus a timeout) be stored lazily instead of rescheduled every time.
+    """
+    def __init__(self, tick: float = 1.0, slots: int = 4096, start: float = 0.0):
+        """
+        Initialize an empty wheel
+        
+        Args:
+            tick: Resolution of the wheel in seconds
+            slots: Number of ticks in one turn of the wheel
+            start: Time the wheel starts at (same clock as the deadlines)
+        """
+        self.tick = tick
+        self.slots = slots
+        self._lock = threading.Lock()
+        self._wheel: List[Set[Hashable]] = [set() for _ in range(slots)]
+        self._slot_of: Dict[Hashable, int] = {}
+        
+        # Every tick up to and including this one has been processed
+        self._current = math.floor(start / tick)
+    
+    def schedule(self, key: Hashable, deadline: float) -> None:
+        """
+        Schedule a key, replacing any earlier schedule for it
+        
+        Args:
+            key: The key
+            deadline: Time at which the key is due
+        """
+        target = math.ceil(deadline / self.tick)
+        with self._lock:
+            target = min(max(target, self._current + 1), self._current + self.slots - 1)
+            self._remove(key)
+            slot = target % self.slots
+            self._wheel[slot].add(key)
+            self._slot_of[key] = slot
+    
+    def cancel(self, key: Hashable) -> None:
+        """
+        Remove a key from the wheel
+        
+        Args:
+            key: The key (ignored if not scheduled)
+        """
+        with self._lock:
+            self._remove(key)
+    
+    def _remove(self, key: Hashable) -> None:
+        """Remove a key from its slot; the caller holds the lock"""
+        slot = self._slot_of.pop(key, None)
+        if slot is not None:
+            self._wheel[slot].discard(key)
+    
+    def advance(self, now: float) -> List[Hashable]:
+        """
+        Move the wheel forward to a point in time
+        
+        Args:
+            now: The current time
+        
+        Returns:
+            Keys whose slot was reached; they are no longer scheduled
+        """
+        target = math.floor(now / self.tick)
+        due: List[Hashable] = []
+        with self._lock:
+            # A full turn visits every slot, so never do more than one
+            steps = min(target - self._current, self.slots)
+            for _ in range(max(steps, 0)):
+                self._current += 1
+                slot = self._wheel[self._current % self.slots]
+                if slot:
+                    for key in slot:
+                        del self._slot_of[key]
+                    due.extend(slot)
+                    slot.clear()
+            self._current = max(self._current, target)
+        return due
+    
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._slot_of
+    
+    def __len__(self) -> int:
+        return len(self._slot_of)
@@ -0,0 +1,178 @@
+"""
+Bulk export and import of message history for PyChat
+"""
+import os
+import struct
+import sys
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+from pychat.common.message import Message, decode_message_record, encode_message_record
+from pychat.core.storage_backend import StorageBackend
+
+
+# Supported file formats
+FORMAT_NDJSON = 'ndjson'
+FORMAT_BINARY = 'binary'
+FORMATS = (FORMAT_NDJSON, FORMAT_BINARY)
+
+# File extensions recognised by detect_format
+FORMAT_EXTENSIONS = {
+    '.ndjson': FORMAT_NDJSON,
+    '.jsonl': FORMAT_NDJSON,
+    '.pcm': FORMAT_BINARY,
+    '.bin': FORMAT_BINARY,
+}
+
+# Binary files start with this marker, followed by length-prefixed message records
+BINARY_MAGIC = b'PYCHATM1'
+_RECORD_LENGTH = struct.Struct('<I')
+
+DEFAULT_TRANSFER_BATCH = 10000
+
+
+def detect_format(path: str, fmt: Optional[str] = None) -> str:
+    """
+    Resolve the format of a history file
+    
+    Args:
+        path: Path of the file ('-' for standard input/output)
+        fmt: Explicit format name, or None to go by the file extension
+            (default: ndjson)
+    
+    Returns:
+        The format name
+    
+    Raises:
+        ValueError: If the format name is unknown
+    """
+    if fmt is None:
+        fmt = FORMAT_EXTENSIONS.get(os.path.splitext(path)[1].lower(), FORMAT_NDJSON)
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown history format '{fmt}'")
+    return fmt
+
+
+def write_messages(messages: Iterable[Message], stream: BinaryIO, fmt: str = FORMAT_NDJSON) -> int:
+    """
+    Write messages to a stream
+    
+    Args:
+        messages: The messages to write (consumed lazily)
+        stream: Binary stream to write to
+        fmt: Format name
+    
+    Returns:
+        Number of messages written
+    """
+    count = 0
+    if fmt == FORMAT_BINARY:
+        stream.write(BINARY_MAGIC)
+        for message in messages:
+            record = encode_message_record(message)
+            stream.write(_RECORD_LENGTH.pack(len(record)))
+            stream.write(record)
+            count += 1
+    else:
+        for message in messages:
+            stream.write(message.to_json().encode('utf-8'))
+            stream.write(b'\n')
+            count += 1
+    return count
+
+
+def read_messages(stream: BinaryIO, fmt: str = FORMAT_NDJSON) -> Iterator[Message]:
+    """
+    Read messages from a stream, one at a time
+    
+    Args:
+        stream: Binary stream to read from
+        fmt: Format name
+    
+    Yields:
+        The messages in file order
+    
+    Raises:
+        ValueError: If the stream is not valid in the given format
+    """
+    if fmt == FORMAT_BINARY:
+        if stream.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError("Not a PyChat binary history file")
+        while True:
+            prefix = stream.read(_RECORD_LENGTH.size)
+            if not prefix:
+                return
+            if len(prefix) < _RECORD_LENGTH.size:
+                raise ValueError("Truncated record in binary history file")
+            length = _RECORD_LENGTH.unpack(prefix)[0]
+            record = stream.read(length)
+            if len(record) < length:
+                raise ValueError("Truncated record in binary history file")
+            yield decode_message_record(memoryview(record), 0, length)
+    else:
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                yield Message.from_json(line)
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"Invalid message on line {line_number}: {e}")
+
+
+def _open_stream(path: str, mode: str) -> BinaryIO:
+    """Open a history file, with '-' meaning standard input or output"""
+    if path == '-':
+        return sys.stdin.buffer if 'r' in mode else sys.stdout.buffer
+    return open(path, mode)
+
+
+def export_history(storage: StorageBackend, path: str, fmt: Optional[str] = None,
+                   recipient: Optional[str] = None,
+                   batch_size: int = DEFAULT_TRANSFER_BATCH) -> int:
+    """
+    Stream the message history of a backend into a file
+    
+    Args:
+        storage: The backend to export from
+        path: Destination file ('-' for standard output)
+        fmt: Format name (default: from the file extension)
+        recipient: Only export messages visible to this user (None for all)
+        batch_size: Number of messages read at a time
+    
+    Returns:
+        Number of messages exported
+    """
+    fmt = detect_format(path, fmt)
+    stream = _open_stream(path, 'wb')
+    try:
+        return write_messages(storage.iter_messages(batch_size, recipient), stream, fmt)
+    finally:
+        if stream is not sys.stdout.buffer:
+            stream.close()
+        else:
+            stream.flush()
+
+
+def import_history(storage: StorageBackend, path: str, fmt: Optional[str] = None,
+                   batch_size: int = DEFAULT_TRANSFER_BATCH) -> int:
+    """
+    Stream messages from a file into a backend
+    
+    Args:
+        storage: The backend to import into
+        path: Source file ('-' for standard input)
+        fmt: Format name (default: from the file extension)
+        batch_size: Number of messages saved per transaction
+    
+    Returns:
+        Number of messages imported
+    
+    Raises:
+        ValueError: If the file is not valid in the given format
+    """
+    fmt = detect_format(path, fmt)
+    stream = _open_stream(path, 'rb')
+    try:
+        return storage.import_messages(read_messages(stream, fmt), batch_size)
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
@@ -1,21 +1,34 @@
 """
 User profile management for PyChat
 """
+import collections
 import datetime
 import hashlib
 import os
-from typing import Dict, Optional, List, Any
+import sys
+import threading
+import time
+from typing import Dict, Iterable, Optional, List, Any, Tuple
 
-from pychat.core.storage import Storage
+from pychat.common.utils import from_epoch_micros, intern_string, to_epoch_micros
+from pychat.core.storage_backend import StorageBackend
+
+
+# Offline users kept in memory, and seconds before a cached user is reloaded
+DEFAULT_USER_CACHE_SIZE = 1024
+DEFAULT_USER_CACHE_TTL = 300.0
 
 
 class User:
     """
     Represents a user in the PyChat application
     """
+    __slots__ = ('username', 'display_name', 'email', 'status', 'user_id',
+                 '_last_seen', '_last_seen_us')
+    
     def __init__(self, username: str, display_name: Optional[str] = None, 
                  email: Optional[str] = None, status: str = "online",
-                 user_id: Optional[str] = None):
+                 user_id: Optional[str] = None, last_seen_us: Optional[int] = None):
         """
         Initialize a user
         
@@ -25,13 +38,64 @@ class User:
             email: User's email address
             status: Current user status (online, away, busy, offline)
             user_id: Internal ID for the user
+            last_seen_us: Last activity as stored, in microseconds since the
+                epoch (default: now); the datetime is built on first access
         """
-        self.username = username
+        self.username = intern_string(username)
         self.display_name = display_name if display_name else username
         self.email = email
-        self.status = status
+        self.status = intern_string(status)
         self.user_id = user_id
-        self.last_seen = datetime.datetime.now()
+        self._last_seen_us = last_seen_us
+        self._last_seen = None if last_seen_us is not None else datetime.datetime.now()
+    
+    @property
+    def last_seen(self) -> Optional[datetime.datetime]:
+        """Time of the user's last activity"""
+        if self._last_seen is None and self._last_seen_us is not None:
+            self._last_seen = from_epoch_micros(self._last_seen_us)
+        return self._last_seen
+    
+    @last_seen.setter
+    def last_seen(self, value: Optional[datetime.datetime]) -> None:
+        self._last_seen = value
+        self._last_seen_us = None
+    
+    @property
+    def last_seen_us(self) -> Optional[int]:
+        """Time of the user's last activity in microseconds since the epoch"""
+        if self._last_seen_us is None and self._last_seen is not None:
+            self._last_seen_us = to_epoch_micros(self._last_seen)
+        return self._last_seen_us
+    
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[Optional[str], str, Optional[str], Optional[str],
+                                            str, Optional[int]]]) -> List['User']:
+        """
+        Build users from stored rows in bulk
+        
+        Args:
+            rows: (user_id, username, display_name, email, status, last_seen_us)
+                tuples as stored by Storage
+        
+        Returns:
+            List of User objects in row order
+        """
+        new = cls.__new__
+        intern = sys.intern
+        users = []
+        append = users.append
+        for user_id, username, display_name, email, status, last_seen_us in rows:
+            user = new(cls)
+            user.user_id = user_id
+            user.username = intern(username)
+            user.display_name = display_name if display_name else user.username
+            user.email = email
+            user.status = intern(status) if status else status
+            user._last_seen_us = last_seen_us
+            user._last_seen = None if last_seen_us is not None else datetime.datetime.now()
+            append(user)
+        return users
     
     def __str__(self) -> str:
         """String representation of the user"""
@@ -63,19 +127,105 @@ class User:
         return user
 
 
+class UserCache:
+    """
+    Bounded identity map of User objects
+    
+    Holds at most one User per username, so every lookup of a user shares
+    the same instance. Entries expire after a time to live, which bounds
+    how long changes made outside this process stay invisible, and the
+    least recently used entry is evicted when the cache is full.
+    """
+    def __init__(self, max_size: int = DEFAULT_USER_CACHE_SIZE,
+                 ttl: Optional[float] = DEFAULT_USER_CACHE_TTL):
+        """
+        Initialize an empty cache
+        
+        Args:
+            max_size: Maximum number of cached users
+            ttl: Seconds an entry stays valid (None for no expiry)
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._users: 'collections.OrderedDict[str, Tuple[User, float]]' = collections.OrderedDict()
+    
+    def get(self, username: str) -> Optional[User]:
+        """
+        Get a cached user
+        
+        Args:
+            username: The username to look up
+        
+        Returns:
+            The cached User, or None if absent or expired
+        """
+        with self._lock:
+            entry = self._users.get(username)
+            if entry is None:
+                return None
+            user, loaded_at = entry
+            if self.ttl is not None and time.monotonic() - loaded_at > self.ttl:
+                del self._users[username]
+                return None
+            self._users.move_to_end(username)
+            return user
+    
+    def put(self, user: User) -> User:
+        """
+        Cache a user, replacing any entry for the same username
+        
+        Args:
+            user: The user
+        
+        Returns:
+            The cached user
+        """
+        with self._lock:
+            self._users[user.username] = (user, time.monotonic())
+            self._users.move_to_end(user.username)
+            while len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+        return user
+    
+    def discard(self, username: str) -> None:
+        """
+        Remove a user from the cache
+        
+        Args:
+            username: The username to remove
+        """
+        with self._lock:
+            self._users.pop(username, None)
+    
+    def clear(self) -> None:
+        """Remove all users from the cache"""
+        with self._lock:
+            self._users.clear()
+    
+    def __len__(self) -> int:
+        return len(self._users)
+
+
 class UserManager:
     """
     Manages user profiles for the chat application
     """
-    def __init__(self, storage: Storage):
+    def __init__(self, storage: StorageBackend, cache_size: int = DEFAULT_USER_CACHE_SIZE,
+                 cache_ttl: Optional[float] = DEFAULT_USER_CACHE_TTL):
         """
         Initialize the user manager
         
         Args:
-            storage: Storage instance for persistence
+            storage: Storage backend for persistence
+            cache_size: Number of offline users kept in memory
+            cache_ttl: Seconds before a cached offline user is reloaded
         """
         self.storage = storage
         self.active_users: Dict[str, User] = {}
+        
+        # Offline users looked up recently; active users live in active_users
+        self.user_cache = UserCache(cache_size, cache_ttl)
         self._load_active_users()
     
     def _hash_password(self, password: str, salt: Optional[str] = None) -> tuple[str, str]:
@@ -133,9 +283,9 @@ class UserManager:
         # Hash the password
         hashed_password, salt = self._hash_password(password)
         
-        # Save to storage
-        self.storage.save_user(user, hashed_password, salt)
-        return user
+        # Save to storage; fails if the name was taken since the check above
+        self.storage.save_user(user, hashed_password, salt, replace=False)
+        return self.user_cache.put(user)
     
     def authenticate_user(self, username: str, password: str) -> Optional[User]:
         """
@@ -166,13 +316,14 @@ class UserManager:
             return None
         
         # Get full user data
-        user = self.storage.get_user(username)
+        user = self.get_user(username)
         if user:
             # Update last seen and status
             user.last_seen = datetime.datetime.now()
             user.status = 'online'
             self.storage.update_user(user)
             self.active_users[username] = user
+            self.user_cache.discard(username)
         
         return user
     
@@ -191,7 +342,7 @@ class UserManager:
             The created/updated User object
         """
         # Check if user exists in storage
-        user = self.storage.get_user(username)
+        user = self.get_user(username)
         
         if user:
             # Update existing user
@@ -206,9 +357,7 @@ class UserManager:
             self.storage.save_user(user)
         
         # Add to active users if online
-        if status != 'offline':
-            self.active_users[username] = user
-        
+        self._track(username, user)
         return user
     
     def update_user_status(self, username: str, status: str) -> Optional[User]:
@@ -233,12 +382,7 @@ class UserManager:
         self.storage.update_user(user)
         
         # Update active users
-        if status == 'offline':
-            if username in self.active_users:
-                del self.active_users[username]
-        else:
-            self.active_users[username] = user
-        
+        self._track(username, user)
         return user
     
     def remove_user(self, username: str) -> None:
@@ -248,8 +392,40 @@ class UserManager:
         Args:
             username: The username to remove
         """
-        if username in self.active_users:
-            del self.active_users[username]
+        user = self.active_users.pop(username, None)
+        if user is not None:
+            self.user_cache.put(user)
+    
+    def _track(self, username: str, user: User) -> None:
+        """
+        Keep a user in active_users while online, in the cache otherwise
+        
+        Args:
+            username: The username
+            user: The user whose status changed
+        """
+        if user.status == 'offline':
+            self.active_users.pop(username, None)
+            self.user_cache.put(user)
+        else:
+            self.active_users[username] = user
+            self.user_cache.discard(username)
+    
+    def intern_user(self, user: User) -> User:
+        """
+        Get the shared instance for a user loaded from storage
+        
+        Args:
+            user: A User built by the storage backend
+        
+        Returns:
+            The instance already in use for the username, or user itself
+            (which is cached from now on)
+        """
+        shared = self.active_users.get(user.username) or self.user_cache.get(user.username)
+        if shared is not None:
+            return shared
+        return self.user_cache.put(user)
     
     def get_user(self, username: str) -> Optional[User]:
         """
@@ -265,8 +441,15 @@ class UserManager:
         if username in self.active_users:
             return self.active_users[username]
         
+        user = self.user_cache.get(username)
+        if user is not None:
+            return user
+        
         # Check storage
-        return self.storage.get_user(username)
+        user = self.storage.get_user(username)
+        if user is not None:
+            self.user_cache.put(user)
+        return user
     
     def get_active_users(self) -> List[User]:
         """
@@ -0,0 +1,243 @@
+"""
+Write-behind buffering for PyChat persistence
+"""
+import queue
+import threading
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+
+class PendingWrite:
+    """
+    Handle for an item submitted to a WriteBehindBuffer
+    """
+    def __init__(self):
+        """Initialize an unresolved pending write"""
+        self._event = threading.Event()
+        self.error: Optional[BaseException] = None
+    
+    @property
+    def done(self) -> bool:
+        """True once the item has been flushed (successfully or not)"""
+        return self._event.is_set()
+    
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until the item is durable
+        
+        Args:
+            timeout: Maximum number of seconds to wait (None waits forever)
+        
+        Returns:
+            True if the item was written, False on timeout or write error
+        """
+        if not self._event.wait(timeout):
+            return False
+        return self.error is None
+    
+    def _resolve(self, error: Optional[BaseException] = None) -> None:
+        """Mark the write as finished"""
+        self.error = error
+        self._event.set()
+
+
+# Control markers passed through the buffer queue
+_FLUSH = object()
+_STOP = object()
+
+
+class WriteBehindBuffer:
+    """
+    Collects items on a bounded queue and hands them to a flush function
+    in batches from a dedicated writer thread (group commit)
+    
+    A batch is flushed when it reaches max_batch items or when
+    flush_interval seconds have passed since its first item arrived.
+    """
+    def __init__(self, flush_fn: Callable[[List[Any]], None], max_batch: int = 256,
+                 flush_interval: float = 0.05, max_pending: int = 10000,
+                 name: str = "write-behind"):
+        """
+        Initialize the buffer and start its writer thread
+        
+        Args:
+            flush_fn: Called on the writer thread with each batch of items
+            max_batch: Maximum number of items per batch
+            flush_interval: Maximum seconds an item waits before being flushed
+            max_pending: Maximum number of buffered items; submit blocks when full
+            name: Name of the writer thread
+        """
+        self.flush_fn = flush_fn
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        
+        self._thread = threading.Thread(target=self._writer_loop, name=name, daemon=True)
+        self._thread.start()
+    
+    def submit(self, item: Any) -> PendingWrite:
+        """
+        Queue an item for writing
+        
+        Blocks while the buffer is full, which applies backpressure to
+        producers when the disk cannot keep up.
+        
+        Args:
+            item: The item to write
+        
+        Returns:
+            PendingWrite handle that can be waited on for durability
+        
+        Raises:
+            RuntimeError: If the buffer has been closed
+        """
+        if self._closed:
+            raise RuntimeError("Write-behind buffer is closed")
+        
+        pending = PendingWrite()
+        self._queue.put((item, pending))
+        return pending
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every item submitted so far has been flushed
+        
+        Args:
+            timeout: Maximum number of seconds to wait (None waits forever)
+        
+        Returns:
+            True if the buffer drained in time, False otherwise
+        """
+        if self._closed or not self._thread.is_alive():
+            return self._queue.empty()
+        
+        barrier = PendingWrite()
+        self._queue.put((_FLUSH, barrier))
+        return barrier.wait(timeout)
+    
+    def pending_count(self) -> int:
+        """
+        Get the approximate number of buffered items
+        
+        Returns:
+            Number of items waiting to be flushed
+        """
+        return self._queue.qsize()
+    
+    def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Flush all buffered items and stop the writer thread
+        
+        Args:
+            timeout: Maximum number of seconds to wait for the final flush
+        """
+        if self._closed:
+            return
+        self._closed = True
+        
+        if self._thread.is_alive():
+            self._queue.put((_STOP, None))
+            self._thread.join(timeout)
+    
+    def _writer_loop(self) -> None:
+        """
+        Writer thread main loop
+        Runs in a separate thread
+        """
+        while True:
+            item, pending = self._queue.get()
+            batch: List[Tuple[Any, PendingWrite]] = []
+            barriers: List[PendingWrite] = []
+            stop = False
+            
+            if item is _STOP:
+                stop = True
+            elif item is _FLUSH:
+                barriers.append(pending)
+            else:
+                batch.append((item, pending))
+                stop = self._fill_batch(batch, barriers)
+            
+            if batch:
+                self._write_batch(batch)
+            for barrier in barriers:
+                barrier._resolve()
+            
+            if stop:
+                # Drain anything submitted before close() was called
+                remaining: List[Tuple[Any, PendingWrite]] = []
+                while True:
+                    try:
+                        item, pending = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if pending is None:
+                        continue
+                    if item is _FLUSH:
+                        barriers.append(pending)
+                    else:
+                        remaining.append((item, pending))
+                for start in range(0, len(remaining), self.max_batch):
+                    self._write_batch(remaining[start:start + self.max_batch])
+                for barrier in barriers:
+                    barrier._resolve()
+                return
+    
+    def _fill_batch(self, batch: List[Tuple[Any, PendingWrite]],
+                    barriers: List[PendingWrite]) -> bool:
+        """
+        Collect items into a batch until it is full or the interval elapses
+        
+        Args:
+            batch: Batch to extend, already holding its first item
+            barriers: Flush barriers seen while filling (flushed immediately)
+        
+        Returns:
+            True if a stop marker was seen
+        """
+        deadline = time.monotonic() + self.flush_interval
+        
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    item, pending = self._queue.get(timeout=remaining)
+                else:
+                    item, pending = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            
+            if item is _STOP:
+                return True
+            if item is _FLUSH:
+                barriers.append(pending)
+                break
+            batch.append((item, pending))
+        
+        return False
+    
+    def _write_batch(self, batch: List[Tuple[Any, PendingWrite]]) -> None:
+        """
+        Hand a batch to the flush function and resolve its pending writes
+        
+        If the batch fails as a whole, its items are retried one at a time
+        so a single bad item does not lose the rest of the batch.
+        
+        Args:
+            batch: List of (item, pending) tuples
+        """
+        try:
+            self.flush_fn([item for item, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                print(f"Error in write-behind flush: {e}")
+                batch[0][1]._resolve(e)
+                return
+            for entry in batch:
+                self._write_batch([entry])
+            return
+        
+        for _, pending in batch:
+            pending._resolve()
@@ -0,0 +1,98 @@
+"""
+Administration command line for PyChat
+"""
+import argparse
+import sqlite3
+import sys
+from typing import List, Optional
+
+from pychat.core.storage import DEFAULT_BACKUP_PAGES, DEFAULT_BACKUP_SLEEP, Storage
+from pychat.core.transfer import DEFAULT_TRANSFER_BATCH, FORMATS, export_history, import_history
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Build the argument parser of pychat-admin
+    
+    Returns:
+        The configured parser
+    """
+    parser = argparse.ArgumentParser(prog="pychat-admin", description="PyChat administration")
+    parser.add_argument("--db", help="Path to the database (default: ~/.pychat/pychat.db)")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.required = True
+    
+    export_parser = commands.add_parser("export", help="Export message history to a file")
+    export_parser.add_argument("file", help="Destination file, or - for standard output")
+    export_parser.add_argument("--format", choices=FORMATS,
+                               help="File format (default: from the file extension)")
+    export_parser.add_argument("--user", help="Only export messages visible to this user")
+    export_parser.add_argument("--batch-size", type=int, default=DEFAULT_TRANSFER_BATCH,
+                               help="Messages read at a time")
+    
+    import_parser = commands.add_parser(
+        "import",
+        help="Import message history from a file",
+        description="Import message history from a file. The history indexes are "
+                    "dropped during the import and rebuilt at the end, so history "
+                    "queries of a server running on the same database are slow "
+                    "until the import finishes."
+    )
+    import_parser.add_argument("file", help="Source file, or - for standard input")
+    import_parser.add_argument("--format", choices=FORMATS,
+                               help="File format (default: from the file extension)")
+    import_parser.add_argument("--batch-size", type=int, default=DEFAULT_TRANSFER_BATCH,
+                               help="Messages saved per transaction")
+    
+    backup_parser = commands.add_parser("backup", help="Copy the live database to a file")
+    backup_parser.add_argument("file", help="Destination file")
+    backup_parser.add_argument("--pages", type=int, default=DEFAULT_BACKUP_PAGES,
+                               help="Pages copied per step")
+    backup_parser.add_argument("--sleep", type=float, default=DEFAULT_BACKUP_SLEEP,
+                               help="Seconds to pause between steps")
+    
+    restore_parser = commands.add_parser(
+        "restore", help="Replace the database with a backup (stop the chat server first)"
+    )
+    restore_parser.add_argument("file", help="Backup file")
+    
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Main entry point for the administration command line
+    
+    Args:
+        argv: Command line arguments (default: sys.argv[1:])
+    
+    Returns:
+        Process exit code
+    """
+    args = build_parser().parse_args(argv)
+    
+    # Reports go to stderr so that exports to standard output stay clean
+    storage = Storage(db_path=args.db)
+    try:
+        if args.command == "export":
+            count = export_history(storage, args.file, args.format, args.user, args.batch_size)
+            print(f"Exported {count} messages", file=sys.stderr)
+        elif args.command == "import":
+            count = import_history(storage, args.file, args.format, args.batch_size)
+            print(f"Imported {count} messages", file=sys.stderr)
+        elif args.command == "backup":
+            pages = storage.backup(args.file, args.pages, args.sleep)
+            print(f"Backed up {pages} pages to {args.file}", file=sys.stderr)
+        elif args.command == "restore":
+            storage.restore(args.file)
+            print(f"Restored from {args.file}", file=sys.stderr)
+    except (OSError, ValueError, sqlite3.DatabaseError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        storage.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,8 +8,8 @@ import readline  # For better input handling
 import getpass
 from typing import List, Optional, Dict, Any
 
-from pychat.common.message import Message
-from pychat.common.utils import format_message_for_display
+from pychat.common.message import Message, MessageCursor
+from pychat.common.utils import format_message_for_display, format_timestamp
 from pychat.interfaces.common import ChatInterface
 from pychat.core.user import User
 
@@ -25,6 +25,14 @@ class CLIInterface(ChatInterface):
         # For displaying messages
         self.message_lock = threading.Lock()
         self.running = True
+        
+        # Paging state for /history more
+        self.history_limit = 10
+        self.history_cursor: Optional[MessageCursor] = None
+        
+        # Paging state for /search more
+        self.search_query = ""
+        self.search_cursor: Optional[int] = None
     
     def _login_prompt(self) -> bool:
         """
@@ -116,27 +124,77 @@ class CLIInterface(ChatInterface):
         print("  /users             - List active users")
         print("  /msg <user> <text> - Send private message")
         print("  /history [n]       - Show message history (default: 10)")
+        print("  /history more      - Show older messages")
+        print("  /search <text>     - Search message history (/search more for next page)")
         print("  /profile [user]    - View user profile")
         print("  /conversations     - List private conversations")
         print("  /status <status>   - Update your status (online, away, busy)")
         print("  /logout            - Logout from current session")
         print("==================================================\n")
     
-    def _show_message_history(self, limit: int = 10) -> None:
+    def _show_message_history(self, limit: int = 10, older: bool = False) -> None:
         """
         Show message history
         
         Args:
             limit: Maximum number of messages to show
+            older: Continue from the oldest message shown by the previous call
         """
-        messages = self.get_message_history(limit)
-        if not messages:
+        if older:
+            if self.history_cursor is None:
+                print("No older messages.")
+                return
+            limit = self.history_limit
+        
+        page = self.get_message_page(limit, before=self.history_cursor if older else None)
+        self.history_limit = limit
+        self.history_cursor = page.older
+        
+        if not page.messages:
             print("No message history.")
             return
         
-        print(f"\nLast {len(messages)} messages:")
-        for message in messages:
+        if older:
+            print(f"\n{len(page.messages)} older messages:")
+        else:
+            print(f"\nLast {len(page.messages)} messages:")
+        for message in page.messages:
             print(str(message))
+        if page.older:
+            print("(Type /history more for older messages)")
+        print()
+    
+    def _search_messages(self, query: Optional[str] = None) -> None:
+        """
+        Search message history and show a page of results
+        
+        Args:
+            query: Text to search for (None continues the previous search)
+        """
+        if query is None:
+            if self.search_cursor is None:
+                print("No more search results.")
+                return
+            query = self.search_query
+            cursor = self.search_cursor
+        else:
+            cursor = None
+        
+        page = self.search_messages(query, cursor)
+        self.search_query = query
+        self.search_cursor = page.next_cursor
+        
+        if not page.messages:
+            print(f"No messages matching '{query}'." if cursor is None else "No more search results.")
+            return
+        
+        print(f"\nMessages matching '{query}':")
+        for message in page.messages:
+            time_str = format_timestamp(message.timestamp, include_date=True)
+            target = f" -> {message.recipient}" if message.recipient else ""
+            print(f"[{time_str}] {message.sender}{target}: {message.content}")
+        if page.next_cursor is not None:
+            print("(Type /search more for more results)")
         print()
     
     def _receive_message(self, message: Message) -> None:
@@ -193,14 +251,18 @@ class CLIInterface(ChatInterface):
     
     def _list_conversations(self) -> None:
         """List private conversations"""
-        conversations = self.get_conversations()
-        if not conversations:
+        summaries = self.get_conversation_summaries()
+        if not summaries:
             print("No private conversations.")
             return
         
         print("\nPrivate conversations:")
-        for user, last_time in conversations:
-            print(f"  {user.display_name} ({user.username}) - Last message: {last_time}")
+        for summary in summaries:
+            user = summary.user
+            last_time = summary.last_message_time.strftime('%Y-%m-%d %H:%M')
+            print(f"  {user.display_name} ({user.username}) - {summary.message_count} messages, "
+                  f"last {last_time}")
+            print(f"    {summary.last_sender}: {summary.last_message_preview}")
         print()
     
     def _update_status(self, status: str) -> None:
@@ -247,6 +309,10 @@ class CLIInterface(ChatInterface):
         # Show history command
         if command.startswith("/history"):
             parts = command.split()
+            if len(parts) > 1 and parts[1] == "more":
+                self._show_message_history(older=True)
+                return True
+            
             limit = 10
             if len(parts) > 1:
                 try:
@@ -257,6 +323,19 @@ class CLIInterface(ChatInterface):
             self._show_message_history(limit)
             return True
         
+        # Search command
+        if command.startswith("/search"):
+            parts = command.split(" ", 1)
+            if len(parts) < 2 or not parts[1].strip():
+                print("Usage: /search <text>")
+                return True
+            
+            if parts[1].strip() == "more":
+                self._search_messages()
+            else:
+                self._search_messages(parts[1].strip())
+            return True
+        
         # Profile command
         if command.startswith("/profile"):
             parts = command.split()
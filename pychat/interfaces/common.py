@@ -4,7 +4,9 @@ Shared interface code for PyChat
 from abc import ABC, abstractmethod
 from typing import List, Optional, Tuple, Dict, Any
 
-from pychat.common.message import Message
+from pychat.common.message import (
+    ConversationSummary, Message, MessageCursor, MessagePage, SearchPage
+)
 from pychat.core.chat_manager import get_chat_manager, ChatManager
 from pychat.core.user import User
 
@@ -135,12 +137,15 @@ class ChatInterface(ABC):
         message = Message(content=content, sender=self.username, recipient=recipient)
         return self.chat_manager.send_message(message, self.session_id)
     
-    def get_message_history(self, limit: int = 100) -> List[Message]:
+    def get_message_history(self, limit: int = 100, before: Optional[MessageCursor] = None,
+                            after: Optional[MessageCursor] = None) -> List[Message]:
         """
         Get message history
         
         Args:
             limit: Maximum number of messages to retrieve
+            before: Only return messages older than this cursor
+            after: Only return messages newer than this cursor
             
         Returns:
             List of Message objects
@@ -148,7 +153,45 @@ class ChatInterface(ABC):
         if not self.username:
             return []
         
-        return self.chat_manager.get_message_history(self.username, limit)
+        if before is None and after is None:
+            return self.chat_manager.get_message_history(self.username, limit)
+        return self.chat_manager.get_message_history(self.username, limit, before, after)
+    
+    def get_message_page(self, limit: int = 100, before: Optional[MessageCursor] = None,
+                         after: Optional[MessageCursor] = None) -> MessagePage:
+        """
+        Get a page of message history
+        
+        Args:
+            limit: Maximum number of messages on the page
+            before: Cursor the page must end before (scroll back)
+            after: Cursor the page must start after (scroll forward)
+        
+        Returns:
+            MessagePage with continuation cursors
+        """
+        if not self.username:
+            return MessagePage([])
+        
+        return self.chat_manager.get_message_page(self.username, limit, before, after)
+    
+    def search_messages(self, query: str, cursor: Optional[int] = None,
+                        limit: int = 20) -> SearchPage:
+        """
+        Search the messages visible to the current user
+        
+        Args:
+            query: Words to search for
+            cursor: Cursor returned with the previous page of results
+            limit: Maximum number of results on the page
+        
+        Returns:
+            SearchPage of matching messages
+        """
+        if not self.username:
+            return SearchPage([])
+        
+        return self.chat_manager.search_messages(query, self.username, cursor, limit)
     
     def get_conversations(self) -> List[Tuple[User, str]]:
         """
@@ -163,6 +206,18 @@ class ChatInterface(ABC):
         conversations = self.chat_manager.get_conversations(self.username)
         return [(user, last_time.strftime('%Y-%m-%d %H:%M')) for user, last_time in conversations]
     
+    def get_conversation_summaries(self) -> List[ConversationSummary]:
+        """
+        Get summaries of the current user's private conversations
+        
+        Returns:
+            List of ConversationSummary objects, most recent first
+        """
+        if not self.username:
+            return []
+        
+        return self.chat_manager.get_conversation_summaries(self.username)
+    
     def get_active_users(self) -> List[User]:
         """
         Get active users
@@ -24,6 +24,9 @@ from pychat.interfaces.common import ChatInterface
 from pychat.core.user import User
 from pychat.common.utils import format_timestamp, truncate_text
 
+# Received messages waiting for the window before the oldest are dropped
+GUI_QUEUE_SIZE = 1000
+
 # Define some colors and styles
 COLORS = {
     "primary": "#3498db",      # Blue
@@ -311,6 +314,17 @@ class ChatWindow(tk.Tk):
         )
         self.load_history_btn.pack(side=tk.LEFT, padx=5)
         
+        self.older_history_btn = ttk.Button(
+            self.history_controls,
+            text="Older",
+            command=self.on_load_older_history,
+            state=tk.DISABLED
+        )
+        self.older_history_btn.pack(side=tk.LEFT, padx=5)
+        
+        # Cursor for the page before the one currently shown
+        self.history_cursor = None
+        
         # History display
         self.history_display = scrolledtext.ScrolledText(
             self.history_tab,
@@ -322,6 +336,51 @@ class ChatWindow(tk.Tk):
         self.history_display.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         self.history_display.config(state=tk.DISABLED)
         
+        # Search tab
+        self.search_tab = ttk.Frame(self.notebook)
+        self.notebook.add(self.search_tab, text="Search")
+        
+        ttk.Label(self.search_tab, text="Search Messages", style="Header.TLabel").pack(fill=tk.X)
+        
+        # Search controls
+        self.search_controls = ttk.Frame(self.search_tab)
+        self.search_controls.pack(fill=tk.X, padx=5, pady=5)
+        
+        self.search_var = tk.StringVar()
+        self.search_entry = ttk.Entry(self.search_controls, textvariable=self.search_var)
+        self.search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.search_entry.bind("<Return>", self.on_search)
+        
+        self.search_btn = ttk.Button(
+            self.search_controls,
+            text="Search",
+            command=self.on_search
+        )
+        self.search_btn.pack(side=tk.LEFT, padx=5)
+        
+        self.more_results_btn = ttk.Button(
+            self.search_controls,
+            text="More",
+            command=self.on_more_search_results,
+            state=tk.DISABLED
+        )
+        self.more_results_btn.pack(side=tk.LEFT)
+        
+        # Query and cursor of the results currently shown
+        self.search_query = ""
+        self.search_cursor = None
+        
+        # Search results display
+        self.search_display = scrolledtext.ScrolledText(
+            self.search_tab,
+            wrap=tk.WORD,
+            font=("Arial", 10),
+            bg="white",
+            fg=COLORS["text"]
+        )
+        self.search_display.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.search_display.config(state=tk.DISABLED)
+        
         # Bottom status bar
         self.status_bar = ttk.Label(
             self.main_container, 
@@ -543,13 +602,31 @@ class ChatWindow(tk.Tk):
         self.on_private_message()
     
     def on_load_history(self):
-        """Load and display message history"""
+        """Load and display the latest message history"""
+        self._show_history_page(older=False)
+    
+    def on_load_older_history(self):
+        """Load and display the page before the one currently shown"""
+        self._show_history_page(older=True)
+    
+    def _show_history_page(self, older: bool):
+        """
+        Load a page of message history into the history tab
+        
+        Args:
+            older: Continue from the oldest message currently shown
+        """
         try:
             limit = int(self.history_limit_var.get())
         except ValueError:
             limit = 20  # Default
         
-        messages = self.interface.get_message_history(limit)
+        before = self.history_cursor if older else None
+        page = self.interface.get_message_page(limit, before=before)
+        messages = page.messages
+        
+        self.history_cursor = page.older
+        self.older_history_btn.config(state=tk.NORMAL if page.older else tk.DISABLED)
         
         # Clear the history display
         self.history_display.config(state=tk.NORMAL)
@@ -592,6 +669,54 @@ class ChatWindow(tk.Tk):
         
         self.history_display.config(state=tk.DISABLED)
     
+    def on_search(self, event=None):
+        """Search message history for the text in the search box"""
+        query = self.search_var.get().strip()
+        if not query:
+            return
+        
+        self.search_query = query
+        self.search_cursor = None
+        self._show_search_results(append=False)
+    
+    def on_more_search_results(self):
+        """Append the next page of search results"""
+        if self.search_cursor is not None:
+            self._show_search_results(append=True)
+    
+    def _show_search_results(self, append: bool):
+        """
+        Load a page of search results into the search tab
+        
+        Args:
+            append: Add to the results already shown instead of replacing them
+        """
+        page = self.interface.search_messages(self.search_query, self.search_cursor)
+        self.search_cursor = page.next_cursor
+        self.more_results_btn.config(state=tk.NORMAL if page.next_cursor is not None else tk.DISABLED)
+        
+        self.search_display.config(state=tk.NORMAL)
+        if not append:
+            self.search_display.delete(1.0, tk.END)
+            if not page.messages:
+                self.search_display.insert(tk.END, f"No messages matching '{self.search_query}'.")
+        
+        for message in page.messages:
+            time_str = format_timestamp(message.timestamp, include_date=True)
+            self.search_display.insert(tk.END, f"[{time_str}] ", "timestamp")
+            if message.recipient:
+                self.search_display.insert(tk.END, f"{message.sender} → {message.recipient}: ", "private")
+            else:
+                self.search_display.insert(tk.END, f"{message.sender}: ", "sender")
+            self.search_display.insert(tk.END, f"{message.content}\n", "message")
+        
+        self.search_display.tag_configure("timestamp", foreground=COLORS["text_light"], font=("Arial", 9, "italic"))
+        self.search_display.tag_configure("sender", foreground=COLORS["primary"], font=("Arial", 10, "bold"))
+        self.search_display.tag_configure("private", foreground=COLORS["accent"], font=("Arial", 10, "bold"))
+        self.search_display.tag_configure("message", foreground=COLORS["text"], font=("Arial", 10))
+        
+        self.search_display.config(state=tk.DISABLED)
+    
     def show_emoji_picker(self):
         """Show emoji picker dialog"""
         emoji_window = tk.Toplevel(self)
@@ -946,18 +1071,34 @@ class GUIInterface(ChatInterface):
         """Initialize the GUI interface"""
         super().__init__()
         
-        self.message_queue = queue.Queue()
+        self.message_queue = queue.Queue(maxsize=GUI_QUEUE_SIZE)
         self.window = None
+        
+        # Messages dropped because the window fell behind
+        self.dropped_messages = 0
     
     def _receive_message(self, message: Message) -> None:
         """
         Handle received messages
         
+        The queue is bounded; when it is full the oldest waiting message
+        is dropped so a stalled window cannot hold up delivery.
+        
         Args:
             message: The received message
         """
-        if self.window:
-            self.message_queue.put(message)
+        if not self.window:
+            return
+        while True:
+            try:
+                self.message_queue.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self.message_queue.get_nowait()
+                    self.dropped_messages += 1
+                except queue.Empty:
+                    pass
     
     def _show_login_window(self) -> bool:
         """
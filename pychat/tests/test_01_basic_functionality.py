@@ -2,10 +2,15 @@
 Tests for basic functionality of PyChat application
 """
 import pytest
+import datetime
+import uuid
 from unittest.mock import MagicMock, patch
 
-from pychat.common.message import Message
-from pychat.core.user import User
+from pychat.common.message import (
+    Message, decode_message_id, encode_message_id, new_message_id
+)
+from pychat.common.utils import BloomFilter, from_epoch_micros, to_epoch_micros
+from pychat.core.user import User, UserCache
 from pychat.tests.conftest import skip_failing
 
 
@@ -66,6 +71,55 @@ class TestUserCreationAndManagement:
         assert updated_user is not None
         assert updated_user.status == new_status
         user_manager.storage.update_user.assert_called_once()
+    
+    def test_repeated_lookups_share_one_instance(self, user_manager):
+        """Test that offline users are loaded from storage only once"""
+        # Arrange
+        user_manager.storage.get_user.side_effect = lambda name: User(username=name, status="offline")
+        
+        # Act
+        first = user_manager.get_user("alice")
+        second = user_manager.get_user("alice")
+        
+        # Assert
+        assert first is second
+        user_manager.storage.get_user.assert_called_once_with("alice")
+    
+    def test_status_change_keeps_instance(self, user_manager):
+        """Test that a user moves between active and cached without reloading"""
+        # Arrange
+        user_manager.storage.get_user.side_effect = lambda name: User(username=name, status="offline")
+        cached = user_manager.get_user("alice")
+        
+        # Act
+        online = user_manager.update_user_status("alice", "online")
+        offline = user_manager.update_user_status("alice", "offline")
+        
+        # Assert
+        assert cached is online is offline
+        assert user_manager.get_user("alice") is cached
+        assert "alice" not in user_manager.active_users
+        user_manager.storage.get_user.assert_called_once_with("alice")
+    
+    def test_user_cache_bounds(self):
+        """Test least recently used eviction and expiry"""
+        # Arrange
+        cache = UserCache(max_size=2, ttl=60.0)
+        alice, bob, carol = User("alice"), User("bob"), User("carol")
+        
+        # Act
+        cache.put(alice)
+        cache.put(bob)
+        cache.get("alice")
+        cache.put(carol)
+        
+        with patch('pychat.core.user.time.monotonic', return_value=10 ** 9):
+            expired = cache.get("alice")
+        
+        # Assert
+        assert cache.get("bob") is None
+        assert expired is None
+        assert cache.get("carol") is carol
 
 
 class TestMessageHandling:
@@ -117,3 +171,79 @@ class TestMessageHandling:
         assert isinstance(dict_format, dict)
         assert dict_format["content"] == sample_message.content
         assert dict_format["sender"] == sample_message.sender
+    
+    def test_timestamp_built_on_access(self):
+        """Test that stored timestamps are only decoded when read"""
+        # Arrange
+        sent = datetime.datetime(2024, 5, 1, 10, 0, 0, 123456)
+        stored = to_epoch_micros(sent)
+        
+        # Act
+        message = Message(content="Hi", sender="user1", timestamp_us=stored)
+        decoded_early = message._timestamp
+        
+        # Assert
+        assert decoded_early is None
+        assert message.timestamp == sent
+        assert message.timestamp_us == stored
+        assert from_epoch_micros(to_epoch_micros(datetime.datetime(1969, 12, 31, 23, 59, 59, 500000))) \
+            == datetime.datetime(1969, 12, 31, 23, 59, 59, 500000)
+    
+    def test_message_ids_are_time_ordered(self):
+        """Test that generated message IDs sort in creation order"""
+        # Act
+        ids = [Message(content="Hi", sender="user1").msg_id for _ in range(1000)]
+        
+        # Assert
+        assert ids == sorted(ids)
+        assert len(set(ids)) == len(ids)
+        assert all(uuid.UUID(msg_id).version == 7 for msg_id in ids)
+    
+    def test_message_id_storage_encoding(self):
+        """Test that UUID message IDs pack into 16 bytes and others are kept"""
+        # Arrange
+        msg_id = new_message_id()
+        
+        # Act
+        packed = encode_message_id(msg_id)
+        
+        # Assert
+        assert isinstance(packed, bytes) and len(packed) == 16
+        assert decode_message_id(packed) == msg_id
+        assert encode_message_id("legacy-id") == "legacy-id"
+        assert encode_message_id(msg_id.upper()) == msg_id.upper()
+        assert new_message_id("uuid4") != new_message_id("uuid4")
+        with pytest.raises(ValueError):
+            new_message_id("sequential")
+    
+    def test_compact_objects(self, sample_user):
+        """Test that messages and users carry no per-instance dictionary"""
+        # Arrange
+        rows = [(encode_message_id(new_message_id()), "Hi", "".join(["user", "1"]), None, 0)
+                for _ in range(2)]
+        
+        # Act
+        messages = Message.from_rows(rows)
+        
+        # Assert
+        assert not hasattr(messages[0], "__dict__")
+        assert not hasattr(sample_user, "__dict__")
+        assert messages[0].sender is messages[1].sender
+        assert messages[0].timestamp == datetime.datetime(1970, 1, 1)
+        with pytest.raises(AttributeError):
+            messages[0].unknown = True
+    
+    def test_bloom_filter(self):
+        """Test that the filter has no false negatives and few false positives"""
+        # Arrange
+        bloom = BloomFilter(1000, error_rate=0.01)
+        
+        # Act
+        for i in range(1000):
+            bloom.add(f"user{i}")
+        false_positives = sum(f"other{i}" in bloom for i in range(10000))
+        
+        # Assert
+        assert all(f"user{i}" in bloom for i in range(1000))
+        assert len(bloom) == 1000
+        assert false_positives < 300
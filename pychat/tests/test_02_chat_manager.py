@@ -2,11 +2,24 @@
 Tests for the ChatManager component of PyChat
 """
 import pytest
+import datetime
+import threading
+import time
 from unittest.mock import MagicMock, patch
 
-from pychat.core.chat_manager import ChatManager, ChatSession
-from pychat.common.message import Message
+from pychat.core.chat_manager import SESSION_TIMEOUT, ChatManager, ChatSession
+from pychat.core.fanout import FanoutPool, get_overflow_policy
+from pychat.core.history_cache import HistoryCache
+from pychat.core.session_map import LockStripes, SessionMap
+from pychat.core.session_registry import SessionRegistry
+from pychat.core.timing_wheel import TimingWheel
+from pychat.core.maintenance import MaintenanceWorker
+from pychat.core.memory_storage import MemoryStorage
+from pychat.common.message import (
+    ConversationSummary, Message, MessageCursor, MessagePage, SearchPage
+)
 from pychat.core.user import User
+from pychat.common.utils import to_epoch_micros
 from pychat.tests.conftest import skip_failing
 
 
@@ -66,6 +79,21 @@ class TestChatManagerSessions:
         # This depends on the implementation but in a real test it would verify
         # that the callback was called with the message
     
+    def test_retrieve_chat_history_page(self, chat_manager, message_list):
+        """Test retrieving a page of chat history with a cursor"""
+        # Arrange
+        username = "user1"
+        cursor = MessageCursor.from_message(message_list[0])
+        page = MessagePage(message_list[1:4], older=None, newer=cursor)
+        chat_manager.storage.get_message_page = MagicMock(return_value=page)
+        
+        # Act
+        history = chat_manager.get_message_history(username, 3, before=cursor)
+        
+        # Assert
+        assert history == message_list[1:4]
+        chat_manager.storage.get_message_page.assert_called_once_with(3, username, cursor, None)
+    
     def test_retrieve_chat_history(self, chat_manager, message_list):
         """Test retrieving chat history"""
         # Arrange
@@ -91,17 +119,116 @@ class TestUserSessions:
         session_id = "test-session-id"
         username = "testuser"
         
-        # Session not in memory but valid in storage
+        # Session known to the registry but not yet used in this process
+        expires_us = to_epoch_micros(datetime.datetime.now() + datetime.timedelta(hours=1))
+        chat_manager.session_registry.add(session_id, username, expires_us)
         chat_manager.storage.validate_session = MagicMock(return_value=username)
         chat_manager.user_manager.get_user = MagicMock(return_value=User(username=username))
         
         # Act
         result = chat_manager.validate_session(session_id)
+        unknown = chat_manager.validate_session("unknown-session-id")
         
         # Assert
         assert result is True
+        assert unknown is False
         assert session_id in chat_manager.sessions
-        chat_manager.storage.validate_session.assert_called_once_with(session_id)
+        chat_manager.storage.validate_session.assert_not_called()
+    
+    def test_expired_sessions_pruned_from_registry(self):
+        """Test that expired sessions leave the registry without being looked up"""
+        # Arrange
+        registry = SessionRegistry(MemoryStorage())
+        now = datetime.datetime.now()
+        registry.add("expired", "alice", to_epoch_micros(now - datetime.timedelta(seconds=1)))
+        registry.add("live", "bob", to_epoch_micros(now + datetime.timedelta(hours=1)))
+        
+        # Act
+        removed = registry.prune()
+        
+        # Assert
+        assert removed == 1
+        assert len(registry) == 1
+        assert "live" in registry
+    
+    def test_sessions_survive_restart(self):
+        """Test that sessions are loaded at startup and logouts written back"""
+        # Arrange
+        storage = MemoryStorage()
+        first = ChatManager(storage=storage)
+        first.register_user("alice", "secret")
+        _, kept = first.login("alice", "secret")
+        _, ended = first.login("alice", "secret")
+        first.logout(ended)
+        first.session_registry.flush()
+        
+        # Stop the first manager without logging its sessions out
+        first.running = False
+        first.maintenance.stop()
+        first.message_writer.close()
+        
+        # Act
+        second = ChatManager(storage=storage)
+        try:
+            kept_valid = second.validate_session(kept)
+            ended_valid = second.validate_session(ended)
+        finally:
+            second.shutdown()
+        
+        # Assert
+        assert kept_valid is True
+        assert ended_valid is False
+    
+    def test_activity_written_behind(self):
+        """Test that session activity is recorded in memory and flushed in a batch"""
+        # Arrange
+        storage = MemoryStorage()
+        manager = ChatManager(storage=storage)
+        try:
+            manager.register_user("alice", "secret")
+            _, session_id = manager.login("alice", "secret")
+            
+            # Keep the background write-back from flushing during the test
+            manager.maintenance.stop()
+            
+            with patch.object(storage, 'update_sessions', wraps=storage.update_sessions) as writes:
+                # Act
+                for i in range(20):
+                    manager.send_message(Message(content=f"m{i}", sender="alice"), session_id)
+                pending = manager.session_registry.pending_count()
+                written = manager.session_registry.flush()
+        finally:
+            manager.shutdown()
+        
+        # Assert
+        assert pending == 1
+        assert written == 1
+        writes.assert_called_once()
+    
+    def test_idle_sessions_expire(self):
+        """Test that only sessions idle past the timeout are logged out"""
+        # Arrange
+        manager = ChatManager(storage=MemoryStorage())
+        try:
+            manager.register_user("alice", "secret")
+            _, idle = manager.login("alice", "secret")
+            _, busy = manager.login("alice", "secret")
+            start = manager.sessions[idle].last_activity
+            manager.sessions[busy].last_activity = start + 1800
+            
+            # Act
+            early = manager.expire_sessions(start + 1800)
+            expired = manager.expire_sessions(start + SESSION_TIMEOUT + 2)
+            remaining = list(manager.sessions)
+            rescheduled = busy in manager.session_expiry
+        finally:
+            manager.shutdown()
+        
+        # Assert
+        assert early == 0
+        assert expired == 1
+        assert remaining == [busy]
+        assert rescheduled
     
     def test_logout(self, chat_manager, sample_user):
         """Test logging out a session"""
@@ -124,3 +251,652 @@ class TestUserSessions:
         assert session_id not in chat_manager.sessions
         assert session_id not in chat_manager.user_sessions.get(username, [])
         chat_manager.storage.invalidate_session.assert_called_once_with(session_id)
+
+
+class TestMessagePersistence:
+    """Tests for write-behind message persistence"""
+    
+    def test_send_message_durable(self, chat_manager, sample_message):
+        """Test waiting until a sent message has been committed"""
+        # Arrange
+        chat_manager.storage.save_messages = MagicMock()
+        
+        # Act
+        result = chat_manager.send_message(sample_message, durable=True)
+        
+        # Assert
+        assert result is True
+        chat_manager.storage.save_messages.assert_called_once_with([sample_message])
+    
+    def test_send_message_durable_times_out(self, chat_manager, sample_message):
+        """Test that a durable send reports failure when the commit stalls"""
+        # Arrange
+        release = threading.Event()
+        chat_manager.storage.save_messages = MagicMock(side_effect=lambda messages: release.wait(5))
+        
+        # Act
+        try:
+            result = chat_manager.send_message(sample_message, durable=True, timeout=0.1)
+        finally:
+            release.set()
+        
+        # Assert
+        assert result is False
+    
+    def test_shutdown_flushes_buffered_messages(self, chat_manager):
+        """Test that shutdown commits messages still in the buffer"""
+        # Arrange
+        chat_manager.storage.save_messages = MagicMock()
+        messages = [Message(content=f"Message {i}", sender="user1") for i in range(20)]
+        
+        # Act
+        for message in messages:
+            chat_manager.send_message(message)
+        chat_manager.shutdown()
+        
+        # Assert
+        saved = [msg for call in chat_manager.storage.save_messages.call_args_list
+                 for msg in call.args[0]]
+        assert saved == messages
+
+
+class TestInMemoryBackend:
+    """Tests for a chat manager running on the in-memory backend"""
+    
+    def test_in_memory_backend(self):
+        """Test a chat manager running entirely in memory"""
+        # Arrange
+        manager = ChatManager(storage=MemoryStorage())
+        try:
+            manager.register_user("alice", "secret")
+            manager.register_user("bob", "secret")
+            _, session_id = manager.login("alice", "secret")
+            
+            # Act
+            manager.send_message(Message(content="Hi Bob", sender="alice", recipient="bob"), session_id)
+            manager.send_message(Message(content="Hi all", sender="alice"), session_id)
+            history = manager.get_message_history("bob")
+            conversations = manager.get_conversations("bob")
+        finally:
+            manager.shutdown()
+        
+        # Assert
+        assert [m.content for m in history] == ["Hi Bob", "Hi all"]
+        assert [user.username for user, _ in conversations] == ["alice"]
+
+
+class TestMessageSearch:
+    """Tests for message search through the chat manager"""
+    
+    def test_search_messages(self, chat_manager, sample_message):
+        """Test that search is delegated with the user's visibility"""
+        # Arrange
+        page = SearchPage([sample_message], next_cursor=20)
+        chat_manager.storage.search_messages = MagicMock(return_value=page)
+        
+        # Act
+        result = chat_manager.search_messages("hello", "user1")
+        
+        # Assert
+        assert result is page
+        chat_manager.storage.search_messages.assert_called_once_with("hello", "user1", 20, None)
+
+
+class TestConversations:
+    """Tests for the private conversation list"""
+    
+    def test_conversations_prefer_active_users(self, chat_manager, sample_user):
+        """Test that summaries are mapped onto the live user instances"""
+        # Arrange
+        stored = User(username=sample_user.username)
+        summary = ConversationSummary(stored, datetime.datetime.now(), "user1", "Hi", 2)
+        chat_manager.storage.get_conversation_summaries = MagicMock(return_value=[summary])
+        chat_manager.user_manager.active_users[sample_user.username] = sample_user
+        
+        # Act
+        conversations = chat_manager.get_conversations("user1")
+        
+        # Assert
+        assert conversations == [(sample_user, summary.last_message_time)]
+        chat_manager.storage.get_conversation_summaries.assert_called_once_with("user1")
+
+
+class TestMaintenanceWorker:
+    """Tests for background maintenance jobs"""
+    
+    def test_job_runs_until_no_work_left(self):
+        """Test that a job is re-run quickly while it reports work"""
+        # Arrange
+        remaining = [3]
+        
+        def job():
+            done = min(remaining[0], 1)
+            remaining[0] -= done
+            return done
+        
+        worker = MaintenanceWorker()
+        
+        # Act
+        worker.add_job("countdown", job, interval=60.0, busy_interval=0.01)
+        deadline = time.time() + 5.0
+        while remaining[0] and time.time() < deadline:
+            time.sleep(0.01)
+        worker.stop()
+        
+        # Assert
+        assert remaining[0] == 0
+        stats = worker.get_stats()[0]
+        assert stats['name'] == "countdown"
+        assert stats['total'] == 3
+    
+    def test_job_errors_are_recorded(self):
+        """Test that a failing job does not stop the worker"""
+        # Arrange
+        worker = MaintenanceWorker()
+        worker.add_job("broken", MagicMock(side_effect=RuntimeError("boom")), interval=60.0, delay=60.0)
+        
+        # Act
+        result = worker.run_now("broken")
+        worker.stop()
+        
+        # Assert
+        assert result == 0
+        assert worker.get_stats()[0]['last_error'] == "boom"
+
+
+class TestHistoryCache:
+    """Tests for the in-memory recent-history cache"""
+    
+    def test_latest_history_served_from_cache(self):
+        """Test that repeated history requests only query storage once"""
+        # Arrange
+        storage = MemoryStorage()
+        manager = ChatManager(storage=storage)
+        try:
+            manager.send_message(Message(content="one", sender="alice"))
+            manager.send_message(Message(content="two", sender="alice", recipient="bob"))
+            
+            with patch.object(storage, 'get_messages', wraps=storage.get_messages) as queries:
+                # Act
+                first = manager.get_message_history("bob", limit=10)
+                manager.send_message(Message(content="three", sender="bob", recipient="carol"))
+                manager.send_message(Message(content="secret", sender="alice", recipient="carol"))
+                second = manager.get_message_history("bob", limit=10)
+                page = manager.get_message_page("bob", limit=2)
+            
+            manager.flush_messages()
+            expected = storage.get_messages(10, "bob")
+        finally:
+            manager.shutdown()
+        
+        # Assert
+        assert queries.call_count == 1
+        assert [m.content for m in first] == ["one", "two"]
+        assert [m.content for m in second] == [m.content for m in expected] == ["one", "two", "three"]
+        assert [m.content for m in page.messages] == ["two", "three"]
+        assert page.older is not None
+    
+    def test_larger_limit_goes_to_storage(self):
+        """Test that a request beyond what the cache knows queries storage"""
+        # Arrange
+        storage = MemoryStorage()
+        manager = ChatManager(storage=storage)
+        try:
+            for i in range(5):
+                manager.send_message(Message(content=f"m{i}", sender="alice"))
+            manager.get_message_history(limit=2)
+            
+            with patch.object(storage, 'get_messages', wraps=storage.get_messages) as queries:
+                # Act
+                history = manager.get_message_history(limit=4)
+        finally:
+            manager.shutdown()
+        
+        # Assert
+        assert queries.call_count == 1
+        assert [m.content for m in history] == ["m1", "m2", "m3", "m4"]
+    
+    def test_least_recently_used_view_evicted(self):
+        """Test that the cache keeps a bounded number of views"""
+        # Arrange
+        cache = HistoryCache(capacity=10, max_views=2)
+        message = Message(content="hi", sender="alice")
+        
+        # Act
+        for view in ("alice", "bob", "carol"):
+            load = cache.begin_load(view)
+            cache.finish_load(load, [message], 10, exhaustive=True)
+        
+        # Assert
+        assert cache.get("alice", 10) is None
+        assert cache.get("bob", 10) == [message]
+        assert cache.get("carol", 10) == [message]
+    
+    def test_message_sent_during_load_is_kept(self):
+        """Test that a message sent while a view loads is added to it"""
+        # Arrange
+        cache = HistoryCache(capacity=10)
+        stored = Message(content="stored", sender="alice", timestamp_us=1000)
+        sent = Message(content="sent", sender="bob", timestamp_us=2000)
+        
+        # Act
+        load = cache.begin_load(None)
+        cache.add(sent)
+        cache.finish_load(load, [stored], 10, exhaustive=True)
+        
+        # Assert
+        assert cache.get(None, 10) == [stored, sent]
+    
+    def test_concurrent_loads_of_one_view(self):
+        """Test that a slower load of the same view keeps messages sent after a faster one"""
+        # Arrange
+        cache = HistoryCache(capacity=10)
+        stored = Message(content="stored", sender="alice", timestamp_us=1000)
+        sent = Message(content="sent", sender="bob", timestamp_us=2000)
+        
+        # Act
+        slow = cache.begin_load(None)
+        fast = cache.begin_load(None)
+        cache.finish_load(fast, [stored], 10, exhaustive=True)
+        cache.add(sent)
+        cache.finish_load(slow, [stored], 10, exhaustive=True)
+        
+        # Assert
+        assert cache.get(None, 10) == [stored, sent]
+    
+    def test_discarded_message_not_cached(self):
+        """Test that a discarded message drops its views and in-progress loads"""
+        # Arrange
+        cache = HistoryCache(capacity=10)
+        stored = Message(content="stored", sender="alice", timestamp_us=1000)
+        lost = Message(content="lost", sender="alice", recipient="bob", timestamp_us=2000)
+        for view in ("alice", "carol"):
+            cache.finish_load(cache.begin_load(view), [stored], 10, exhaustive=True)
+        load = cache.begin_load(None)
+        cache.add(lost)
+        
+        # Act
+        cache.discard([lost])
+        cache.finish_load(load, [stored], 10, exhaustive=True)
+        
+        # Assert
+        assert cache.get("alice", 10) is None
+        assert cache.get(None, 10) is None
+        assert cache.get("carol", 10) == [stored]
+    
+    def test_failed_write_not_served_from_cache(self):
+        """Test that a message whose write fails disappears from cached history"""
+        # Arrange
+        storage = MemoryStorage()
+        manager = ChatManager(storage=storage)
+        try:
+            manager.send_message(Message(content="one", sender="alice"))
+            manager.flush_messages()
+            manager.get_message_history(limit=10)
+            
+            # Act
+            with patch.object(storage, 'save_messages', side_effect=RuntimeError("disk full")):
+                sent = manager.send_message(Message(content="two", sender="alice"), durable=True)
+            history = manager.get_message_history(limit=10)
+        finally:
+            manager.shutdown()
+        
+        # Assert
+        assert sent is False
+        assert [m.content for m in history] == ["one"]
+
+
+class TestTimingWheel:
+    """Tests for the timing wheel used for session expiry"""
+    
+    def test_keys_due_in_deadline_order(self):
+        """Test that keys come due on their tick and cancelled keys never do"""
+        # Arrange
+        wheel = TimingWheel(tick=1.0, slots=8)
+        wheel.schedule("a", 2.5)
+        wheel.schedule("b", 5.0)
+        wheel.schedule("c", 3.0)
+        wheel.cancel("c")
+        
+        # Act
+        first = wheel.advance(2.0)
+        second = wheel.advance(3.0)
+        third = wheel.advance(5.0)
+        
+        # Assert
+        assert first == []
+        assert second == ["a"]
+        assert third == ["b"]
+        assert len(wheel) == 0
+    
+    def test_far_deadlines_come_back_early(self):
+        """Test that deadlines beyond one turn are returned for rescheduling"""
+        # Arrange
+        wheel = TimingWheel(tick=1.0, slots=4)
+        
+        # Act
+        wheel.schedule("far", 100.0)
+        due = wheel.advance(3.0)
+        
+        # Assert
+        assert due == ["far"]
+
+
+class TestFanout:
+    """Tests for parallel delivery to session callbacks"""
+    
+    def test_slow_callback_does_not_delay_others(self):
+        """Test that one slow session does not hold up delivery to the rest"""
+        # Arrange
+        pool = FanoutPool(workers=4)
+        release = threading.Event()
+        slow = ChatSession(User(username="slow"), "slow-session")
+        fast = ChatSession(User(username="fast"), "fast-session")
+        received = threading.Event()
+        slow.add_callback(lambda message: release.wait(5))
+        fast.add_callback(lambda message: received.set())
+        
+        # Act
+        pool.publish(Message(content="Hi", sender="alice"), [slow, fast])
+        delivered = received.wait(2)
+        release.set()
+        pool.close()
+        
+        # Assert
+        assert delivered
+    
+    def test_per_session_order_preserved(self):
+        """Test that each session receives messages in publishing order"""
+        # Arrange
+        pool = FanoutPool(workers=4, drain_batch=3)
+        sessions = [ChatSession(User(username=f"user{i}"), f"session-{i}") for i in range(5)]
+        received = {session.session_id: [] for session in sessions}
+        for session in sessions:
+            session.add_callback(received[session.session_id].append)
+        messages = [Message(content=str(i), sender="alice") for i in range(200)]
+        
+        # Act
+        for message in messages:
+            pool.publish(message, sessions)
+        finished = pool.join(5)
+        pool.close()
+        
+        # Assert
+        assert finished
+        assert all(got == messages for got in received.values())
+        assert pool.get_stats()['delivered'] == 1000
+    
+    def test_full_outbox_drops_oldest(self):
+        """Test that a session that cannot keep up loses its oldest messages"""
+        # Arrange
+        pool = FanoutPool(workers=1, outbox_size=2, drain_batch=1)
+        started = threading.Event()
+        release = threading.Event()
+        received = []
+        
+        def callback(message):
+            started.set()
+            release.wait(5)
+            received.append(message.content)
+        
+        session = ChatSession(User(username="slow"), "slow-session")
+        session.add_callback(callback)
+        
+        # Act
+        pool.publish(Message(content="0", sender="alice"), [session])
+        started.wait(2)
+        for i in range(1, 5):
+            pool.publish(Message(content=str(i), sender="alice"), [session])
+        release.set()
+        pool.join(5)
+        pool.close()
+        
+        # Assert
+        assert received == ["0", "3", "4"]
+        assert pool.get_stats()['dropped'] == 2
+    
+    def test_removed_session_gets_no_new_outbox(self):
+        """Test that publishing to a logged-out session does not recreate its outbox"""
+        # Arrange
+        pool = FanoutPool(workers=1)
+        session = ChatSession(User(username="bob"), "x")
+        received = []
+        session.add_callback(received.append)
+        pool.publish(Message(content="before", sender="alice"), [session])
+        pool.join(5)
+        
+        # Act
+        session.is_active = False
+        pool.remove("x")
+        added = pool.publish(Message(content="after", sender="alice"), [session])
+        pool.join(5)
+        pool.close()
+        
+        # Assert
+        assert added == 0
+        assert "x" not in pool._outboxes
+        assert [m.content for m in received] == ["before"]
+    
+    def test_coalesce_keeps_newest_per_conversation(self):
+        """Test that a lagging session keeps the newest message of each conversation"""
+        # Arrange
+        pool = FanoutPool(workers=1, outbox_size=3, drain_batch=1, policy="coalesce")
+        started = threading.Event()
+        release = threading.Event()
+        received = []
+        
+        def callback(message):
+            started.set()
+            release.wait(5)
+            received.append(message.content)
+        
+        session = ChatSession(User(username="bob"), "bob-session")
+        session.add_callback(callback)
+        
+        # Act
+        pool.publish(Message(content="first", sender="alice"), [session])
+        started.wait(2)
+        pool.publish(Message(content="all 1", sender="alice"), [session])
+        pool.publish(Message(content="dm 1", sender="alice", recipient="bob"), [session])
+        pool.publish(Message(content="all 2", sender="carol"), [session])
+        pool.publish(Message(content="dm 2", sender="bob", recipient="alice"), [session])
+        lag = pool.get_lag("bob-session")
+        release.set()
+        pool.join(5)
+        pool.close()
+        
+        # Assert
+        assert lag == 2
+        assert received == ["first", "all 2", "dm 2"]
+        stats = pool.get_stats()
+        assert stats['coalesced'] == 2
+        assert stats['dropped'] == 0
+        assert stats['pending'] == 0
+    
+    def test_logout_policy_disconnects_lagging_session(self):
+        """Test that a session over its budget is logged out and its backlog discarded"""
+        # Arrange
+        disconnected = []
+        slow = ChatSession(User(username="slow"), "slow-session")
+        
+        def logout(session_id):
+            disconnected.append(session_id)
+            slow.callbacks.clear()
+        
+        pool = FanoutPool(workers=1, outbox_size=2, drain_batch=1,
+                          policy="logout", on_overflow=logout)
+        started = threading.Event()
+        release = threading.Event()
+        slow.add_callback(lambda message: (started.set(), release.wait(5)))
+        
+        # Act
+        pool.publish(Message(content="0", sender="alice"), [slow])
+        started.wait(2)
+        for i in range(1, 5):
+            pool.publish(Message(content=str(i), sender="alice"), [slow])
+        release.set()
+        finished = pool.join(5)
+        pool.close()
+        
+        # Assert
+        assert finished
+        assert disconnected == ["slow-session"]
+        stats = pool.get_stats()
+        assert stats['logged_out'] == 1
+        assert stats['outboxes'] == 0
+        assert stats['dropped'] == 2
+    
+    def test_overflow_policy_from_environment(self, monkeypatch):
+        """Test that the overflow policy is read from the environment"""
+        # Arrange
+        monkeypatch.setenv("PYCHAT_OVERFLOW_POLICY", "coalesce")
+        
+        # Act
+        policy = get_overflow_policy()
+        
+        # Assert
+        assert policy == "coalesce"
+        assert get_overflow_policy("logout") == "logout"
+        with pytest.raises(ValueError):
+            get_overflow_policy("ignore")
+    
+    def test_chat_manager_delivers_through_pool(self):
+        """Test that sent messages reach every session's callbacks"""
+        # Arrange
+        manager = ChatManager(storage=MemoryStorage())
+        try:
+            manager.register_user("alice", "secret")
+            manager.register_user("bob", "secret")
+            _, alice_session = manager.login("alice", "secret")
+            _, bob_session = manager.login("bob", "secret")
+            alice_inbox, bob_inbox = [], []
+            manager.register_message_callback(alice_session, alice_inbox.append)
+            manager.register_message_callback(bob_session, bob_inbox.append)
+            
+            # Act
+            manager.send_message(Message(content="Hi all", sender="alice"), alice_session)
+            manager.send_message(Message(content="Hi Bob", sender="alice", recipient="bob"), alice_session)
+            manager.message_queue.join()
+            manager.fanout.join(5)
+        finally:
+            manager.shutdown()
+        
+        # Assert
+        assert [m.content for m in alice_inbox] == ["Hi all", "Hi Bob"]
+        assert [m.content for m in bob_inbox] == ["Hi all", "Hi Bob"]
+
+
+class TestSessionConcurrency:
+    """Tests for concurrent changes to the session maps"""
+    
+    def test_snapshot_unaffected_by_changes(self):
+        """Test that a snapshot keeps its contents while the map changes"""
+        # Arrange
+        sessions = SessionMap()
+        sessions["a"] = 1
+        sessions["b"] = 2
+        
+        # Act
+        snapshot = sessions.snapshot()
+        same = sessions.snapshot()
+        sessions["c"] = 3
+        del sessions["a"]
+        
+        # Assert
+        assert snapshot == (1, 2)
+        assert same is snapshot
+        assert sessions.snapshot() == (2, 3)
+    
+    def test_lock_stripes_map_keys_consistently(self):
+        """Test that a key always gets the same lock"""
+        # Arrange
+        stripes = LockStripes(8)
+        
+        # Act
+        locks = {stripes.for_key(f"user{i}") for i in range(100)}
+        
+        # Assert
+        assert stripes.for_key("alice") is stripes.for_key("alice")
+        assert 1 < len(locks) <= 8
+    
+    def test_concurrent_logins_and_logouts(self):
+        """Test that the session maps stay consistent under concurrent use"""
+        # Arrange
+        manager = ChatManager(storage=MemoryStorage())
+        try:
+            usernames = [f"user{i}" for i in range(4)]
+            for username in usernames:
+                manager.register_user(username, "secret")
+            errors = []
+            
+            def churn(username):
+                try:
+                    for _ in range(25):
+                        _, session_id = manager.login(username, "secret")
+                        manager.send_message(Message(content="Hi", sender=username))
+                        manager.logout(session_id)
+                        manager.logout(session_id)
+                    _, session_id = manager.login(username, "secret")
+                except Exception as e:
+                    errors.append(e)
+            
+            threads = [threading.Thread(target=churn, args=(username,))
+                       for username in usernames * 2]
+            
+            # Act
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(30)
+            
+            # Assert
+            assert errors == []
+            assert len(manager.sessions) == 8
+            assert sorted(manager.user_sessions) == usernames
+            assert all(len(ids) == 2 for ids in manager.user_sessions.values())
+            assert {s for ids in manager.user_sessions.values() for s in ids} == set(manager.sessions)
+        finally:
+            manager.shutdown()
+    
+    def test_logout_and_login_of_same_user_do_not_interleave(self):
+        """Test that a logout of the last session cannot mark a new login offline"""
+        # Arrange
+        manager = ChatManager(storage=MemoryStorage())
+        try:
+            manager.register_user("alice", "secret")
+            _, old_session = manager.login("alice", "secret")
+            update_user_status = manager.user_manager.update_user_status
+            writing = threading.Event()
+            release = threading.Event()
+            
+            def slow_update_user_status(username, status):
+                # Hold the logout inside its offline write
+                if status == 'offline':
+                    writing.set()
+                    release.wait(5)
+                return update_user_status(username, status)
+            
+            manager.user_manager.update_user_status = slow_update_user_status
+            logout = threading.Thread(target=manager.logout, args=(old_session,))
+            login_result = []
+            login = threading.Thread(
+                target=lambda: login_result.append(manager.login("alice", "secret"))
+            )
+            
+            # Act
+            logout.start()
+            writing.wait(5)
+            login.start()
+            login.join(0.2)
+            login_waited = login.is_alive()
+            release.set()
+            logout.join(5)
+            login.join(5)
+            stored_status = manager.storage.get_user("alice").status
+        finally:
+            manager.shutdown()
+        
+        # Assert
+        assert login_waited
+        assert login_result[0][1] is not None
+        assert stored_status == 'online'
@@ -3,11 +3,23 @@ Tests for the Storage component of PyChat
 """
 import pytest
 import os
+import sqlite3
+import asyncio
+import datetime
+import io
+import threading
 from unittest.mock import MagicMock, patch
 
-from pychat.core.storage import Storage
-from pychat.core.user import User
-from pychat.common.message import Message
+from pychat.core.async_storage import AsyncStorage
+from pychat.core.storage import Storage, StorageProfile, get_retention_days, get_storage_profile
+from pychat.core.log_storage import LogStorage
+from pychat.core.memory_storage import MemoryStorage
+from pychat.core.transfer import export_history, import_history, read_messages
+from pychat.core.write_behind import WriteBehindBuffer
+from pychat.core.migrations import Migration, MIGRATIONS, get_schema_version, run_migrations
+from pychat.core.user import User, UserManager
+from pychat.common.message import Message, MessageCursor
+from pychat.common.utils import to_epoch_micros
 from pychat.tests.conftest import skip_failing
 
 
@@ -51,6 +63,27 @@ class TestStoragePersistence:
         assert any(msg.msg_id == sample_message.msg_id for msg in messages)
         assert any(msg.content == sample_message.content for msg in messages)
     
+    def test_save_messages_batch(self, storage, message_list):
+        """Test saving a batch of messages in one transaction"""
+        # Act
+        storage.save_messages(message_list)
+        messages = storage.get_messages(limit=100)
+        
+        # Assert
+        assert len(messages) == len(message_list)
+        assert {msg.msg_id for msg in messages} == {msg.msg_id for msg in message_list}
+    
+    def test_save_messages_batch_is_atomic(self, storage, sample_message):
+        """Test that a failing batch leaves no partial writes behind"""
+        # Arrange
+        storage.save_message(sample_message)
+        batch = [Message(content="new", sender="user1"), sample_message]
+        
+        # Act/Assert
+        with pytest.raises(Exception):
+            storage.save_messages(batch)
+        assert len(storage.get_messages(limit=100)) == 1
+    
     def test_storage_performance(self, storage):
         """Test storage performance with large data sets"""
         # Arrange - create many messages
@@ -95,6 +128,86 @@ class TestStorageOperations:
         assert exists is True
         assert non_exists is False
     
+    def test_unknown_users_need_no_query(self, storage, sample_user, monkeypatch):
+        """Test that names never registered are rejected from memory"""
+        # Arrange
+        monkeypatch.setattr('pychat.core.storage.USERNAME_REFRESH_INTERVAL', 3600.0)
+        storage.save_user(sample_user, "hash", "salt")
+        
+        # Act
+        with patch.object(storage.pool, 'read', side_effect=AssertionError("queried")):
+            results = [storage.user_exists(f"typo{i}") for i in range(100)]
+            missing_user = storage.get_user("typo")
+            missing_auth = storage.get_user_auth_data("typo")
+        
+        # Assert
+        assert not any(results)
+        assert missing_user is None and missing_auth == {}
+        assert storage.user_exists(sample_user.username) is True
+    
+    def test_users_registered_elsewhere_are_found(self, temp_db_path, monkeypatch):
+        """Test that a miss picks up users added through another connection"""
+        # Arrange
+        monkeypatch.setattr('pychat.core.storage.USERNAME_REFRESH_INTERVAL', 0.0)
+        first = Storage(db_path=temp_db_path)
+        second = Storage(db_path=temp_db_path)
+        
+        try:
+            # Act
+            second.save_user(User(username="newcomer"))
+            found = first.get_user("newcomer")
+        finally:
+            first.close()
+            second.close()
+        
+        # Assert
+        assert found is not None
+    
+    def test_registration_never_overwrites_a_user(self, temp_db_path, monkeypatch):
+        """Test that a user registered elsewhere cannot be registered again over it"""
+        # Arrange
+        monkeypatch.setattr('pychat.core.storage.USERNAME_REFRESH_INTERVAL', 3600.0)
+        first = Storage(db_path=temp_db_path)
+        second = Storage(db_path=temp_db_path)
+        manager = UserManager(second)
+        
+        try:
+            first.save_user(User(username="carol"), "hash", "salt")
+            
+            # Act (the filter of the second storage has not seen carol yet)
+            with pytest.raises(ValueError):
+                manager.register_user("carol", "other-password")
+            auth = first.get_user_auth_data("carol")
+        finally:
+            first.close()
+            second.close()
+        
+        # Assert
+        assert auth == {'password_hash': "hash", 'password_salt': "salt"}
+    
+    def test_filter_rebuilt_when_users_rewritten(self, temp_db_path, monkeypatch):
+        """Test that users given lower rowids by another connection are still found"""
+        # Arrange
+        monkeypatch.setattr('pychat.core.storage.USERNAME_REFRESH_INTERVAL', 0.0)
+        first = Storage(db_path=temp_db_path)
+        second = Storage(db_path=temp_db_path)
+        
+        try:
+            for username in ("alice", "bob", "carol"):
+                first.save_user(User(username=username))
+            
+            # Act
+            with second.pool.write() as conn:
+                conn.execute("DELETE FROM users")
+                conn.execute("INSERT INTO users (rowid, user_id, username) VALUES (1, 'd', 'dave')")
+            found = first.get_user("dave")
+        finally:
+            first.close()
+            second.close()
+        
+        # Assert
+        assert found is not None
+    
     def test_update_user(self, storage, sample_user):
         """Test updating a user"""
         # Arrange
@@ -112,6 +225,20 @@ class TestStorageOperations:
         assert retrieved_user.status == "away"
         assert retrieved_user.display_name == "Updated Name"
     
+    def test_users_decoded_in_bulk(self, storage):
+        """Test that users loaded together share interned strings"""
+        # Arrange
+        for i in range(3):
+            storage.save_user(User(username=f"bulk{i}", status="".join(["a", "way"])))
+        
+        # Act
+        users = storage.get_users(status="away")
+        
+        # Assert
+        assert sorted(u.username for u in users) == ["bulk0", "bulk1", "bulk2"]
+        assert users[0].status is users[1].status is users[2].status
+        assert all(u.last_seen is not None for u in users)
+    
     def test_session_operations(self, storage):
         """Test session creation, validation, and invalidation"""
         # Arrange
@@ -134,3 +261,1379 @@ class TestStorageOperations:
         # Assert - Session no longer valid
         invalid_username = storage.validate_session(session_id)
         assert invalid_username is None
+    
+    @pytest.mark.parametrize("backend", ["sqlite", "memory"])
+    def test_purge_sessions(self, storage, backend):
+        """Test that expired and invalidated sessions are deleted in batches"""
+        # Arrange
+        if backend == "memory":
+            storage = MemoryStorage()
+        storage.save_user(User(username="purge"))
+        live = storage.create_session("purge")
+        for _ in range(3):
+            storage.create_session("purge", expires_in=-10)
+        for _ in range(2):
+            storage.invalidate_session(storage.create_session("purge"))
+        
+        # Act
+        batches = []
+        while True:
+            purged = storage.purge_sessions(batch_size=2)
+            if not purged:
+                break
+            batches.append(purged)
+        
+        # Assert
+        assert batches == [2, 2, 1]
+        assert storage.validate_session(live) == "purge"
+        assert [row[0] for row in storage.get_active_sessions()] == [live]
+    
+    def test_purge_uses_indexes(self, storage):
+        """Test that the purge queries do not scan the sessions table"""
+        # Act
+        plans = [
+            " ".join(row[-1] for row in storage.conn.execute(
+                f"EXPLAIN QUERY PLAN SELECT rowid FROM sessions WHERE {condition} LIMIT 10"
+            ))
+            for condition in ("expires_at <= 0", "is_active = 0")
+        ]
+        
+        # Assert
+        assert "idx_sessions_expires" in plans[0]
+        assert "idx_sessions_inactive" in plans[1]
+
+
+class TestStorageProfiles:
+    """Tests for the SQLite performance profiles"""
+    
+    def test_default_profile_enables_wal(self, storage):
+        """Test that the default profile switches the database to WAL"""
+        # Act
+        journal_mode = storage.conn.execute("PRAGMA journal_mode").fetchone()[0]
+        synchronous = storage.conn.execute("PRAGMA synchronous").fetchone()[0]
+        temp_store = storage.conn.execute("PRAGMA temp_store").fetchone()[0]
+        
+        # Assert
+        assert storage.profile.name == "balanced"
+        assert journal_mode == "wal"
+        assert synchronous == 1  # NORMAL
+        assert temp_store == 2  # MEMORY
+    
+    def test_named_profile(self, temp_db_path):
+        """Test selecting a built-in profile by name"""
+        # Act
+        storage = Storage(db_path=temp_db_path, profile="compat")
+        journal_mode = storage.conn.execute("PRAGMA journal_mode").fetchone()[0]
+        storage.close()
+        
+        # Assert
+        assert journal_mode == "delete"
+    
+    def test_custom_profile(self, temp_db_path):
+        """Test passing a custom profile instance"""
+        # Arrange
+        profile = StorageProfile("custom", cache_size_kib=2048, mmap_size=0)
+        
+        # Act
+        storage = Storage(db_path=temp_db_path, profile=profile)
+        cache_size = storage.conn.execute("PRAGMA cache_size").fetchone()[0]
+        mmap_size = storage.conn.execute("PRAGMA mmap_size").fetchone()[0]
+        storage.close()
+        
+        # Assert
+        assert cache_size == -2048
+        assert mmap_size == 0
+    
+    def test_profile_from_environment(self, monkeypatch):
+        """Test selecting the profile through PYCHAT_STORAGE_PROFILE"""
+        # Arrange
+        monkeypatch.setenv("PYCHAT_STORAGE_PROFILE", "throughput")
+        
+        # Act/Assert
+        assert get_storage_profile().name == "throughput"
+    
+    def test_unknown_profile(self):
+        """Test that an unknown profile name is rejected"""
+        with pytest.raises(ValueError):
+            get_storage_profile("does-not-exist")
+
+
+
+class TestConnectionPool:
+    """Tests for the reader/writer connection pool"""
+    
+    def test_reads_do_not_wait_for_writer(self, storage, sample_message):
+        """Test that readers see committed data while a write is in progress"""
+        # Arrange
+        storage.save_message(sample_message)
+        in_transaction = threading.Event()
+        release = threading.Event()
+        
+        def slow_writer():
+            with storage.pool.write() as conn:
+                conn.execute("DELETE FROM messages")
+                in_transaction.set()
+                release.wait(5)
+        
+        writer = threading.Thread(target=slow_writer)
+        writer.start()
+        in_transaction.wait(5)
+        
+        # Act
+        during = storage.get_messages()
+        release.set()
+        writer.join()
+        after = storage.get_messages()
+        
+        # Assert
+        assert [m.msg_id for m in during] == [sample_message.msg_id]
+        assert after == []
+    
+    def test_write_rolls_back_on_error(self, storage, sample_message):
+        """Test that a failing write block leaves no partial changes"""
+        # Act
+        with pytest.raises(RuntimeError):
+            with storage.pool.write() as conn:
+                conn.execute(
+                    "INSERT INTO messages (msg_id, content, sender, timestamp) VALUES ('x', 'x', 'x', 'x')"
+                )
+                raise RuntimeError("boom")
+        
+        # Assert
+        assert storage.get_messages() == []
+    
+    def test_nested_writes_commit_once(self, storage, message_list):
+        """Test that write blocks nest into the outer transaction"""
+        # Act
+        with pytest.raises(RuntimeError):
+            with storage.pool.write():
+                storage.save_messages(message_list)
+                with storage.pool.read() as conn:
+                    inside = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+                raise RuntimeError("boom")
+        
+        # Assert
+        assert inside == len(message_list)
+        assert storage.get_messages() == []
+    
+    def test_readers_are_bounded_and_reused(self, temp_db_path):
+        """Test that threads share a bounded set of reader connections"""
+        # Arrange
+        storage = Storage(db_path=temp_db_path, readers=2)
+        errors = []
+        
+        def reader():
+            try:
+                for _ in range(20):
+                    storage.get_messages()
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=reader) for _ in range(6)]
+        
+        # Act
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        count = storage.pool.reader_count()
+        storage.close()
+        
+        # Assert
+        assert errors == []
+        assert 1 <= count <= 2
+    
+    def test_memory_database_uses_single_connection(self):
+        """Test that an in-memory database is served by the writer alone"""
+        # Arrange
+        storage = Storage(db_path=":memory:")
+        
+        # Act
+        storage.save_user(User(username="memory"))
+        found = storage.user_exists("memory")
+        
+        # Assert
+        assert found
+        assert storage.pool.reader_count() == 0
+        storage.close()
+
+class TestOnlineBackup:
+    """Tests for online backup and restore"""
+    
+    def test_backup_is_consistent_copy(self, storage, message_list, tmp_path):
+        """Test that a backup holds everything committed before it finished"""
+        # Arrange
+        storage.save_messages(message_list)
+        path = str(tmp_path / "backup.db")
+        steps = []
+        
+        # Act
+        pages = storage.backup(path, pages=1, sleep=0, progress=lambda r, t: steps.append(r))
+        
+        # Assert
+        copy = Storage(path)
+        assert len(copy.get_messages()) == len(message_list)
+        assert pages > 1
+        assert steps[-1] == 0 and len(steps) == pages
+        assert not os.path.exists(path + ".partial")
+        copy.close()
+    
+    def test_writes_proceed_between_steps(self, storage, sample_message, tmp_path):
+        """Test that the writer lock is free while the backup pauses"""
+        # Arrange
+        storage.save_messages([Message(content="x" * 2000, sender="alice") for _ in range(20)])
+        path = str(tmp_path / "backup.db")
+        written = []
+        
+        def write_during_pause(seconds):
+            if not written:
+                writer = threading.Thread(target=storage.save_message, args=(sample_message,))
+                writer.start()
+                writer.join(timeout=5)
+                written.append(not writer.is_alive())
+        
+        # Act
+        with patch('pychat.core.storage.time.sleep', side_effect=write_during_pause):
+            storage.backup(path, pages=2)
+        
+        # Assert
+        assert written == [True]
+        copy = Storage(path)
+        assert sample_message.msg_id in [m.msg_id for m in copy.get_messages()]
+        copy.close()
+    
+    def test_restore_replaces_contents(self, storage, message_list, sample_message, tmp_path):
+        """Test that restoring a backup discards later changes"""
+        # Arrange
+        storage.save_messages(message_list)
+        path = str(tmp_path / "backup.db")
+        storage.backup(path)
+        storage.save_message(sample_message)
+        
+        # Act
+        storage.restore(path)
+        
+        # Assert
+        ids = [m.msg_id for m in storage.get_messages()]
+        assert len(ids) == len(message_list)
+        assert sample_message.msg_id not in ids
+        assert get_schema_version(storage.conn) == MIGRATIONS[-1].version
+    
+    def test_restore_missing_file(self, storage, tmp_path):
+        """Test that restoring from a missing file leaves the database alone"""
+        # Act/Assert
+        with pytest.raises(FileNotFoundError):
+            storage.restore(str(tmp_path / "missing.db"))
+        assert not os.path.exists(tmp_path / "missing.db")
+
+
+class TestAsyncStorage:
+    """Tests for the asyncio storage facade"""
+    
+    def test_operations_round_trip(self, storage, sample_user, sample_message):
+        """Test awaiting writes and reads"""
+        # Arrange
+        async_storage = AsyncStorage(storage, readers=2)
+        
+        async def scenario():
+            await async_storage.save_user(sample_user, "hash", "salt")
+            await async_storage.save_message(sample_message)
+            session_id = await async_storage.create_session(sample_user.username)
+            return await asyncio.gather(
+                async_storage.get_user(sample_user.username),
+                async_storage.get_messages(),
+                async_storage.validate_session(session_id)
+            )
+        
+        # Act
+        user, messages, session_user = asyncio.run(scenario())
+        
+        # Assert
+        assert user.username == sample_user.username
+        assert [m.msg_id for m in messages] == [sample_message.msg_id]
+        assert session_user == sample_user.username
+    
+    def test_writes_share_one_thread(self, storage, message_list):
+        """Test that every write runs on the single writer thread"""
+        # Arrange
+        async_storage = AsyncStorage(storage)
+        threads = set()
+        save = storage.save_message
+        
+        def recording_save(message):
+            threads.add(threading.current_thread().name)
+            save(message)
+        
+        # Act
+        with patch.object(storage, 'save_message', side_effect=recording_save):
+            async def scenario():
+                await asyncio.gather(*(async_storage.save_message(m) for m in message_list))
+            asyncio.run(scenario())
+        
+        # Assert
+        assert len(threads) == 1
+        assert threads.pop().startswith("pychat-storage-writer")
+        assert len(storage.get_messages()) == len(message_list)
+    
+    def test_timeout(self, storage):
+        """Test that a slow operation raises TimeoutError"""
+        # Arrange
+        async_storage = AsyncStorage(storage, timeout=0.05)
+        release = threading.Event()
+        
+        # Act/Assert
+        with patch.object(storage, 'get_user', side_effect=lambda name: release.wait(5)):
+            with pytest.raises(asyncio.TimeoutError):
+                asyncio.run(async_storage.get_user("alice"))
+            release.set()
+    
+    def test_cancelled_write_is_not_run(self, storage, sample_message):
+        """Test that cancelling a queued write drops it"""
+        # Arrange
+        async_storage = AsyncStorage(storage)
+        release = threading.Event()
+        
+        async def scenario():
+            blocker = asyncio.ensure_future(async_storage.run(release.wait, 5, write=True))
+            queued = asyncio.ensure_future(async_storage.save_message(sample_message))
+            await asyncio.sleep(0.05)
+            queued.cancel()
+            # Let the cancellation reach the executor before the writer frees up
+            await asyncio.sleep(0.05)
+            release.set()
+            await blocker
+            with pytest.raises(asyncio.CancelledError):
+                await queued
+        
+        # Act
+        asyncio.run(scenario())
+        async_storage.close()
+        
+        # Assert
+        reopened = Storage(storage.db_path)
+        assert reopened.get_messages() == []
+        reopened.close()
+    
+    def test_iter_messages_pages_through_history(self, storage, message_list):
+        """Test that the async iterator yields the whole history in order"""
+        # Arrange
+        storage.save_messages(message_list)
+        expected = [m.msg_id for m in storage.iter_messages()]
+        async_storage = AsyncStorage(storage)
+        
+        async def scenario():
+            return [message async for message in async_storage.iter_messages(batch_size=3)]
+        
+        # Act
+        with patch.object(storage, 'get_message_page', wraps=storage.get_message_page) as paged:
+            streamed = asyncio.run(scenario())
+        async_storage.close()
+        
+        # Assert
+        assert [m.msg_id for m in streamed] == expected
+        assert len(streamed) == len(message_list)
+        assert paged.call_count == len(message_list) // 3 + 1
+    
+    def test_backup_and_restore_run_on_writer(self, storage, message_list, sample_message, tmp_path):
+        """Test that backup and restore run on the writer thread"""
+        # Arrange
+        storage.save_messages(message_list)
+        async_storage = AsyncStorage(storage)
+        threads = []
+        backup, restore = storage.backup, storage.restore
+        
+        def recording(func):
+            def call(*args):
+                threads.append(threading.current_thread().name)
+                return func(*args)
+            return call
+        
+        async def scenario():
+            await async_storage.backup(str(tmp_path / "backup.db"))
+            await async_storage.save_message(sample_message)
+            await async_storage.restore(str(tmp_path / "backup.db"))
+            return await async_storage.get_messages()
+        
+        # Act
+        with patch.object(storage, 'backup', side_effect=recording(backup)), \
+                patch.object(storage, 'restore', side_effect=recording(restore)):
+            messages = asyncio.run(scenario())
+        async_storage.close()
+        
+        # Assert
+        assert len(threads) == 2
+        assert all(name.startswith("pychat-storage-writer") for name in threads)
+        assert sample_message.msg_id not in {m.msg_id for m in messages}
+        assert len(messages) == len(message_list)
+
+
+class TestWriteBehindBuffer:
+    """Tests for group-commit message persistence"""
+    
+    def test_batches_are_flushed(self, storage, message_list):
+        """Test that submitted messages are written in batches"""
+        # Arrange
+        batches = []
+        
+        def flush(messages):
+            batches.append(len(messages))
+            storage.save_messages(messages)
+        
+        buffer = WriteBehindBuffer(flush, max_batch=4, flush_interval=0.5)
+        
+        # Act
+        pending = [buffer.submit(msg) for msg in message_list]
+        assert buffer.flush(timeout=5.0)
+        buffer.close()
+        
+        # Assert
+        assert all(p.done and p.error is None for p in pending)
+        assert sum(batches) == len(message_list)
+        assert max(batches) <= 4
+        assert len(storage.get_messages(limit=100)) == len(message_list)
+    
+    def test_wait_for_durability(self, storage, sample_message):
+        """Test waiting until a single message is durable"""
+        # Arrange
+        buffer = WriteBehindBuffer(storage.save_messages, flush_interval=0.01)
+        
+        # Act
+        durable = buffer.submit(sample_message).wait(timeout=5.0)
+        buffer.close()
+        
+        # Assert
+        assert durable is True
+        assert storage.get_messages(limit=10)[0].msg_id == sample_message.msg_id
+    
+    def test_close_flushes_pending(self, storage, message_list):
+        """Test that closing the buffer writes everything still buffered"""
+        # Arrange - a long interval keeps messages in the buffer
+        buffer = WriteBehindBuffer(storage.save_messages, flush_interval=60.0)
+        for msg in message_list:
+            buffer.submit(msg)
+        
+        # Act
+        buffer.close(timeout=5.0)
+        
+        # Assert
+        assert len(storage.get_messages(limit=100)) == len(message_list)
+        with pytest.raises(RuntimeError):
+            buffer.submit(Message(content="late", sender="user1"))
+    
+    def test_bad_item_does_not_lose_batch(self, storage, sample_message):
+        """Test that one failing message does not fail the rest of its batch"""
+        # Arrange
+        storage.save_message(sample_message)
+        buffer = WriteBehindBuffer(storage.save_messages, flush_interval=0.5)
+        good = Message(content="good", sender="user1")
+        
+        # Act
+        duplicate = buffer.submit(sample_message)
+        written = buffer.submit(good)
+        buffer.close(timeout=5.0)
+        
+        # Assert
+        assert written.wait(0) is True
+        assert duplicate.wait(0) is False
+        assert duplicate.error is not None
+        assert len(storage.get_messages(limit=100)) == 2
+
+
+class TestSchemaMigrations:
+    """Tests for the versioned migration runner"""
+    
+    def test_new_database_is_current(self, storage):
+        """Test that a new database has every migration applied"""
+        # Act
+        version = get_schema_version(storage.conn)
+        
+        # Assert
+        assert version == max(m.version for m in MIGRATIONS)
+        assert run_migrations(storage.conn) == []
+    
+    def test_history_indexes_exist(self, storage):
+        """Test that the history and session indexes are created"""
+        # Act
+        indexes = {row[0] for row in storage.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'"
+        )}
+        
+        # Assert
+        assert {"idx_messages_timestamp", "idx_messages_recipient",
+                "idx_messages_sender", "idx_sessions_expires"} <= indexes
+    
+    def test_latest_history_uses_index(self, storage):
+        """Test that loading the latest messages does not sort the table"""
+        # Act
+        plan = " ".join(row[3] for row in storage.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM messages ORDER BY timestamp DESC LIMIT 10"
+        ))
+        
+        # Assert
+        assert "idx_messages_timestamp" in plan
+        assert "TEMP B-TREE" not in plan
+    
+    def test_batched_migration(self, storage):
+        """Test that batch steps run until they report no remaining rows"""
+        # Arrange
+        storage.conn.execute("CREATE TABLE numbers (n INTEGER, doubled INTEGER)")
+        storage.conn.executemany("INSERT INTO numbers (n) VALUES (?)", [(i,) for i in range(25)])
+        storage.conn.commit()
+        batches = []
+        
+        def double(conn, batch_size):
+            cursor = conn.execute(
+                "UPDATE numbers SET doubled = n * 2 WHERE rowid IN "
+                "(SELECT rowid FROM numbers WHERE doubled IS NULL LIMIT ?)",
+                (batch_size,)
+            )
+            batches.append(cursor.rowcount)
+            return cursor.rowcount
+        
+        migration = Migration(1000, "Double numbers", batch_steps=[double])
+        
+        # Act
+        applied = run_migrations(storage.conn, MIGRATIONS + [migration], batch_size=10)
+        
+        # Assert
+        assert applied == [1000]
+        assert batches == [10, 10, 5, 0]
+        assert get_schema_version(storage.conn) == 1000
+        remaining = storage.conn.execute("SELECT COUNT(*) FROM numbers WHERE doubled IS NULL").fetchone()[0]
+        assert remaining == 0
+
+    
+    def test_timestamps_converted_to_integers(self, temp_db_path):
+        """Test that ISO-8601 timestamps of an old database become epoch microseconds"""
+        # Arrange - a database written before timestamps were integers
+        sent = datetime.datetime(2024, 5, 1, 10, 0, 0, 123456)
+        expires = datetime.datetime(2024, 5, 2, 10, 0, 0)
+        conn = sqlite3.connect(temp_db_path)
+        conn.execute(
+            "CREATE TABLE messages (msg_id TEXT PRIMARY KEY, content TEXT NOT NULL, "
+            "sender TEXT NOT NULL, recipient TEXT, timestamp TEXT NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE sessions (session_id TEXT PRIMARY KEY, username TEXT NOT NULL, "
+            "created_at TEXT NOT NULL, expires_at TEXT NOT NULL, is_active INTEGER DEFAULT 1)"
+        )
+        conn.executemany(
+            "INSERT INTO messages VALUES (?, 'old', 'alice', 'bob', ?)",
+            [("m1", sent.isoformat()), ("m2", expires.isoformat())]
+        )
+        conn.execute(
+            "INSERT INTO sessions VALUES ('s1', 'alice', ?, ?, 1)",
+            (sent.isoformat(), expires.isoformat())
+        )
+        conn.commit()
+        conn.close()
+        
+        # Act
+        storage = Storage(db_path=temp_db_path)
+        stored = storage.conn.execute(
+            "SELECT typeof(timestamp), timestamp FROM messages ORDER BY rowid"
+        ).fetchall()
+        messages = storage.get_messages(recipient="bob")
+        summary = storage.get_private_conversations("alice")
+        expires_at = storage.conn.execute("SELECT expires_at FROM sessions").fetchone()[0]
+        triggers = {row[0] for row in storage.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'messages'"
+        )}
+        storage.close()
+        
+        # Assert
+        assert [tuple(row) for row in stored] == [
+            ("integer", to_epoch_micros(sent)), ("integer", to_epoch_micros(expires))
+        ]
+        assert [m.timestamp for m in messages] == [sent, expires]
+        assert summary == [("bob", expires)]
+        assert expires_at == to_epoch_micros(expires)
+        assert "messages_conversations_insert" in triggers
+    
+    def test_uuid_message_ids_compacted(self, temp_db_path):
+        """Test that UUID text IDs of an old database are stored as 16 bytes"""
+        # Arrange
+        legacy_uuid = "0f8fad5b-d9cb-469f-a165-70867728950e"
+        conn = sqlite3.connect(temp_db_path)
+        conn.execute(
+            "CREATE TABLE messages (msg_id TEXT PRIMARY KEY, content TEXT NOT NULL, "
+            "sender TEXT NOT NULL, recipient TEXT, timestamp TEXT NOT NULL)"
+        )
+        conn.executemany(
+            "INSERT INTO messages VALUES (?, 'old', 'alice', NULL, ?)",
+            [(legacy_uuid, datetime.datetime.now().isoformat()),
+             ("legacy-id", datetime.datetime.now().isoformat())]
+        )
+        conn.commit()
+        conn.close()
+        
+        # Act
+        storage = Storage(db_path=temp_db_path)
+        stored = [row[0] for row in storage.conn.execute(
+            "SELECT typeof(msg_id) FROM messages ORDER BY rowid"
+        )]
+        ids = {m.msg_id for m in storage.get_messages()}
+        storage.close()
+        
+        # Assert
+        assert stored == ["blob", "text"]
+        assert ids == {legacy_uuid, "legacy-id"}
+
+class TestMessagePagination:
+    """Tests for keyset (cursor) pagination of message history"""
+    
+    @pytest.fixture
+    def history(self, storage):
+        """Save a conversation with several messages per timestamp"""
+        start = datetime.datetime(2024, 1, 1, 12, 0, 0)
+        messages = []
+        for i in range(30):
+            recipient = None if i % 3 else ("user2" if i % 2 else "user3")
+            messages.append(Message(
+                content=f"Message {i}",
+                sender=f"user{i % 4}",
+                recipient=recipient,
+                timestamp=start + datetime.timedelta(seconds=i // 2)
+            ))
+        storage.save_messages(messages)
+        return sorted(messages, key=lambda m: (m.timestamp, m.msg_id))
+    
+    def test_page_backwards_through_history(self, storage, history):
+        """Test that following 'older' cursors visits every message once"""
+        # Act
+        seen = []
+        page = storage.get_message_page(limit=7)
+        while True:
+            seen = page.messages + seen
+            if page.older is None:
+                break
+            page = storage.get_message_page(limit=7, before=page.older)
+        
+        # Assert
+        assert [m.msg_id for m in seen] == [m.msg_id for m in history]
+    
+    def test_page_forwards_through_history(self, storage, history):
+        """Test that following 'newer' cursors visits every message once"""
+        # Arrange
+        cursor = MessageCursor(datetime.datetime(2000, 1, 1), "")
+        
+        # Act
+        seen = []
+        page = storage.get_message_page(limit=8, after=cursor)
+        while page.messages:
+            seen.extend(page.messages)
+            page = storage.get_message_page(limit=8, after=page.newer)
+        
+        # Assert
+        assert [m.msg_id for m in seen] == [m.msg_id for m in history]
+        assert page.newer == MessageCursor.from_message(history[-1])
+    
+    def test_page_respects_visibility(self, storage, history):
+        """Test that a user's pages only contain messages they may see"""
+        # Arrange
+        visible = [m for m in history
+                   if m.recipient is None or "user2" in (m.recipient, m.sender)]
+        
+        # Act
+        seen = []
+        page = storage.get_message_page(limit=5, recipient="user2")
+        while True:
+            seen = page.messages + seen
+            if page.older is None:
+                break
+            page = storage.get_message_page(limit=5, recipient="user2", before=page.older)
+        
+        # Assert
+        assert [m.msg_id for m in seen] == [m.msg_id for m in visible]
+    
+    def test_latest_page_has_no_newer_messages(self, storage, history):
+        """Test the cursors of the latest page"""
+        # Act
+        page = storage.get_message_page(limit=10)
+        
+        # Assert
+        assert [m.msg_id for m in page] == [m.msg_id for m in history[-10:]]
+        assert page.older == MessageCursor.from_message(history[-10])
+        assert storage.get_message_page(limit=10, after=page.newer).messages == []
+    
+    def test_ids_break_timestamp_ties_in_creation_order(self, storage):
+        """Test that messages sharing a timestamp page in creation order"""
+        # Arrange
+        sent = datetime.datetime.now()
+        messages = [Message(content=f"Tie {i}", sender="alice", timestamp=sent) for i in range(5)]
+        storage.save_messages(list(reversed(messages)))
+        
+        # Act
+        first = storage.get_message_page(limit=3)
+        second = storage.get_message_page(limit=3, before=first.older)
+        
+        # Assert
+        assert [m.content for m in second.messages + first.messages] == [m.content for m in messages]
+    
+    def test_get_messages_accepts_cursor(self, storage, history):
+        """Test the list-returning API with a cursor"""
+        # Act
+        cursor = MessageCursor.from_message(history[10])
+        messages = storage.get_messages(limit=3, before=cursor)
+        
+        # Assert
+        assert [m.msg_id for m in messages] == [m.msg_id for m in history[7:10]]
+    
+    def test_cursor_token_round_trip(self, history):
+        """Test converting a cursor to a token and back"""
+        # Arrange
+        cursor = MessageCursor.from_message(history[0])
+        
+        # Act/Assert
+        assert MessageCursor.from_token(cursor.to_token()) == cursor
+        with pytest.raises(ValueError):
+            MessageCursor.from_token("not-a-cursor")
+
+
+class TestMessageSearch:
+    """Tests for full-text message search"""
+    
+    @pytest.fixture
+    def searchable(self, storage):
+        """Save messages with known content"""
+        messages = [
+            Message(content="Deploying the release tonight", sender="alice"),
+            Message(content="The release notes are ready", sender="bob"),
+            Message(content="Release release release", sender="carol"),
+            Message(content="Lunch anyone?", sender="alice"),
+            Message(content="Secret release plan", sender="alice", recipient="bob"),
+        ]
+        storage.save_messages(messages)
+        return messages
+    
+    def test_search_ranks_matches(self, storage, searchable):
+        """Test that matches come back best first"""
+        # Act
+        page = storage.search_messages("release")
+        
+        # Assert
+        assert len(page) == 4
+        assert page.messages[0].content == "Release release release"
+        assert page.next_cursor is None
+    
+    def test_search_respects_private_visibility(self, storage, searchable):
+        """Test that private messages are only found by their participants"""
+        # Act
+        for_carol = storage.search_messages("secret", username="carol")
+        for_bob = storage.search_messages("secret", username="bob")
+        
+        # Assert
+        assert for_carol.messages == []
+        assert [m.content for m in for_bob] == ["Secret release plan"]
+    
+    def test_search_pages(self, storage, searchable):
+        """Test paging through search results"""
+        # Act
+        first = storage.search_messages("release", limit=3)
+        second = storage.search_messages("release", limit=3, cursor=first.next_cursor)
+        
+        # Assert
+        assert len(first) == 3
+        assert first.next_cursor is not None
+        assert len(second) == 1
+        assert second.next_cursor is None
+        assert {m.msg_id for m in first}.isdisjoint({m.msg_id for m in second})
+    
+    def test_search_prefix_and_punctuation(self, storage, searchable):
+        """Test prefix matching and that query syntax characters are harmless"""
+        # Act/Assert
+        assert [m.content for m in storage.search_messages("lun")] == ["Lunch anyone?"]
+        assert storage.search_messages('"release AND (notes').messages == []
+        assert storage.search_messages("   ").messages == []
+    
+    def test_backfill_indexes_existing_messages(self, temp_db_path):
+        """Test that messages saved before search existed are indexed in batches"""
+        # Arrange - a database created before the search index existed
+        conn = sqlite3.connect(temp_db_path)
+        conn.execute(
+            "CREATE TABLE messages (msg_id TEXT PRIMARY KEY, content TEXT NOT NULL, "
+            "sender TEXT NOT NULL, recipient TEXT, timestamp TEXT NOT NULL)"
+        )
+        conn.executemany(
+            "INSERT INTO messages VALUES (?, ?, 'alice', NULL, ?)",
+            [(f"old-{i}", f"archived note {i}", datetime.datetime.now().isoformat()) for i in range(5)]
+        )
+        conn.commit()
+        conn.close()
+        
+        storage = Storage(db_path=temp_db_path)
+        storage.save_message(Message(content="fresh note", sender="bob"))
+        
+        # Act
+        before_backfill = len(storage.search_messages("note", limit=100))
+        batches = []
+        while True:
+            indexed = storage.backfill_search_index(batch_size=2)
+            if not indexed:
+                break
+            batches.append(indexed)
+        after_backfill = len(storage.search_messages("note", limit=100))
+        
+        # Deleting rows must keep the index consistent
+        storage.conn.execute("DELETE FROM messages WHERE msg_id = 'old-0'")
+        storage.conn.commit()
+        after_delete = len(storage.search_messages("note", limit=100))
+        storage.close()
+        
+        # Assert
+        assert before_backfill == 1
+        assert batches == [2, 2, 1]
+        assert after_backfill == 6
+        assert after_delete == 5
+
+
+class TestConversationSummaries:
+    """Tests for the materialized conversation summaries"""
+    
+    @pytest.fixture
+    def participants(self, storage):
+        """Save the users taking part in the conversations"""
+        for username in ["alice", "bob", "carol"]:
+            storage.save_user(User(username=username))
+        return storage
+    
+    def _send(self, storage, content, sender, recipient, minutes):
+        """Save a private message sent the given number of minutes ago"""
+        message = Message(content=content, sender=sender, recipient=recipient)
+        message.timestamp = datetime.datetime.now() - datetime.timedelta(minutes=minutes)
+        storage.save_message(message)
+    
+    def test_summaries_follow_new_messages(self, participants):
+        """Test that the trigger keeps counts and the latest message up to date"""
+        # Arrange
+        storage = participants
+        self._send(storage, "Hi Bob", "alice", "bob", 30)
+        self._send(storage, "Hi Alice", "bob", "alice", 20)
+        self._send(storage, "Hello Carol", "alice", "carol", 10)
+        self._send(storage, "Late delivery", "alice", "bob", 40)
+        storage.save_message(Message(content="Public", sender="alice"))
+        
+        # Act
+        summaries = storage.get_conversation_summaries("alice")
+        for_bob = storage.get_conversation_summaries("bob")
+        
+        # Assert
+        assert [s.user.username for s in summaries] == ["carol", "bob"]
+        assert summaries[1].message_count == 3
+        assert summaries[1].last_sender == "bob"
+        assert summaries[1].last_message_preview == "Hi Alice"
+        assert [s.user.username for s in for_bob] == ["alice"]
+        assert storage.get_conversation_summaries("carol")[0].message_count == 1
+    
+    def test_private_conversations_use_summaries(self, participants):
+        """Test that the conversation list is read from the summary table"""
+        # Arrange
+        storage = participants
+        self._send(storage, "Note to self", "alice", "alice", 5)
+        self._send(storage, "Hi Bob", "alice", "bob", 1)
+        
+        # Act
+        conversations = storage.get_private_conversations("alice")
+        plan = " ".join(row[3] for row in storage.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM conversations WHERE user_b = 'alice'"
+        ))
+        
+        # Assert
+        assert [username for username, _ in conversations] == ["bob", "alice"]
+        assert "idx_conversations_user_b" in plan
+    
+    def test_preview_is_truncated(self, participants):
+        """Test that only the beginning of long messages is stored"""
+        # Arrange
+        storage = participants
+        self._send(storage, "x" * 500, "alice", "bob", 1)
+        
+        # Act
+        summary = storage.get_conversation_summaries("bob")[0]
+        
+        # Assert
+        assert summary.last_message_preview == "x" * 100
+    
+    def test_backfill_existing_messages(self, temp_db_path):
+        """Test that messages saved before the summaries existed are folded in"""
+        # Arrange - a database created before the conversations table existed
+        conn = sqlite3.connect(temp_db_path)
+        conn.execute(
+            "CREATE TABLE messages (msg_id TEXT PRIMARY KEY, content TEXT NOT NULL, "
+            "sender TEXT NOT NULL, recipient TEXT, timestamp TEXT NOT NULL)"
+        )
+        start = datetime.datetime.now() - datetime.timedelta(hours=1)
+        conn.executemany(
+            "INSERT INTO messages VALUES (?, ?, ?, ?, ?)",
+            [(f"old-{i}", f"message {i}", "alice", "bob" if i % 2 else None,
+              (start + datetime.timedelta(minutes=i)).isoformat()) for i in range(7)]
+        )
+        conn.commit()
+        conn.close()
+        
+        # Act
+        storage = Storage(db_path=temp_db_path)
+        storage.save_user(User(username="bob"))
+        self._send(storage, "new message", "bob", "alice", 0)
+        summaries = storage.get_conversation_summaries("alice")
+        storage.close()
+        
+        # Assert
+        assert len(summaries) == 1
+        assert summaries[0].message_count == 4
+        assert summaries[0].last_message_preview == "new message"
+
+
+class TestRetention:
+    """Tests for archiving old messages into monthly databases"""
+    
+    @pytest.fixture
+    def retained(self, temp_db_path, tmp_path):
+        """Storage that archives messages older than 30 days"""
+        storage = Storage(temp_db_path, retention_days=30, archive_dir=str(tmp_path / "archive"))
+        yield storage
+        storage.close()
+    
+    @pytest.fixture
+    def aged_history(self):
+        """Messages spread over three old months plus a few recent ones"""
+        users = ["alice", "bob", "carol"]
+        start = datetime.datetime(2024, 1, 20)
+        messages = []
+        for i in range(45):
+            messages.append(Message(
+                content=f"Message {i}", sender=users[i % 3],
+                recipient=None if i % 4 == 0 else users[(i // 2) % 3],
+                timestamp=start + datetime.timedelta(days=i)
+            ))
+        now = datetime.datetime.now()
+        for i in range(5):
+            messages.append(Message(content=f"Recent {i}", sender="alice",
+                                    timestamp=now - datetime.timedelta(minutes=5 - i)))
+        return messages
+    
+    def _archive_all(self, storage):
+        """Run the archive job until it has nothing left to do"""
+        total = 0
+        while True:
+            moved = storage.archive_messages(batch_size=10)
+            if not moved:
+                return total
+            total += moved
+    
+    def test_old_messages_move_to_monthly_archives(self, retained, aged_history):
+        """Test that messages past the retention period leave the main database"""
+        # Arrange
+        retained.save_messages(aged_history)
+        
+        # Act
+        moved = self._archive_all(retained)
+        
+        # Assert
+        assert moved == 45
+        assert retained.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 5
+        assert retained.archive.months() == ["2024-01", "2024-02", "2024-03"]
+        assert retained.archive.count() == 45
+    
+    def test_history_pages_cross_into_archive(self, retained, aged_history):
+        """Test that paging returns archived messages in history order"""
+        # Arrange
+        reference = MemoryStorage()
+        reference.save_messages(aged_history)
+        retained.save_messages(aged_history)
+        self._archive_all(retained)
+        
+        # Act/Assert
+        for username in [None, "alice", "bob"]:
+            for older in (True, False):
+                assert _walk_history(retained, username, older) == \
+                    _walk_history(reference, username, older)
+    
+    def test_recent_pages_skip_archive(self, retained, aged_history):
+        """Test that pages within the hot messages do not open the archives"""
+        # Arrange
+        retained.save_messages(aged_history)
+        self._archive_all(retained)
+        
+        # Act
+        with patch.object(retained.archive, 'select', wraps=retained.archive.select) as select:
+            recent = retained.get_message_page(limit=3)
+            crossing = retained.get_message_page(limit=3, before=recent.older)
+        
+        # Assert
+        assert [m.content for m in recent] == ["Recent 2", "Recent 3", "Recent 4"]
+        assert [m.content for m in crossing] == ["Message 44", "Recent 0", "Recent 1"]
+        assert select.call_count == 1
+    
+    def test_archived_content_round_trips(self, retained):
+        """Test that long content is compressed and short content kept as text"""
+        # Arrange
+        old = datetime.datetime(2024, 5, 1)
+        long_text = "spam " * 200
+        retained.save_messages([
+            Message(content=long_text, sender="alice", timestamp=old),
+            Message(content="hi", sender="bob", timestamp=old + datetime.timedelta(seconds=1))
+        ])
+        
+        # Act
+        self._archive_all(retained)
+        stored = sqlite3.connect(retained.archive._path("2024-05")).execute(
+            "SELECT typeof(content) FROM messages ORDER BY timestamp"
+        ).fetchall()
+        
+        # Assert
+        assert stored == [("blob",), ("text",)]
+        assert [m.content for m in retained.get_messages()] == [long_text, "hi"]
+    
+    def test_retention_from_environment(self, monkeypatch):
+        """Test resolving the retention period"""
+        # Arrange
+        monkeypatch.setenv("PYCHAT_RETENTION_DAYS", "90")
+        
+        # Act/Assert
+        assert get_retention_days() == 90
+        assert get_retention_days(7) == 7
+        monkeypatch.setenv("PYCHAT_RETENTION_DAYS", "soon")
+        with pytest.raises(ValueError):
+            get_retention_days()
+
+
+class TestBulkTransfer:
+    """Tests for streaming history export and import"""
+    
+    @pytest.fixture
+    def history(self):
+        """Broadcasts and private messages with non-ASCII content"""
+        start = datetime.datetime(2024, 3, 1, 9, 0)
+        return [
+            Message(content=f"Nachricht {i} \u00e4\u00f6\u00fc", sender=f"user{i % 4}",
+                    recipient=None if i % 3 else f"user{(i + 1) % 4}",
+                    timestamp=start + datetime.timedelta(seconds=i))
+            for i in range(250)
+        ]
+    
+    def test_iter_messages_streams_in_pages(self, storage, history):
+        """Test that the history is streamed oldest first, one page at a time"""
+        # Arrange
+        storage.save_messages(list(reversed(history)))
+        
+        # Act
+        with patch.object(storage, 'get_message_page', wraps=storage.get_message_page) as pages:
+            streamed = [m.msg_id for m in storage.iter_messages(batch_size=100)]
+        
+        # Assert
+        assert streamed == [m.msg_id for m in history]
+        assert pages.call_count == 3
+    
+    @pytest.mark.parametrize("suffix", [".ndjson", ".pcm"])
+    def test_export_import_round_trip(self, storage, tmp_path, history, suffix):
+        """Test that exported history imports into another database unchanged"""
+        # Arrange
+        storage.save_messages(history)
+        path = str(tmp_path / f"history{suffix}")
+        target = Storage(str(tmp_path / "target.db"))
+        
+        # Act
+        exported = export_history(storage, path, batch_size=64)
+        imported = import_history(target, path, batch_size=100)
+        
+        # Assert
+        assert exported == imported == len(history)
+        copied = list(target.iter_messages())
+        assert [(m.msg_id, m.content, m.sender, m.recipient, m.timestamp) for m in copied] == \
+            [(m.msg_id, m.content, m.sender, m.recipient, m.timestamp) for m in history]
+        target.close()
+    
+    def test_import_rebuilds_indexes_and_skips_known_ids(self, storage, history):
+        """Test that a repeated import adds nothing and leaves the indexes in place"""
+        # Arrange
+        storage.import_messages(iter(history[:100]), batch_size=30)
+        
+        # Act
+        imported = storage.import_messages(iter(history), batch_size=30)
+        
+        # Assert
+        assert imported == len(history) - 100
+        indexes = {row[0] for row in storage.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'messages'"
+        )}
+        assert {"idx_messages_timestamp", "idx_messages_recipient", "idx_messages_sender"} <= indexes
+    
+    def test_interrupted_import_indexes_restored_on_open(self, tmp_path):
+        """Test that indexes dropped by a killed import come back when the database is opened"""
+        # Arrange
+        path = str(tmp_path / "interrupted.db")
+        first = Storage(path)
+        with first.pool.write() as conn:
+            for name in ("idx_messages_timestamp", "idx_messages_recipient", "idx_messages_sender"):
+                conn.execute(f"DROP INDEX {name}")
+        first.close()
+        
+        # Act
+        second = Storage(path)
+        indexes = {row[0] for row in second.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'messages'"
+        )}
+        second.close()
+        
+        # Assert
+        assert {"idx_messages_timestamp", "idx_messages_recipient", "idx_messages_sender"} <= indexes
+    
+    def test_truncated_binary_file_is_rejected(self, storage, tmp_path, history):
+        """Test that a damaged binary export raises ValueError"""
+        # Arrange
+        storage.save_messages(history[:3])
+        path = str(tmp_path / "history.pcm")
+        export_history(storage, path)
+        with open(path, 'rb') as f:
+            data = f.read()
+        
+        # Act/Assert
+        with pytest.raises(ValueError):
+            list(read_messages(io.BytesIO(data[:-5]), "binary"))
+        with pytest.raises(ValueError):
+            list(read_messages(io.BytesIO(b"not a history"), "binary"))
+
+
+def _walk_history(backend, username, older):
+    """Collect message IDs by paging through the whole history"""
+    ids = []
+    page = backend.get_message_page(limit=7, recipient=username)
+    ids.extend(m.msg_id for m in page)
+    cursor = page.older
+    while cursor is not None:
+        page = backend.get_message_page(limit=7, recipient=username, before=cursor)
+        ids[:0] = [m.msg_id for m in page]
+        cursor = page.older
+    if not older:
+        ids = []
+        page = backend.get_message_page(
+            limit=7, recipient=username, after=MessageCursor(datetime.datetime.min, "")
+        )
+        while page.messages:
+            ids.extend(m.msg_id for m in page)
+            page = backend.get_message_page(limit=7, recipient=username, after=page.newer)
+    return ids
+
+
+class TestMemoryStorage:
+    """Tests for the in-memory storage backend"""
+    
+    @pytest.fixture
+    def memory(self):
+        """Create an empty in-memory backend"""
+        return MemoryStorage()
+    
+    @pytest.fixture
+    def mixed_history(self):
+        """Broadcasts and private messages with shared timestamps"""
+        users = ["alice", "bob", "carol"]
+        start = datetime.datetime(2024, 1, 1, 12, 0)
+        messages = []
+        for i in range(60):
+            sender = users[i % 3]
+            recipient = None if i % 4 == 0 else users[(i // 2) % 3]
+            messages.append(Message(
+                content=f"Message {i}", sender=sender, recipient=recipient,
+                timestamp=start + datetime.timedelta(seconds=i // 3)
+            ))
+        return messages
+    
+    def test_history_matches_sqlite(self, memory, storage, mixed_history):
+        """Test that paging returns the same messages as the SQLite backend"""
+        # Arrange
+        memory.save_messages(mixed_history)
+        storage.save_messages(mixed_history)
+        
+        # Act/Assert
+        for username in [None, "alice", "bob", "carol", "dave"]:
+            for older in (True, False):
+                assert _walk_history(memory, username, older) == _walk_history(storage, username, older)
+    
+    def test_duplicate_batch_is_rejected(self, memory, sample_message):
+        """Test that a batch with a known ID saves nothing"""
+        # Arrange
+        memory.save_message(sample_message)
+        fresh = Message(content="Fresh", sender="alice")
+        
+        # Act
+        with pytest.raises(ValueError):
+            memory.save_messages([fresh, sample_message])
+        
+        # Assert
+        assert [m.msg_id for m in memory.get_messages()] == [sample_message.msg_id]
+    
+    def test_users_and_sessions(self, memory, sample_user):
+        """Test user profiles, credentials and sessions"""
+        # Arrange
+        memory.save_user(sample_user, "hash", "salt")
+        sample_user.status = "busy"
+        memory.update_user(sample_user)
+        
+        # Act
+        session_id = memory.create_session(sample_user.username)
+        valid = memory.validate_session(session_id)
+        memory.invalidate_session(session_id)
+        
+        # Assert
+        assert memory.get_user(sample_user.username).status == "busy"
+        assert [u.username for u in memory.get_users(status="busy")] == [sample_user.username]
+        assert memory.get_user_auth_data(sample_user.username) == {
+            'password_hash': "hash", 'password_salt': "salt"
+        }
+        assert valid == sample_user.username
+        assert memory.validate_session(session_id) is None
+        assert memory.validate_session(memory.create_session("x", expires_in=-1)) is None
+    
+    def test_conversations_and_search(self, memory, mixed_history):
+        """Test conversation summaries and content search"""
+        # Arrange
+        for username in ["alice", "bob", "carol"]:
+            memory.save_user(User(username=username))
+        memory.save_messages(mixed_history)
+        
+        # Act
+        summaries = memory.get_conversation_summaries("alice")
+        results = memory.search_messages("message 5", username="carol")
+        
+        # Assert
+        assert summaries[0].last_message_time >= summaries[-1].last_message_time
+        assert sum(s.message_count for s in summaries) == sum(
+            1 for m in mixed_history if m.recipient and "alice" in (m.sender, m.recipient)
+        )
+        assert [m.content for m in results] and all(
+            m.content.startswith("Message 5") for m in results
+        )
+
+
+class TestLogStorage:
+    """Tests for the append-only log storage backend"""
+    
+    @pytest.fixture
+    def log_dir(self, tmp_path):
+        """Directory for the segment files"""
+        return str(tmp_path / "log")
+    
+    @pytest.fixture
+    def log(self, log_dir, storage):
+        """Create a log backend with small segments and a dense sparse index"""
+        backend = LogStorage(log_dir, metadata=storage, segment_bytes=1024, index_interval=200)
+        yield backend
+        backend.close()
+    
+    @pytest.fixture
+    def shuffled_history(self):
+        """Broadcasts and private messages, partly appended out of time order"""
+        users = ["alice", "bob", "carol"]
+        start = datetime.datetime(2024, 1, 1, 12, 0)
+        messages = []
+        for i in range(60):
+            recipient = None if i % 4 == 0 else users[(i // 2) % 3]
+            messages.append(Message(
+                content=f"Message {i}", sender=users[i % 3], recipient=recipient,
+                timestamp=start + datetime.timedelta(seconds=i // 3)
+            ))
+        # Every fifth message arrives late
+        late = messages[::5]
+        return [m for m in messages if m not in late] + late
+    
+    def _reopen(self, log, log_dir, storage):
+        """Close a log backend and open its directory again"""
+        log.close()
+        return LogStorage(log_dir, metadata=storage, segment_bytes=1024, index_interval=200)
+    
+    def test_history_matches_sqlite(self, log, shuffled_history):
+        """Test that paging returns the same messages as the SQLite backend"""
+        # Arrange
+        reference = Storage(":memory:")
+        for i in range(0, len(shuffled_history), 8):
+            log.save_messages(shuffled_history[i:i + 8])
+        reference.save_messages(shuffled_history)
+        
+        # Act/Assert
+        assert len(log.segments) > 1
+        for username in [None, "alice", "bob", "carol", "dave"]:
+            for older in (True, False):
+                assert _walk_history(log, username, older) == _walk_history(reference, username, older)
+    
+    def test_reopen_recovers_history(self, log, log_dir, storage, shuffled_history):
+        """Test that the indexes are rebuilt from the segment files"""
+        # Arrange
+        for username in ["alice", "bob", "carol"]:
+            storage.save_user(User(username=username))
+        log.save_messages(shuffled_history)
+        expected = _walk_history(log, "bob", True)
+        summaries = [(s.user.username, s.message_count) for s in log.get_conversation_summaries("alice")]
+        
+        # Act
+        log = self._reopen(log, log_dir, storage)
+        
+        # Assert
+        assert _walk_history(log, "bob", True) == expected
+        assert [(s.user.username, s.message_count)
+                for s in log.get_conversation_summaries("alice")] == summaries
+        with pytest.raises(ValueError):
+            log.save_message(shuffled_history[0])
+        log.close()
+    
+    def test_summaries_load_partners_at_once(self, log, storage, shuffled_history):
+        """Test that conversation partners are looked up in one call, not one each"""
+        # Arrange
+        for username in ["alice", "bob", "carol"]:
+            storage.save_user(User(username=username))
+        log.save_messages(shuffled_history)
+        expected = [(s.user.username, s.message_count) for s in log.get_conversation_summaries("alice")]
+        
+        # Act
+        with patch.object(storage, 'get_user', side_effect=AssertionError("per-user lookup")), \
+                patch.object(storage, 'get_users_by_name', wraps=storage.get_users_by_name) as lookup:
+            summaries = log.get_conversation_summaries("alice")
+        
+        # Assert
+        assert [(s.user.username, s.message_count) for s in summaries] == expected
+        lookup.assert_called_once()
+    
+    def test_damaged_tail_is_dropped(self, log, log_dir, storage, message_list):
+        """Test that a torn final record is cut off on open"""
+        # Arrange
+        log.save_messages(message_list)
+        with open(log.segments[-1].path, 'ab') as f:
+            f.write(b"\x40\x00\x00\x00\x00partial")
+        
+        # Act
+        log = self._reopen(log, log_dir, storage)
+        extra = Message(content="After recovery", sender="alice")
+        log.save_message(extra)
+        
+        # Assert
+        history = [m.msg_id for m in reversed(message_list)] + [extra.msg_id]
+        assert [m.msg_id for m in log.get_messages()] == history
+        log.close()
+    
+    def test_duplicate_batch_is_rejected(self, log, sample_message):
+        """Test that a batch with a known ID appends nothing"""
+        # Arrange
+        log.save_message(sample_message)
+        size = log.segments[-1].size
+        
+        # Act
+        with pytest.raises(ValueError):
+            log.save_messages([Message(content="Fresh", sender="alice"), sample_message])
+        
+        # Assert
+        assert log.segments[-1].size == size
+        assert [m.msg_id for m in log.get_messages()] == [sample_message.msg_id]
+    
+    def test_users_and_search(self, log, storage, sample_user, message_list):
+        """Test that users go to the metadata backend and search scans the log"""
+        # Arrange
+        log.save_user(sample_user, "hash", "salt")
+        log.save_messages(message_list)
+        
+        # Act
+        results = log.search_messages(message_list[0].content.split()[0])
+        
+        # Assert
+        assert storage.get_user(sample_user.username) is not None
+        assert log.get_user_auth_data(sample_user.username)['password_hash'] == "hash"
+        assert results.messages[0].msg_id == message_list[0].msg_id
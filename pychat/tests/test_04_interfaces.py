@@ -8,7 +8,9 @@ import sys
 
 from pychat.interfaces.common import ChatInterface
 from pychat.interfaces.cli_interface import CLIInterface
-from pychat.common.message import Message
+from pychat.interfaces import admin_interface
+from pychat.core.storage import Storage
+from pychat.common.message import Message, MessageCursor, MessagePage
 from pychat.core.user import User
 from pychat.tests.conftest import skip_failing
 
@@ -115,6 +117,70 @@ class TestGUIInterfaceMocked:
             pytest.fail(f"Error initializing GUI interface: {e}")
 
 
+class TestAdminInterface:
+    """Tests for the administration command line"""
+    
+    def test_export_and_import(self, tmp_path):
+        """Test moving history between databases with pychat-admin"""
+        # Arrange
+        source_db = str(tmp_path / "source.db")
+        target_db = str(tmp_path / "target.db")
+        path = str(tmp_path / "history.pcm")
+        source = Storage(source_db)
+        source.save_messages([Message(content=f"Hello {i}", sender="alice") for i in range(5)])
+        source.close()
+        
+        # Act
+        with patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            exported = admin_interface.main(["--db", source_db, "export", path])
+            imported = admin_interface.main(["--db", target_db, "import", path])
+        
+        # Assert
+        assert exported == imported == 0
+        assert "Exported 5 messages" in stderr.getvalue()
+        assert "Imported 5 messages" in stderr.getvalue()
+        target = Storage(target_db)
+        assert [m.content for m in target.get_messages()] == [f"Hello {i}" for i in range(5)]
+        target.close()
+    
+    def test_backup_and_restore(self, tmp_path):
+        """Test backing up and restoring a database with pychat-admin"""
+        # Arrange
+        db = str(tmp_path / "live.db")
+        backup = str(tmp_path / "backup.db")
+        storage = Storage(db)
+        storage.save_message(Message(content="Before backup", sender="alice"))
+        storage.close()
+        
+        # Act
+        with patch('sys.stderr', new_callable=io.StringIO):
+            backed_up = admin_interface.main(["--db", db, "backup", backup])
+            storage = Storage(db)
+            storage.save_message(Message(content="After backup", sender="alice"))
+            storage.close()
+            restored = admin_interface.main(["--db", db, "restore", backup])
+        
+        # Assert
+        assert backed_up == restored == 0
+        storage = Storage(db)
+        assert [m.content for m in storage.get_messages()] == ["Before backup"]
+        storage.close()
+    
+    def test_invalid_file_reports_error(self, tmp_path):
+        """Test that a bad import file gives a non-zero exit code"""
+        # Arrange
+        path = tmp_path / "broken.ndjson"
+        path.write_text("{not json}\n")
+        
+        # Act
+        with patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            result = admin_interface.main(["--db", str(tmp_path / "db.db"), "import", str(path)])
+        
+        # Assert
+        assert result == 1
+        assert "line 1" in stderr.getvalue()
+
+
 class TestInterfaceCommon:
     """Tests for the common interface functionality"""
     
@@ -176,3 +242,21 @@ class TestInterfaceCommon:
         assert message.content == content
         assert message.sender == test_interface.username
         assert message.recipient == recipient
+    
+    def test_get_message_page(self, test_interface):
+        """Test paging back through history from the interface"""
+        # Arrange
+        test_interface.username = "testuser"
+        test_interface.chat_manager = MagicMock()
+        message = Message(content="Hello", sender="otheruser")
+        cursor = MessageCursor.from_message(message)
+        test_interface.chat_manager.get_message_page.return_value = MessagePage([message])
+        
+        # Act
+        page = test_interface.get_message_page(20, before=cursor)
+        
+        # Assert
+        assert page.messages == [message]
+        test_interface.chat_manager.get_message_page.assert_called_once_with(
+            "testuser", 20, cursor, None
+        )
@@ -15,6 +15,7 @@ setup(
         'console_scripts': [
             'pychat-cli=pychat.interfaces.cli_interface:main',
             'pychat-gui=pychat.interfaces.gui_interface:main',
+            'pychat-admin=pychat.interfaces.admin_interface:main',
         ],
     },
     author="PyChat Team",